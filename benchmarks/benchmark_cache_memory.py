@@ -0,0 +1,65 @@
+import os
+import sys
+import gc
+import asyncio
+import argparse
+import tracemalloc
+
+#same as in bot_loader, so that scripts can be loaded directly from the source directory
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from utils.formatting import make_table_string
+
+from fake_discord_http import FakeDiscordHTTP
+from benchmark_command_tree import make_tree
+
+
+"""
+Offline comparison of the memory taken by the AppCommand cache of SmartCommandTree in the normal and in the compact mode.
+Every run gets a fresh bot with the given amount of synthetic guilds (see benchmark_command_tree.py next to this file),
+which is synced once with sync_all against a fake of Discord without any latency or ratelimits.
+Reported per mode: memory retained by the sync (measured with tracemalloc once the fake forgets its own commands,
+so this includes everything else the sync keeps, like the sync state and the mention index)
+and the size of the cache itself, as measured by SmartCommandTree.measure_cache_memory.
+
+Usage: python benchmarks/benchmark_cache_memory.py [--guilds 100 1000 10000]
+"""
+
+
+async def run_mode(guild_count: int, compact: bool) -> list:
+    """Syncs a fresh bot in the given cache mode and returns its row of results."""
+    http = FakeDiscordHTTP(latency=0.0, bucket_limit=10**9, global_limit=10**9)
+    (tree, _) = make_tree(guild_count, http)
+    tree.set_compact_cache(compact)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    await tree.sync_all()
+    http.commands.clear()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    sizes = await tree.measure_cache_memory()
+    return [
+        "compact" if compact else "full", sizes["commands"],
+        f"{retained/1024**2:.2f}", f"{sizes['total']/1024**2:.2f}", f"{sizes['records']/1024**2:.2f}", f"{sizes['payloads']/1024**2:.2f}"
+    ]
+
+
+async def main(args: argparse.Namespace) -> None:
+    for guild_count in args.guilds:
+        rows = [await run_mode(guild_count, compact) for compact in (False, True)]
+        print(f"{guild_count} guild(s):")
+        print(make_table_string(
+            rows,
+            headers=["Mode", "Cached commands", "Retained by sync (MiB)", "Cache (MiB)", "Records (MiB)", "Payloads (MiB)"],
+            string_quotes=""
+        ))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline comparison of the AppCommand cache modes of SmartCommandTree.")
+    parser.add_argument("--guilds", type=int, nargs="+", default=[100, 1000, 10000], help="amounts of synthetic guilds to sync")
+    asyncio.run(main(parser.parse_args()))
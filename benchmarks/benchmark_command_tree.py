@@ -0,0 +1,158 @@
+import discord
+from discord import app_commands
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tracemalloc
+
+#same as in bot_loader, so that scripts can be loaded directly from the source directory
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from smart_command_tree import SmartCommandTree
+from utils.formatting import make_table_string
+
+from fake_discord_http import FakeDiscordHTTP
+
+
+"""
+Offline benchmark of SmartCommandTree syncs, ran against a fake of Discord's app command routes (see fake_discord_http.py next to this file).
+Every scenario gets a fresh bot with the given amount of synthetic guilds and a typical set of commands:
+global slash commands, a group, a context menu, commands for all guilds and a few for the main guild.
+Reported per scenario: requests made, requests that hit a ratelimit, wall time and peak memory of the measured part.
+Waits are scaled down by --time-scale, so wall times are only comparable between runs with the same settings.
+
+Usage: python benchmarks/benchmark_command_tree.py [--guilds 1 100 2500] [--scenarios "sync_all (cold)" ...] [--latency 0.05] ...
+"""
+
+
+_FIRST_GUILD_ID = 100000000000000000
+_GLOBAL_COMMANDS = 20
+_ALL_GUILDS_COMMANDS = 5
+_MAIN_GUILD_COMMANDS = 3
+
+
+
+async def _slash_callback(interaction: discord.Interaction) -> None:
+    pass
+
+async def _user_callback(interaction: discord.Interaction, user: discord.User) -> None:
+    pass
+
+
+def make_tree(guild_count: int, http: FakeDiscordHTTP) -> tuple:
+    """Makes an offline client with the given amount of guilds and a SmartCommandTree with the benchmark commands.
+    Returns (tree, commands for all guilds)."""
+    client = discord.Client(intents=discord.Intents.none())
+    client.http = http
+    state = client._connection
+    state.application_id = http.application_id
+    for i in range(guild_count):
+        state._add_guild(discord.Guild(data={"id": str(_FIRST_GUILD_ID + i), "name": f"guild {i}"}, state=state))
+    tree = SmartCommandTree(client)
+    #retries of ratelimited requests are scaled just like the waits of the fake
+    tree.sync_retry_base_delay *= http.time_scale
+
+    for i in range(_GLOBAL_COMMANDS):
+        tree.add_command(app_commands.Command(name=f"global{i}", description=f"Global command {i}", callback=_slash_callback))
+    group = app_commands.Group(name="settings", description="Settings")
+    for name in ("show", "set", "reset"):
+        group.add_command(app_commands.Command(name=name, description=f"Settings {name}", callback=_slash_callback))
+    tree.add_command(group)
+    tree.add_command(app_commands.ContextMenu(name="Inspect", callback=_user_callback))
+
+    all_guilds_commands = []
+    for i in range(_ALL_GUILDS_COMMANDS):
+        cmd = app_commands.Command(name=f"server{i}", description=f"Server command {i}", callback=_slash_callback)
+        tree.register_all_guilds_command(cmd)
+        tree.add_command(cmd)
+        all_guilds_commands.append(cmd)
+
+    if guild_count:
+        for i in range(_MAIN_GUILD_COMMANDS):
+            cmd = app_commands.Command(name=f"admin{i}", description=f"Admin command {i}", callback=_slash_callback)
+            tree.add_command(cmd, guild=discord.Object(id=_FIRST_GUILD_ID))
+
+    return (tree, all_guilds_commands)
+
+
+
+#scenarios: name : (setup or None, measured part), both coroutine functions taking the tree and the commands for all guilds
+
+async def _synced(tree: SmartCommandTree, commands: list) -> None:
+    await tree.sync_all()
+
+async def _synced_then_evicted(tree: SmartCommandTree, commands: list) -> None:
+    await tree.sync_all()
+    tree._clear_cache()
+
+async def _edit_one(tree: SmartCommandTree, commands: list) -> None:
+    cmd = commands[0]
+    cmd.description = "Edited server command"
+    await tree.sync_delta_targets(tree.get_command_locations(cmd), commands=[cmd])
+
+_SCENARIOS = {
+    "sync_all (cold)": (None, lambda tree, commands: tree.sync_all()),
+    "sync_all (unchanged)": (_synced, lambda tree, commands: tree.sync_all()),
+    "sync_all (forced)": (_synced, lambda tree, commands: tree.sync_all(force=True)),
+    "sync_all_defined (cold)": (None, lambda tree, commands: tree.sync_all_defined()),
+    "sync_delta (one edit)": (_synced, _edit_one),
+    "unsync_given": (_synced, lambda tree, commands: tree.unsync_given(commands[0])),
+    "resolve_commands (cold cache)": (_synced_then_evicted, lambda tree, commands: tree.resolve_commands(commands)),
+    "resolve_commands (cached)": (_synced, lambda tree, commands: tree.resolve_commands(commands)),
+}
+
+
+
+async def run_scenario(name: str, guild_count: int, http_options: dict) -> list:
+    """Runs a single scenario on a fresh bot and returns its row of results."""
+    (setup, measured) = _SCENARIOS[name]
+    http = FakeDiscordHTTP(**http_options)
+    (tree, commands) = make_tree(guild_count, http)
+    if setup:
+        await setup(tree, commands)
+    http.reset_stats()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    await measured(tree, commands)
+    elapsed = time.perf_counter() - start
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return [name, http.total_requests, http.ratelimited, f"{elapsed:.3f}", f"{peak/1024**2:.2f}"]
+
+
+async def main(args: argparse.Namespace) -> None:
+    http_options = {
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "seed": args.seed,
+        "bucket_limit": args.bucket_limit,
+        "bucket_period": args.bucket_period,
+        "global_limit": args.global_limit,
+        "raise_ratelimits": args.raise_ratelimits,
+        "time_scale": args.time_scale
+    }
+    for guild_count in args.guilds:
+        rows = [await run_scenario(name, guild_count, http_options) for name in args.scenarios]
+        print(f"{guild_count} guild(s):")
+        print(make_table_string(rows, headers=["Scenario", "Requests", "Ratelimited", "Wall time (s)", "Peak memory (MiB)"], string_quotes=""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of SmartCommandTree syncs.")
+    parser.add_argument("--guilds", type=int, nargs="+", default=[1, 100, 2500], help="amounts of synthetic guilds to run every scenario with")
+    parser.add_argument("--scenarios", nargs="+", default=list(_SCENARIOS), choices=list(_SCENARIOS), metavar="SCENARIO",
+        help=f"scenarios to run, out of: {', '.join(_SCENARIOS)}")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds every request takes")
+    parser.add_argument("--jitter", type=float, default=0.01, help="maximum random seconds added to the latency")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the latency jitter")
+    parser.add_argument("--bucket-limit", type=int, default=5, help="requests allowed per target per bucket period")
+    parser.add_argument("--bucket-period", type=float, default=5.0, help="seconds after which the bucket of a target resets")
+    parser.add_argument("--global-limit", type=int, default=50, help="requests allowed per second in total")
+    parser.add_argument("--raise-ratelimits", action="store_true", help="answer exhausted buckets with 429 responses instead of waiting")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="multiplier of all simulated waits")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,174 @@
+import os
+import sys
+import time
+import types
+import random
+import asyncio
+import argparse
+import tempfile
+
+#same as in bot_loader, so that scripts can be loaded directly from the source directory
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from extensions.core.database import DatabaseCog, _PRAGMA_PROFILES
+from utils.formatting import make_table_string
+
+
+"""
+Benchmark of DatabaseCog with each pragma profile, on a table like the one of the moderation cases cog.
+Every profile gets a fresh database in a temporary directory, which is first filled with --rows rows.
+Reported per scenario: operations made, wall time and operations per second.
+Results depend heavily on the disk (and its caching) of the machine, so only compare profiles within a single run.
+
+Usage: python benchmarks/benchmark_database.py [--profiles durable fast] [--rows 20000] [--operations 1000] [--concurrency 8] ...
+"""
+
+
+_CASES_TABLE = """
+    CREATE TABLE IF NOT EXISTS "cases" (
+        "case_id"	INTEGER NOT NULL UNIQUE,
+        "type_id"	INTEGER NOT NULL,
+        "user_id"	INTEGER NOT NULL,
+        "mod_id"	INTEGER NOT NULL,
+        "flags"	INTEGER NOT NULL,
+        "timestamp"	REAL NOT NULL,
+        "timestamp_expire"	REAL,
+        "source_link"	TEXT,
+        "text"	TEXT,
+        PRIMARY KEY("case_id" AUTOINCREMENT)
+    )
+"""
+_USERS = 5000
+_MODS = 20
+
+
+
+def make_cog(data_dir: str, config: dict) -> DatabaseCog:
+    """Makes a DatabaseCog with a stand-in for the bot, which only has what the cog uses."""
+    bot = types.SimpleNamespace(
+        is_loaded=False,
+        is_quitting=False,
+        remove_appcommands_on_unload=False,
+        avoid_appcommand_deletions=False,
+        extconfig={DatabaseCog.__module__: config},
+        utils=types.SimpleNamespace(pathhelper=types.SimpleNamespace(in_data_dir=lambda path: os.path.join(data_dir, path))),
+        tree=types.SimpleNamespace(unregister_all_guilds_command=lambda command: None)
+    )
+    return DatabaseCog(bot)
+
+
+def make_case(rng: random.Random) -> dict:
+    return {
+        "type_id": rng.randrange(1, 10),
+        "user_id": rng.randrange(_USERS),
+        "mod_id": rng.randrange(_MODS),
+        "flags": rng.randrange(16),
+        "timestamp": time.time(),
+        "timestamp_expire": time.time() + 3600 if rng.random() < 0.2 else None,
+        "source_link": "https://discord.com/channels/1/2/3",
+        "text": "Reason: " + "x" * rng.randrange(10, 200)
+    }
+
+
+
+#scenarios: name : coroutine function taking the cog, the random generator and the options, returning the amount of operations
+
+async def _sequential_inserts(db: DatabaseCog, rng: random.Random, args: argparse.Namespace) -> int:
+    for _ in range(args.operations):
+        await db.insert("cases", **make_case(rng))
+    return args.operations
+
+async def _concurrent_inserts(db: DatabaseCog, rng: random.Random, args: argparse.Namespace) -> int:
+    await asyncio.gather(*(db.insert("cases", **make_case(rng)) for _ in range(args.operations)))
+    return args.operations
+
+async def _queued_inserts(db: DatabaseCog, rng: random.Random, args: argparse.Namespace) -> int:
+    await asyncio.gather(*(db.queue_insert("cases", **make_case(rng)) for _ in range(args.operations)))
+    return args.operations
+
+async def _transaction_inserts(db: DatabaseCog, rng: random.Random, args: argparse.Namespace) -> int:
+    async with db.transaction():
+        for _ in range(args.operations):
+            await db.insert("cases", **make_case(rng))
+    return args.operations
+
+async def _reads_by_id(db: DatabaseCog, rng: random.Random, args: argparse.Namespace) -> int:
+    count = await db.fetch_row_count("cases")
+    async def worker(amount: int):
+        for _ in range(amount):
+            await db.fetch_row_by_id("cases", rng.randrange(1, count + 1))
+    await asyncio.gather(*(worker(args.operations // args.concurrency) for _ in range(args.concurrency)))
+    return args.operations // args.concurrency * args.concurrency
+
+async def _user_case_lists(db: DatabaseCog, rng: random.Random, args: argparse.Namespace) -> int:
+    #same query as CasesCog.get_user_cases, a scan of the whole table
+    amount = max(1, args.operations // 10)
+    async def worker(amount: int):
+        for _ in range(amount):
+            await db.fetch_rows(
+                "SELECT * FROM \"cases\" WHERE \"user_id\"=? ORDER BY \"timestamp\" DESC LIMIT 25",
+                (rng.randrange(_USERS),)
+            )
+    await asyncio.gather(*(worker(amount) for _ in range(args.concurrency)))
+    return amount * args.concurrency
+
+_SCENARIOS = {
+    "insert (sequential)": _sequential_inserts,
+    "insert (concurrent)": _concurrent_inserts,
+    "queue_insert (concurrent)": _queued_inserts,
+    "insert (one transaction)": _transaction_inserts,
+    "fetch_row_by_id": _reads_by_id,
+    "user cases list": _user_case_lists,
+}
+
+
+
+async def run_profile(profile: str, args: argparse.Namespace) -> list:
+    """Runs all scenarios on a fresh database with the given profile and returns their rows of results."""
+    rows = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        config = {
+            "database_file": "benchmark.db",
+            "reader_connections": args.readers,
+            "group_commit_ms": args.group_commit_ms,
+            "pragma_profile": profile
+        }
+        db = make_cog(data_dir, config)
+        await db.cog_load()
+        rng = random.Random(args.seed)
+        await db.execute(_CASES_TABLE)
+        for start in range(0, args.rows, 1000):
+            await db.insert_many(
+                "cases",
+                [tuple(make_case(rng).values()) for _ in range(min(1000, args.rows - start))],
+                ("type_id", "user_id", "mod_id", "flags", "timestamp", "timestamp_expire", "source_link", "text")
+            )
+
+        for name in args.scenarios:
+            start = time.perf_counter()
+            operations = await _SCENARIOS[name](db, rng, args)
+            elapsed = time.perf_counter() - start
+            rows.append([profile, name, operations, f"{elapsed:.3f}", f"{operations / elapsed:.0f}"])
+        await db.cog_unload()
+    return rows
+
+
+async def main(args: argparse.Namespace) -> None:
+    rows = []
+    for profile in args.profiles:
+        rows.extend(await run_profile(profile, args))
+    print(make_table_string(rows, headers=["Profile", "Scenario", "Operations", "Wall time (s)", "Operations/s"], string_quotes=""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of DatabaseCog with each pragma profile.")
+    parser.add_argument("--profiles", nargs="+", default=list(_PRAGMA_PROFILES), choices=list(_PRAGMA_PROFILES), help="pragma profiles to compare")
+    parser.add_argument("--scenarios", nargs="+", default=list(_SCENARIOS), choices=list(_SCENARIOS), metavar="SCENARIO",
+        help=f"scenarios to run, out of: {', '.join(_SCENARIOS)}")
+    parser.add_argument("--rows", type=int, default=20000, help="rows the table is filled with before the scenarios")
+    parser.add_argument("--operations", type=int, default=1000, help="operations per scenario (a tenth of that for case lists)")
+    parser.add_argument("--concurrency", type=int, default=8, help="coroutines reading at the same time")
+    parser.add_argument("--readers", type=int, default=2, help="read-only connections of the database")
+    parser.add_argument("--group-commit-ms", type=float, default=0, help="group commit window, 0 to commit every write right away")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generated cases")
+    asyncio.run(main(parser.parse_args()))
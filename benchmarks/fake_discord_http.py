@@ -0,0 +1,309 @@
+import discord
+
+import asyncio
+import random
+import datetime
+from collections import Counter
+from typing import Optional, List, Dict
+
+
+"""
+Offline stand-in for the app command routes of discord.py's HTTPClient, as used by SmartCommandTree through tree._http.
+Meant for measuring syncs without a live bot, see benchmark_command_tree.py next to this file.
+Not part of the bot, which is why it lives with the benchmarks instead of in src/utils.
+
+Modeled behavior:
+- commands are stored per target (guild id or None for global), bulk overwrites keep the ids of existing commands
+- every request takes .latency seconds (plus up to .jitter seconds, drawn from a seeded random generator)
+- ratelimit buckets per target and a global one, either waited out (like discord.py does) or answered with 429 responses
+- the per-target limits of commands of each type, answered with 400 responses
+Not modeled: the daily command creation limit, localizations, permissions editing.
+"""
+
+
+#same as the server-side limits of SmartCommandTree
+_MAX_COMMANDS_PER_TYPE = {1: 100, 2: 5, 3: 5}
+
+
+
+class FakeResponse:
+    """Minimal response object, so that errors look like the ones raised by discord.py."""
+
+    __slots__ = ("status", "reason", "headers")
+
+    def __init__(self, status: int, reason: str, headers: Optional[dict] = None):
+        self.status = status
+        self.reason = reason
+        self.headers = headers or {}
+
+
+
+class _FakeBucket:
+    """Ratelimit bucket allowing limit requests per period seconds (in loop time)."""
+
+    __slots__ = ("limit", "period", "remaining", "reset_at")
+
+    def __init__(self, limit: int, period: float):
+        self.limit = limit
+        self.period = period
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def try_acquire(self, now: float) -> Optional[float]:
+        """Uses up a request if possible. Otherwise returns the amount of seconds until the bucket resets."""
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.period
+        if self.remaining <= 0:
+            return self.reset_at - now
+        self.remaining -= 1
+        return None
+
+
+
+class FakeDiscordHTTP:
+    """Fake of the app command routes of discord.py's HTTPClient. Pass it as client.http before the tree is made,
+    or assign it to tree._http directly.
+    time_scale: all waits (latency and ratelimits) are multiplied by this, so that benchmarks can run faster
+    than real time while keeping the same proportions.
+    raise_ratelimits: if True, exhausted buckets are answered with 429 responses (with Retry-After headers)
+    instead of being waited out, to exercise the retries of the tree."""
+
+    def __init__(self,
+        application_id: int = 1,
+        *,
+        latency: float = 0.05,
+        jitter: float = 0.0,
+        seed: int = 0,
+        bucket_limit: int = 5,
+        bucket_period: float = 5.0,
+        global_limit: int = 50,
+        global_period: float = 1.0,
+        raise_ratelimits: bool = False,
+        time_scale: float = 1.0
+    ):
+        self.application_id = application_id
+        self.latency = latency
+        self.jitter = jitter
+        self.bucket_limit = bucket_limit
+        self.bucket_period = bucket_period
+        self.raise_ratelimits = raise_ratelimits
+        self.time_scale = time_scale
+        self._random = random.Random(seed)
+        self._buckets: Dict[Optional[int], _FakeBucket] = {}
+        self._global_bucket = _FakeBucket(global_limit, global_period * time_scale)
+        self._last_id = 0
+
+        #guild id or None : {(type, name) : payload}
+        self.commands: Dict[Optional[int], Dict[tuple, dict]] = {}
+        #guild id : {command id or application id : permissions payload}
+        self.permissions: Dict[int, Dict[int, dict]] = {}
+
+        #statistics, see .reset_stats
+        self.requests = Counter() #route name : amount
+        self.ratelimited = 0 #requests which hit a ratelimit (waited or answered with 429)
+
+
+    def reset_stats(self) -> None:
+        self.requests.clear()
+        self.ratelimited = 0
+
+
+    @property
+    def total_requests(self) -> int:
+        return sum(self.requests.values())
+
+
+    def _make_id(self) -> int:
+        """Makes a new unique snowflake based on the current time, so that creation times can be read from it."""
+        self._last_id = max(self._last_id + 1, discord.utils.time_snowflake(datetime.datetime.now(datetime.timezone.utc)))
+        return self._last_id
+
+
+    async def _request(self, route: str, guild_id: Optional[int]) -> None:
+        """Counts a request, waits out its latency and applies the ratelimits of its target."""
+        self.requests[route] += 1
+        loop = asyncio.get_running_loop()
+
+        bucket = self._buckets.get(guild_id, None)
+        if bucket is None:
+            bucket = self._buckets[guild_id] = _FakeBucket(self.bucket_limit, self.bucket_period * self.time_scale)
+
+        hit = False
+        while True:
+            now = loop.time()
+            is_global = False
+            retry_after = self._global_bucket.try_acquire(now)
+            if retry_after is not None:
+                is_global = True
+            else:
+                retry_after = bucket.try_acquire(now)
+                if retry_after is not None:
+                    #the global request has not been made after all
+                    self._global_bucket.remaining += 1
+            if retry_after is None:
+                break
+            if not hit:
+                hit = True
+                self.ratelimited += 1
+            if self.raise_ratelimits:
+                headers = {"Retry-After": str(retry_after)}
+                if is_global:
+                    headers["X-RateLimit-Global"] = "true"
+                raise discord.HTTPException(FakeResponse(429, "Too Many Requests", headers), {"code": 0, "message": "You are being rate limited."})
+            await asyncio.sleep(retry_after)
+
+        delay = self.latency + (self._random.random() * self.jitter if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay * self.time_scale)
+
+
+    @staticmethod
+    def _not_found(what: str) -> discord.NotFound:
+        return discord.NotFound(FakeResponse(404, "Not Found"), {"code": 10063, "message": f"Unknown {what}"})
+
+
+    def _make_payload(self, guild_id: Optional[int], payload: dict, existing: Optional[dict]) -> dict:
+        """Makes the server-side payload of a command sent by the client. Existing commands keep their id,
+        and also their version if nothing changed."""
+        result = {
+            "application_id": str(self.application_id),
+            "type": 1,
+            "description": "",
+            "options": [],
+            "default_member_permissions": None,
+            "dm_permission": True,
+            "nsfw": False
+        }
+        result.update(payload)
+        result["guild_id"] = None if guild_id is None else str(guild_id)
+        if existing is not None:
+            result["id"] = existing["id"]
+            unchanged = all(existing.get(key, None) == value for key, value in result.items() if key != "version")
+            result["version"] = existing["version"] if unchanged else str(self._make_id())
+        else:
+            result["id"] = str(self._make_id())
+            result["version"] = str(self._make_id())
+        return result
+
+
+    @staticmethod
+    def _check_limits(commands: Dict[tuple, dict]) -> None:
+        """Raises an error like Discord does if there are too many commands of some type."""
+        counts = Counter(cmd_type for (cmd_type, _) in commands)
+        for cmd_type, count in counts.items():
+            if count > _MAX_COMMANDS_PER_TYPE.get(cmd_type, 100):
+                raise discord.HTTPException(
+                    FakeResponse(400, "Bad Request"),
+                    {"code": 30032, "message": "Maximum number of application commands reached"}
+                )
+
+
+    def _overwrite(self, guild_id: Optional[int], payload: List[dict]) -> List[dict]:
+        existing = self.commands.get(guild_id, {})
+        new = {}
+        for cmd in payload:
+            key = (cmd.get("type", 1), cmd["name"])
+            new[key] = self._make_payload(guild_id, cmd, existing.get(key, None))
+        self._check_limits(new)
+        self.commands[guild_id] = new
+        return list(new.values())
+
+
+    def _upsert(self, guild_id: Optional[int], payload: dict) -> dict:
+        commands = self.commands.setdefault(guild_id, {})
+        key = (payload.get("type", 1), payload["name"])
+        result = self._make_payload(guild_id, payload, commands.get(key, None))
+        if key not in commands:
+            self._check_limits({**commands, key: result})
+        commands[key] = result
+        return result
+
+
+    def _find(self, guild_id: Optional[int], command_id) -> tuple:
+        for key, cmd in self.commands.get(guild_id, {}).items():
+            if int(cmd["id"]) == int(command_id):
+                return (key, cmd)
+        raise self._not_found("application command")
+
+
+    def _edit(self, guild_id: Optional[int], command_id, payload: dict) -> dict:
+        (key, cmd) = self._find(guild_id, command_id)
+        del self.commands[guild_id][key]
+        payload = {**cmd, **payload}
+        result = self._make_payload(guild_id, payload, cmd)
+        self.commands[guild_id][(result["type"], result["name"])] = result
+        return result
+
+
+    def _delete(self, guild_id: Optional[int], command_id) -> None:
+        (key, _) = self._find(guild_id, command_id)
+        del self.commands[guild_id][key]
+
+
+    #global routes
+
+    async def get_global_commands(self, application_id) -> List[dict]:
+        await self._request("get_commands", None)
+        return list(self.commands.get(None, {}).values())
+
+    async def get_global_command(self, application_id, command_id) -> dict:
+        await self._request("get_command", None)
+        return self._find(None, command_id)[1]
+
+    async def upsert_global_command(self, application_id, payload) -> dict:
+        await self._request("upsert_command", None)
+        return self._upsert(None, payload)
+
+    async def edit_global_command(self, application_id, command_id, payload) -> dict:
+        await self._request("edit_command", None)
+        return self._edit(None, command_id, payload)
+
+    async def delete_global_command(self, application_id, command_id) -> None:
+        await self._request("delete_command", None)
+        self._delete(None, command_id)
+
+    async def bulk_upsert_global_commands(self, application_id, payload) -> List[dict]:
+        await self._request("bulk_upsert_commands", None)
+        return self._overwrite(None, payload)
+
+
+    #guild routes
+
+    async def get_guild_commands(self, application_id, guild_id) -> List[dict]:
+        await self._request("get_commands", guild_id)
+        return list(self.commands.get(guild_id, {}).values())
+
+    async def get_guild_command(self, application_id, guild_id, command_id) -> dict:
+        await self._request("get_command", guild_id)
+        return self._find(guild_id, command_id)[1]
+
+    async def upsert_guild_command(self, application_id, guild_id, payload) -> dict:
+        await self._request("upsert_command", guild_id)
+        return self._upsert(guild_id, payload)
+
+    async def edit_guild_command(self, application_id, guild_id, command_id, payload) -> dict:
+        await self._request("edit_command", guild_id)
+        return self._edit(guild_id, command_id, payload)
+
+    async def delete_guild_command(self, application_id, guild_id, command_id) -> None:
+        await self._request("delete_command", guild_id)
+        self._delete(guild_id, command_id)
+
+    async def bulk_upsert_guild_commands(self, application_id, guild_id, payload) -> List[dict]:
+        await self._request("bulk_upsert_commands", guild_id)
+        return self._overwrite(guild_id, payload)
+
+
+    #permissions routes
+
+    async def get_guild_application_command_permissions(self, application_id, guild_id) -> List[dict]:
+        await self._request("get_permissions", guild_id)
+        return list(self.permissions.get(guild_id, {}).values())
+
+    async def get_application_command_permissions(self, application_id, guild_id, command_id) -> dict:
+        await self._request("get_permissions", guild_id)
+        permissions = self.permissions.get(guild_id, {}).get(int(command_id), None)
+        if permissions is None:
+            raise discord.NotFound(FakeResponse(404, "Not Found"), {"code": 10066, "message": "Unknown application command permissions"})
+        return permissions
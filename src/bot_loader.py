@@ -297,10 +297,19 @@ class BotLoader:
                 print("Syncing AppCommands... (this might take a while)")
 
 
+        async def bot_sync_progress_handler(bot: SmartBot, done: int, failed: int, remaining: int) -> None:
+            total = done + failed + remaining
+            finished = done + failed
+            #don't spam the console when syncing to a lot of guilds
+            if remaining == 0 or finished % max(1, total//10) == 0:
+                failed_info = f", {failed} failed" if failed > 0 else ""
+                print(f"~ [{finished}/{total}] sync target{plural_suffix(total)} finished{failed_info}...")
+
+
         @self.bot.event
         async def on_full_ready():
             if self.bot.should_sync_commands_on_start():
-                print(f"Combined total of {len(self.bot.tree.app_commands_cache.values())} AppCommands have been uploaded to Discord.")
+                print(f"Combined total of {len(self.bot.tree.app_commands_cache)} AppCommands are synced with Discord.")
             new_empty_line_if_not_already()
             print("--- Done, bot fully loaded! (Type 'q', 'quit' or 'exit' to stop it.) ---")
             new_empty_line_if_not_already()
@@ -339,6 +348,7 @@ class BotLoader:
             before_quit_coro=bot_shutdown_hook,
             before_full_ready_coro=bot_before_full_ready,
             console_input_coro=console_handler,
+            sync_progress_coro=bot_sync_progress_handler,
             reconnect=reconnect
         )
 
@@ -8,3 +8,14 @@ class ExtensionNotRegistered(commands.errors.ExtensionError):
     def __init__(self, name: str) -> None:
         msg = f"Cannot load extension {name!r} - extension not registered."
         super().__init__(msg, name=name)
+
+
+class InvalidAppCommands(Exception):
+    """
+    Thrown when attempting to sync app commands that exceed Discord's limits, before any request is made.
+    """
+    def __init__(self, guild_id, violations: list) -> None:
+        self.guild_id = guild_id
+        self.violations = violations
+        target = "global app commands" if guild_id is None else f"app commands of guild with id '{guild_id}'"
+        super().__init__(f"Cannot sync {target} - {len(violations)} limit violation(s): " + "; ".join(str(violation) for violation in violations))
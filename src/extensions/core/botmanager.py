@@ -1,5 +1,8 @@
 import discord
 from discord.ext import commands
+
+import time
+
 from smart_bot import SmartBot
 from smart_cogs import *
 
@@ -39,9 +42,60 @@ class BotManagerCog(SmartCog):
         elif input_line == "sync":
             await self.bot.tree.sync_all(ignore_errors=False)
             print("Synced!")
+        elif input_line == "sync force":
+            self.bot.tree.invalidate_payload_cache()
+            await self.bot.tree.sync_all(ignore_errors=False, force=True)
+            print("Synced! (forced)")
+        elif input_line == "sync plan":
+            plans = self.bot.tree.plan_sync()
+            for plan in plans.values():
+                print(
+                    f"{plan.strategy}: {plan.requests} request(s), {plan.creations} command creation(s), "
+                    f"{plan.skipped}/{len(plan.targets)} target(s) without requests"
+                    + (f", {plan.invalid} target(s) exceeding Discord's limits" if plan.invalid else "")
+                    + (f", {plan.deferred} target(s) deferred by the creation budget" if plan.deferred else "")
+                    + (f", {plan.uncached} target(s) not cached (creations are a worst-case estimate)" if plan.uncached else "")
+                )
+            for cheapest, compared in self.bot.tree.get_cheapest_plans(plans):
+                print(f"Cheapest way to sync the same {len(cheapest.targets)} target(s) ({', '.join(plan.strategy for plan in compared)}): {cheapest.strategy}")
+            print(".")
+        elif input_line == "sync check":
+            invalid_targets = self.bot.tree.validate_all_targets()
+            for guild_id, violations in invalid_targets.items():
+                print(f"{'global' if guild_id is None else guild_id}:")
+                for violation in violations:
+                    print(f"  {violation}")
+            print(f"{len(invalid_targets)} target(s) exceed Discord's limits.")
+        elif input_line == "quota":
+            report = self.bot.tree.get_creation_quota_report()
+            for guild_id, quota in report.items():
+                print(f"{'global' if guild_id is None else guild_id}: {quota['used']} created, {quota['remaining']} left, "
+                    f"next frees up in {max(0, quota['resets_at'] - time.time())/3600:.1f}h")
+            if self.bot.tree.deferred_sync_targets:
+                print(f"Deferred sync targets: {', '.join('global' if guild_id is None else str(guild_id) for guild_id in self.bot.tree.deferred_sync_targets)}")
+            print(f"{len(report)} target(s) with commands created within the last day.")
         elif input_line == "prune":
             await self.bot.tree.sync_all(just_delete=True, ignore_errors=False)
             print("Pruned!")
+        elif input_line == "cache memory":
+            sizes = await self.bot.tree.measure_cache_memory()
+            print(
+                f"Compact cache mode is {'on' if self.bot.tree.is_cache_compact() else 'off'}. "
+                f"{sizes['commands']} cached command(s) take {sizes['total']/1024**2:.2f} MiB "
+                f"({sizes['records']/1024**2:.2f} MiB of records, {sizes['payloads']/1024**2:.2f} MiB of payloads)."
+            )
+        elif input_line == "cache compact":
+            self.bot.tree.set_compact_cache(not self.bot.tree.is_cache_compact())
+            print(f"Compact cache mode is now {'on' if self.bot.tree.is_cache_compact() else 'off'}.")
+        elif input_line == "autocomplete":
+            for cog_name, cog in self.bot.cogs.items():
+                if not isinstance(cog, SmartCog):
+                    continue
+                for name, source in cog.get_autocomplete_sources().items():
+                    stats = source.get_stats()
+                    print(f"{cog_name}.{name}: {stats['choices']} choices, {stats['queries']} queries, {stats['hit_rate']:.0%} hits, "
+                        f"{stats['avg_ms']:.3f} ms avg, {stats['max_ms']:.3f} ms max, {stats['refreshes']} refreshes ({stats['failed_refreshes']} failed)")
+            print(".")
         elif input_line == "test":
             print(self.bot._connection.max_messages)
             
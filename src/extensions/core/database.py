@@ -5,17 +5,83 @@ from smart_cogs import *
 
 import aiosqlite
 
+import os
+import time
+import sqlite3
+import asyncio
+import pathlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional, Union
+
 from utils.formatting import make_table_string
 from utils.common import get_exception_string
 
 """
 Config template:
 {
-    "database_file": str = relative path from the bot's data directory
+    "database_file": str = relative path from the bot's data directory,
+    "reader_connections": int = amount of extra read-only connections (optional, 2 by default, 0 = everything uses the writer),
+    "group_commit_ms": float = window in which commits of concurrent writes are batched into one (optional, 0 by default = commit every write right away),
+    "group_commit_max_writes": int = amount of writes after which a batch is committed before its window ends (optional, 100 by default),
+    "insert_batch_ms": float = how long rows from queue_insert are buffered before being inserted (optional, 50 by default),
+    "insert_batch_rows": int = amount of buffered rows (per table and columns) which are inserted right away (optional, 500 by default),
+    "statement_cache_size": int = amount of compiled shorthand statements kept (optional, 128 by default),
+    "pragma_profile": str = "durable", "balanced" or "fast", see _PRAGMA_PROFILES (optional, "durable" by default),
+    "pragmas": dict = overrides of single pragmas of the profile, like {"cache_size": -64000} (optional)
 }
 """
 
 
+#pragma name : value, applied when connecting
+#durable: every commit is synced to the disk
+#balanced: commits may be lost on a power loss (but not on a crash of the bot), bigger caches
+#fast: commits may be lost (and the database corrupted) on a power loss, even bigger caches
+_PRAGMA_PROFILES = {
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -2000, #negative values are in KiB
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 5000,
+        "wal_autocheckpoint": 1000
+    },
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,
+        "mmap_size": 64 * 1024**2,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+        "wal_autocheckpoint": 1000
+    },
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024**2,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+        "wal_autocheckpoint": 4000
+    }
+}
+#pragmas which also apply to the read-only connections, the rest only matter for writing
+_READER_PRAGMAS = ("cache_size", "mmap_size", "temp_store", "busy_timeout")
+#names of the values of pragmas which sqlite reports as numbers
+_PRAGMA_VALUE_NAMES = {
+    "synchronous": ("OFF", "NORMAL", "FULL", "EXTRA"),
+    "temp_store": ("DEFAULT", "FILE", "MEMORY")
+}
+
+
+#sqlite's cache of prepared statements fits all compiled statements plus this many other queries
+_EXTRA_CACHED_STATEMENTS = 64
+
+#inserts can report the row IDs of their own rows with RETURNING since sqlite 3.35
+_SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
 async def setup(bot: SmartBot):
     cog = DatabaseCog(bot)
     bot.utils.db = cog
@@ -45,6 +111,172 @@ class _UnselectedSentinel:
 
 
 
+class _ConnectionPool:
+    """Pool of connections, each of which is handed out to a single coroutine at a time.
+    Keeps statistics about waiting for a free connection and about how busy the connections are."""
+    
+    def __init__(self, connections: list):
+        self.connections = connections
+        self._idle = asyncio.Queue()
+        for connection in connections:
+            self._idle.put_nowait(connection)
+        
+        self.created_at = time.perf_counter()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.acquisitions = 0
+        self.waits = 0 #acquisitions that found no free connection
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.busy_time = 0.0
+    
+    
+    @property
+    def size(self) -> int:
+        return len(self.connections)
+    
+    
+    @asynccontextmanager
+    async def acquire(self):
+        """Context manager which waits for a free connection and returns it to the pool afterwards."""
+        start = time.perf_counter()
+        if self._idle.empty():
+            self.waits += 1
+        connection = await self._idle.get()
+        acquired = time.perf_counter()
+        
+        wait_time = acquired - start
+        self.acquisitions += 1
+        self.total_wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        try:
+            yield connection
+        finally:
+            self.in_use -= 1
+            self.busy_time += time.perf_counter() - acquired
+            self._idle.put_nowait(connection)
+    
+    
+    def get_stats(self) -> dict:
+        """Returns the statistics of the pool. Utilization is the fraction of time the connections have been in use."""
+        elapsed = time.perf_counter() - self.created_at
+        return {
+            "size": self.size,
+            "in_use": self.in_use,
+            "peak_in_use": self.peak_in_use,
+            "acquisitions": self.acquisitions,
+            "waits": self.waits,
+            "avg_wait_ms": self.total_wait_time / self.acquisitions * 1000 if self.acquisitions else 0.0,
+            "max_wait_ms": self.max_wait_time * 1000,
+            "utilization": self.busy_time / (elapsed * self.size) if elapsed and self.size else 0.0
+        }
+    
+    
+    async def close(self) -> None:
+        for connection in self.connections:
+            await connection.close()
+
+
+
+def _build_insert(table_name: str, columns: Union[tuple, int]) -> str:
+    """columns are either the column names or just their amount, for inserting in column definition order."""
+    if isinstance(columns, int):
+        return f"INSERT INTO \"{table_name}\" VALUES ({', '.join('?' * columns)})"
+    column_names = "\", \"".join(columns)
+    return f"INSERT INTO \"{table_name}\" (\"{column_names}\") VALUES ({', '.join('?' * len(columns))})"
+
+def _build_fetch_row_by_id(table_name: str, columns: tuple) -> str:
+    return f"SELECT * FROM \"{table_name}\" WHERE \"rowid\"=?"
+
+def _build_fetch_row_count(table_name: str, columns: tuple) -> str:
+    return f"SELECT COUNT(*) FROM \"{table_name}\""
+
+#operation : function making its statement from the table name and columns
+_STATEMENT_BUILDERS = {
+    "insert": _build_insert,
+    "fetch_row_by_id": _build_fetch_row_by_id,
+    "fetch_row_count": _build_fetch_row_count
+}
+
+
+
+class _StatementCache:
+    """Bounded LRU of compiled statements, keyed by (table name, columns, operation).
+    Only statements with safe identifiers are kept, so a hit needs no validation."""
+    
+    __slots__ = ("size", "_statements", "hits", "misses")
+    
+    def __init__(self, size: int):
+        self.size = size
+        self._statements = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def __repr__(self):
+        return f"<_StatementCache size={self.size} statements={len(self._statements)}>"
+    
+    def get(self, key: tuple) -> Optional[str]:
+        statement = self._statements.get(key, None)
+        if statement is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._statements.move_to_end(key)
+        return statement
+    
+    def put(self, key: tuple, statement: str) -> None:
+        self._statements[key] = statement
+        self._statements.move_to_end(key)
+        if len(self._statements) > self.size:
+            self._statements.popitem(last=False)
+    
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": self.size,
+            "statements": len(self._statements),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+
+
+class _InsertQueue:
+    """Rows waiting to be inserted into the same columns of a table, along with futures for their row IDs."""
+    
+    __slots__ = ("table_name", "columns", "query", "rows", "futures", "queued_at", "handle")
+    
+    def __init__(self, table_name: str, columns: tuple, query: str):
+        self.table_name = table_name
+        self.columns = columns
+        self.query = query
+        self.rows = []
+        self.futures = []
+        self.queued_at = time.perf_counter()
+        self.handle = None #timer of the flush
+    
+    def __repr__(self):
+        return f"<_InsertQueue table_name={self.table_name!r} columns={self.columns!r} rows={len(self.rows)}>"
+
+
+class _QueuedInsertFuture(asyncio.Future):
+    """Future of a row queued with DatabaseCog.queue_insert. The row can only be inserted once no transaction is running,
+    so awaiting it within a transaction of the same database raises TransactionDeadlock instead of never finishing."""
+    
+    def __init__(self, cog, *, loop: asyncio.AbstractEventLoop):
+        super().__init__(loop=loop)
+        self._cog = cog
+    
+    def __await__(self):
+        if not self.done() and self._cog.in_transaction():
+            raise TransactionDeadlock("a row queued with queue_insert")
+        return (yield from super().__await__())
+
+
+
 class InvalidQueryData(Exception):
     """
     Thrown when attempting to make a database query with invalid data.
@@ -59,6 +291,13 @@ class UnsafeQueryParameter(Exception):
     def __init__(self, parameter: str) -> None:
         super().__init__(f"Parameter {parameter!r} has unsafe characters/format.")
 
+class TransactionDeadlock(Exception):
+    """
+    Thrown when a transaction waits for a write which can only be made once the transaction finishes.
+    """
+    def __init__(self, waited_for: str) -> None:
+        super().__init__(f"A transaction waited for {waited_for}, which would never finish before the transaction does.")
+
 
 
 class DatabaseCog(SmartCog):
@@ -70,22 +309,157 @@ class DatabaseCog(SmartCog):
         super().__init__(bot)
         
         self.db_path = self.bot.utils.pathhelper.in_data_dir(self.config["database_file"])
+        self.reader_connections = max(0, int(self.config.get("reader_connections", 2)))
+        #all writes go through a single connection, while reads are spread over a pool of read-only connections
+        #(in WAL mode, readers don't block the writer and the writer doesn't block readers)
         self._db = None
+        self._readers = None
+        self.write_operations = 0
+        
+        #only one transaction at a time is ran on the writer, so that concurrent coroutines don't commit or roll back each other's work
+        self._write_lock = asyncio.Lock()
+        self._transaction_task: Optional[asyncio.Task] = None #the task running the current transaction
+        self.transactions = 0
+        self.commits = 0
+        #with group commit, finished transactions wait for a shared commit (a future), made once the window passes
+        self.group_commit_window = max(0.0, float(self.config.get("group_commit_ms", 0))) / 1000
+        self.group_commit_max_writes = max(1, int(self.config.get("group_commit_max_writes", 100)))
+        self._group_commit: Optional[asyncio.Future] = None
+        self._group_commit_transactions = 0
+        self._group_commit_handle: Optional[asyncio.TimerHandle] = None
+        self._group_commit_tasks = set()
+        
+        #write-behind inserts, see .queue_insert
+        self.insert_batch_window = max(0.0, float(self.config.get("insert_batch_ms", 50))) / 1000
+        self.insert_batch_rows = max(1, int(self.config.get("insert_batch_rows", 500)))
+        self._insert_queues = {} #(table name, column names) : _InsertQueue
+        self._insert_flush_tasks = set()
+        self._rowid_tables = {} #table name : whether the table has a rowid (WITHOUT ROWID tables don't)
+        self.insert_flushes = 0
+        self.failed_insert_flushes = 0
+        self.flushed_rows = 0
+        self.total_flush_time = 0.0
+        self.max_flush_time = 0.0
+        self.max_queued_time = 0.0
+        
+        #statements of the shorthand methods, see ._compile_statement
+        self._statements = _StatementCache(max(1, int(self.config.get("statement_cache_size", 128))))
+        
+        self.pragma_profile = self.config.get("pragma_profile", "durable")
+        self.pragmas = self.make_pragmas(self.pragma_profile, self.config.get("pragmas", None))
+        self.applied_pragmas = {} #as reported by sqlite after connecting
 
 
     async def cog_load(self):
-        self._db = await aiosqlite.connect(self.db_path)
+        #sqlite keeps the compiled statements prepared, since they are ran with the exact same SQL every time
+        cached_statements = self._statements.size + _EXTRA_CACHED_STATEMENTS
+        self._db = await aiosqlite.connect(self.db_path, cached_statements=cached_statements)
         self._db.row_factory = aiosqlite.Row
+        await self._apply_pragmas(self._db, self.pragmas.keys())
+        self.applied_pragmas = await self.fetch_pragmas(self._db)
+        print(f"Database {self.config['database_file']!r}: {self.get_pragmas_string()}")
+        
+        readers = []
+        if self.reader_connections:
+            if self.applied_pragmas["journal_mode"] != "wal":
+                print("Warning: the database is not in WAL mode, so its readers and its writer block each other.")
+            #opened through an URI, so that the connections are read-only
+            reader_uri = pathlib.Path(os.path.abspath(self.db_path)).as_uri() + "?mode=ro"
+            for _ in range(self.reader_connections):
+                reader = await aiosqlite.connect(reader_uri, uri=True, cached_statements=cached_statements)
+                reader.row_factory = aiosqlite.Row
+                await self._apply_pragmas(reader, _READER_PRAGMAS)
+                readers.append(reader)
+        else:
+            #a single connection, used for both reading and writing
+            readers.append(self._db)
+        self._readers = _ConnectionPool(readers)
         await super().cog_load()
 
 
     async def cog_unload(self):
+        await self.flush_inserts()
+        await self.flush_group_commit()
+        if self._readers.connections[0] is not self._db:
+            await self._readers.close()
         await self._db.close()
         await super().cog_unload()
     
     
+    @staticmethod
+    def make_pragmas(profile: str, overrides: dict = None) -> dict:
+        """Returns the pragmas of a profile (see _PRAGMA_PROFILES) with the given ones overridden.
+        Values have to be integers or keywords, since pragmas can't be parametrized."""
+        if profile not in _PRAGMA_PROFILES:
+            raise ValueError(f"Unknown pragma profile {profile!r}, expected one of: {', '.join(_PRAGMA_PROFILES)}")
+        pragmas = dict(_PRAGMA_PROFILES[profile])
+        for name, value in (overrides or {}).items():
+            if name not in pragmas:
+                raise ValueError(f"Unsupported pragma {name!r}, expected one of: {', '.join(pragmas)}")
+            if not isinstance(value, int) and not DatabaseCog.is_safe_parameter(value):
+                raise UnsafeQueryParameter(str(value))
+            pragmas[name] = value
+        return pragmas
+    
+    
+    async def _apply_pragmas(self, connection: aiosqlite.Connection, names) -> None:
+        for name in names:
+            await connection.execute(f"PRAGMA {name}={self.pragmas[name]}")
+    
+    
+    async def fetch_pragmas(self, connection: aiosqlite.Connection = None) -> dict:
+        """Returns the current values of the configurable pragmas of a connection (the writer by default)."""
+        connection = connection or self._db
+        values = {}
+        for name in self.pragmas.keys():
+            value = (await self._fetch_row(connection, f"PRAGMA {name}"))[0]
+            value_names = _PRAGMA_VALUE_NAMES.get(name, None)
+            if value_names and isinstance(value, int) and 0 <= value < len(value_names):
+                value = value_names[value]
+            values[name] = value
+        return values
+    
+    
+    def get_pragmas_string(self) -> str:
+        overridden = [name for name, value in self.pragmas.items() if value != _PRAGMA_PROFILES[self.pragma_profile][name]]
+        return (
+            f"pragma profile {self.pragma_profile!r}"
+            + (f" (overridden: {', '.join(overridden)})" if overridden else "")
+            + ", " + ", ".join(f"{name}={value}" for name, value in self.applied_pragmas.items())
+        )
+    
+    
     @commands.Cog.listener("on_console_input")
     async def console_command_handler(self, input_line):
+        if input_line.lower() == "db pragmas":
+            self.applied_pragmas = await self.fetch_pragmas()
+            print(self.get_pragmas_string())
+            return
+        if input_line.lower() == "db stats":
+            stats = self.get_pool_stats()
+            readers = stats["readers"]
+            print(
+                f"Readers: {readers['size']} ({readers['in_use']} in use, peak {readers['peak_in_use']}), "
+                f"{readers['utilization']:.1%} utilization, {readers['acquisitions']} reads, {readers['waits']} had to wait, "
+                f"{readers['avg_wait_ms']:.2f} ms avg wait, {readers['max_wait_ms']:.2f} ms max wait"
+            )
+            print(
+                f"Writer: {stats['writes']} writes in {stats['transactions']} transactions, {stats['commits']} commits, "
+                f"group commit {f'every {self.group_commit_window*1000:g} ms' if self.group_commit_window else 'disabled'}"
+            )
+            inserts = self.get_insert_queue_stats()
+            print(
+                f"Insert queues: {inserts['pending_rows']} rows pending in {inserts['queues']} queues, "
+                f"{inserts['flushed_rows']} rows in {inserts['flushes']} flushes ({inserts['failed_flushes']} failed), "
+                f"{inserts['avg_flush_ms']:.2f} ms avg flush, {inserts['max_flush_ms']:.2f} ms max flush, "
+                f"{inserts['max_queued_ms']:.2f} ms max time queued"
+            )
+            statements = self._statements.get_stats()
+            print(
+                f"Compiled statements: {statements['statements']}/{statements['size']}, "
+                f"{statements['hits']} hits, {statements['misses']} misses ({statements['hit_ratio']:.1%} hit ratio)"
+            )
+            return
         if input_line[:4].lower() != "sql ":
             return
         print(await self.ui_query(input_line[4:]))
@@ -117,6 +491,179 @@ class DatabaseCog(SmartCog):
         return [self.annotate_row(row) for row in rows]
     
     
+    def get_pool_stats(self) -> dict:
+        """Returns statistics of the read-only connections (see _ConnectionPool.get_stats)
+        and the amount of writes, transactions and commits made."""
+        return {
+            "readers": self._readers.get_stats(),
+            "writes": self.write_operations,
+            "transactions": self.transactions,
+            "commits": self.commits
+        }
+    
+    
+    @asynccontextmanager
+    async def transaction(self):
+        """Context manager which runs all writes made within it (by the current task) as a single transaction.
+        It is committed when the block finishes, or rolled back if it raises. Blocks nested in it join the outer transaction.
+        Reads made within it are ran on the writer, so that they see the uncommitted changes.
+        Other writers wait until the transaction finishes, so it should be kept short.
+        Tasks started within the block are other writers too, so awaiting their writes (or rows queued with .queue_insert)
+        within the block would never finish. Such waits raise TransactionDeadlock instead, as far as they can be detected.
+        With group commit, the block finishes once its changes have been committed along with the other ones in the window."""
+        if self.in_transaction():
+            yield self
+            return
+        
+        if self._is_awaited_by_transaction(asyncio.current_task()):
+            raise TransactionDeadlock("a task which needs to write")
+        
+        commit = None
+        async with self._write_lock:
+            #kept per task rather than in a context variable, since tasks copy the context of the one starting them
+            self._transaction_task = asyncio.current_task()
+            try:
+                if not self._db.in_transaction:
+                    await self._db.execute("BEGIN")
+                if self.group_commit_window:
+                    #the sqlite transaction may be shared with other finished transactions waiting for their commit,
+                    #so a failure only rolls back to the savepoint
+                    await self._db.execute("SAVEPOINT \"transaction\"")
+                    try:
+                        yield self
+                    except BaseException:
+                        await self._db.execute("ROLLBACK TO \"transaction\"")
+                        await self._db.execute("RELEASE \"transaction\"")
+                        raise
+                    await self._db.execute("RELEASE \"transaction\"")
+                    commit = self._join_group_commit()
+                else:
+                    try:
+                        yield self
+                    except BaseException:
+                        await self._db.rollback()
+                        raise
+                    await self._db.commit()
+                    self.commits += 1
+                self.transactions += 1
+            finally:
+                self._transaction_task = None
+        
+        if commit is not None:
+            #shielded, so that a cancelled caller doesn't cancel the commit of everyone else
+            await asyncio.shield(commit)
+    
+    
+    def in_transaction(self) -> bool:
+        """Returns True if the current task is within a transaction of this database (see .transaction)."""
+        return self._transaction_task is not None and self._transaction_task is asyncio.current_task()
+    
+    
+    def _is_awaited_by_transaction(self, task: Optional[asyncio.Task]) -> bool:
+        """Checks if the task running the current transaction is waiting for the given task (directly or through gather),
+        in which case the given task can never get the writer."""
+        if task is None or self._transaction_task is None or self._transaction_task is task:
+            return False
+        waiting_for = getattr(self._transaction_task, "_fut_waiter", None)
+        return waiting_for is task or task in getattr(waiting_for, "_children", ())
+    
+    
+    @asynccontextmanager
+    async def _writing(self):
+        """Context manager which returns the writer. The writes made within it join the current transaction,
+        or are ran as their own one."""
+        async with self.transaction():
+            yield self._db
+    
+    
+    @asynccontextmanager
+    async def _reading(self):
+        """Context manager which returns a reader, or the writer if within a transaction."""
+        if self.in_transaction():
+            yield self._db
+            return
+        async with self._readers.acquire() as reader:
+            yield reader
+    
+    
+    def _join_group_commit(self) -> asyncio.Future:
+        """Adds a finished transaction to the pending group commit, starting a new one if needed.
+        Returns the future of the commit."""
+        if self._group_commit is None:
+            loop = asyncio.get_running_loop()
+            self._group_commit = loop.create_future()
+            self._group_commit_transactions = 0
+            self._group_commit_handle = loop.call_later(self.group_commit_window, self._start_group_commit)
+        future = self._group_commit
+        self._group_commit_transactions += 1
+        if self._group_commit_transactions >= self.group_commit_max_writes:
+            self._start_group_commit()
+        return future
+    
+    
+    def _start_group_commit(self) -> Optional[asyncio.Task]:
+        """Starts committing the pending group commit, if there is one. New transactions start the next one."""
+        future = self._group_commit
+        if future is None:
+            return None
+        self._group_commit = None
+        self._group_commit_handle.cancel()
+        self._group_commit_handle = None
+        task = asyncio.create_task(self._commit_group(future))
+        #kept referenced until done
+        self._group_commit_tasks.add(task)
+        task.add_done_callback(self._group_commit_tasks.discard)
+        return task
+    
+    
+    async def _commit_group(self, future: asyncio.Future) -> None:
+        async with self._write_lock:
+            try:
+                await self._db.commit()
+            except Exception as err:
+                print(f"Group commit of the database failed! Exception:\n{get_exception_string(err)}")
+                await self._db.rollback()
+                future.set_exception(err)
+            else:
+                self.commits += 1
+                future.set_result(None)
+    
+    
+    async def flush_group_commit(self) -> None:
+        """Commits the pending group commit right away and waits for all running ones."""
+        self._start_group_commit()
+        if self._group_commit_tasks:
+            await asyncio.gather(*self._group_commit_tasks, return_exceptions=True)
+    
+    
+    def _compile_statement(self, operation: str, table_name: str, columns: Union[tuple, int], accept_unsafe: bool = False) -> str:
+        """Returns the statement of a shorthand operation (see _STATEMENT_BUILDERS), compiling and caching it if needed.
+        Identifiers are validated only when compiling. Statements with unsafe identifiers (allowed by accept_unsafe)
+        are never cached."""
+        key = (table_name, columns, operation)
+        statement = self._statements.get(key)
+        if statement is not None:
+            return statement
+        
+        #validate safe table name and column names
+        column_names = () if isinstance(columns, int) else columns
+        unsafe = next((param for param in (table_name, *column_names) if not self.is_safe_parameter(param)), None)
+        if unsafe is not None and not accept_unsafe:
+            raise UnsafeQueryParameter(unsafe)
+        
+        statement = _STATEMENT_BUILDERS[operation](table_name, columns)
+        if unsafe is None:
+            self._statements.put(key, statement)
+        return statement
+    
+    
+    @staticmethod
+    def is_read_only_query(query: str) -> bool:
+        """Checks if a query is certainly read-only, so that it can be ran on a reader connection.
+        Even if this is wrong, the reader connections can't write anything."""
+        return query.lstrip().upper().startswith(("SELECT", "EXPLAIN"))
+    
+    
     
     async def ui_query(self, query: str, params: tuple = None) -> str:
         """This function acts as a user interface for the database.
@@ -131,18 +678,25 @@ class DatabaseCog(SmartCog):
         result = ""
         
         try:
-            await self._db.commit()
-            async with self._db.execute(query, params) as cursor:
-                rowcount = cursor.rowcount
-                lastrowid = cursor.lastrowid
-                if cursor.description:
-                    headers = [desc[0] for desc in cursor.description]
-                rows = await cursor.fetchall()
+            if self.is_read_only_query(query):
+                #a slow read-only query doesn't hold up the writer
+                async with self._reading() as reader:
+                    async with reader.execute(query, params) as cursor:
+                        if cursor.description:
+                            headers = [desc[0] for desc in cursor.description]
+                        rows = await cursor.fetchall()
+            else:
+                async with self._writing() as writer:
+                    self.write_operations += 1
+                    async with writer.execute(query, params) as cursor:
+                        rowcount = cursor.rowcount
+                        lastrowid = cursor.lastrowid
+                        if cursor.description:
+                            headers = [desc[0] for desc in cursor.description]
+                        rows = await cursor.fetchall()
         except Exception as err:
-            await self._db.rollback()
             result += f"Query failed! Exception:\n{get_exception_string(err)}\n"
         else:
-            await self._db.commit()
             if rowcount < 0:
                 result += f"Query successful! Rows returned: {len(rows)}\n"
                 result += make_table_string(
@@ -163,85 +717,70 @@ class DatabaseCog(SmartCog):
     async def _execute(self, query: str, params: tuple = None):
         """Used to run any statement that modifies the database or its data.
         Returns the inserted row's ID if possible, otherwise None.
-        Does not perform commit or rollback on error."""
+        Does not perform commit or rollback on error, to be used within a transaction."""
+        self.write_operations += 1
         async with self._db.execute(query, params) as cursor:
             return cursor.lastrowid
     
     async def execute(self, query: str, params: tuple = None):
         """Used to run any statement that modifies the database or its data.
-        Returns the inserted row's ID if possible, otherwise None."""
-        lastrowid = None
-        try:
-            await self._db.commit()
-            lastrowid = await self._execute(query, params)
-        except Exception as err:
-            await self._db.rollback()
-            raise err
-        else:
-            await self._db.commit()
-        return lastrowid
+        Returns the inserted row's ID if possible, otherwise None.
+        Joins the current transaction, otherwise commits on success and rolls back on error."""
+        async with self._writing():
+            return await self._execute(query, params)
     
     
     async def _execute_many(self, query: str, list_of_params) -> None:
         """Used to run a single statement many times with different data.
-        Does not perform commit or rollback on error. No return value.
+        Does not perform commit or rollback on error, to be used within a transaction. No return value.
         """
+        self.write_operations += 1
         async with self._db.executemany(query, list_of_params) as cursor:
             pass
     
     async def execute_many(self, query: str, list_of_params) -> None:
         """Used to run a single statement many times with different data.
-        Commits on complete success, otherwise rolls back. No return value."""
-        try:
-            await self._db.commit()
+        Joins the current transaction, otherwise commits on complete success and rolls back on error. No return value."""
+        async with self._writing():
             await self._execute_many(query, list_of_params)
-        except Exception as err:
-            await self._db.rollback()
-            raise err
-        else:
-            await self._db.commit()
     
     
+    @staticmethod
+    async def _fetch_row(connection: aiosqlite.Connection, query: str, params: tuple = None) -> aiosqlite.Row:
+        async with connection.execute(query, params) as cursor:
+            return await cursor.fetchone()
+    
     async def fetch_row(self, query: str, params: tuple = None) -> aiosqlite.Row:
         """Returns a single row from the ran query. Does not perform commit or rollback on error.
-        To be used only for read-only operations."""
-        async with self._db.execute(query, params) as cursor:
-            return await cursor.fetchone()
+        To be used only for read-only operations, which are ran on one of the reader connections."""
+        async with self._reading() as reader:
+            return await self._fetch_row(reader, query, params)
     
     async def execute_and_fetch_row(self, query: str, params: tuple = None) -> aiosqlite.Row:
         """Returns a single row from the ran query. Used for modify/write operations.
         For read-only operations, use fetch_row instead."""
-        row = None
-        try:
-            await self._db.commit()
-            row = await self.fetch_row(query, params)
-        except Exception as err:
-            await self._db.rollback()
-            raise err
-        else:
-            await self._db.commit()
-        return row
+        async with self._writing() as writer:
+            self.write_operations += 1
+            return await self._fetch_row(writer, query, params)
 
     
+    @staticmethod
+    async def _fetch_rows(connection: aiosqlite.Connection, query: str, params: tuple = None) -> list:
+        async with connection.execute(query, params) as cursor:
+            return await cursor.fetchall()
+    
     async def fetch_rows(self, query: str, params: tuple = None) -> list:
         """Returns all rows from the ran query. Does not perform commit or rollback on error.
-        To be used only for read-only operations."""
-        async with self._db.execute(query, params) as cursor:
-            return await cursor.fetchall()
+        To be used only for read-only operations, which are ran on one of the reader connections."""
+        async with self._reading() as reader:
+            return await self._fetch_rows(reader, query, params)
 
     async def execute_and_fetch_rows(self, query: str, params: tuple = None) -> list:
         """Returns all rows from the ran query. Used for modify/write operations.
         For read-only operations, use fetch_rows instead."""
-        rows = []
-        try:
-            await self._db.commit()
-            rows = await self.fetch_rows(query, params)
-        except Exception as err:
-            await self._db.rollback()
-            raise err
-        else:
-            await self._db.commit()
-        return rows
+        async with self._writing() as writer:
+            self.write_operations += 1
+            return await self._fetch_rows(writer, query, params)
     
     
     async def fetch_value(self, query: str, params: tuple = None):
@@ -282,21 +821,8 @@ class DatabaseCog(SmartCog):
         Returns the inserted row's ID if possible, otherwise None."""
         if len(kwargs) == 0:
             return None
-        
-        #validate safe table name and column names
-        if not _accept_unsafe:
-            if not self.is_safe_parameter(_table_name):
-                raise UnsafeQueryParameter(_table_name)
-            for column in kwargs.keys():
-                if not self.is_safe_parameter(column):
-                    raise UnsafeQueryParameter(column)
-        
-        columns = "\", \"".join(kwargs.keys())
-        questionmarks = "?" + (", ?"*(len(kwargs)-1))
-        params = tuple(kwargs.values())
-        query = f"INSERT INTO \"{_table_name}\" (\"{columns}\") VALUES ({questionmarks})"
-        
-        return await self.execute(query, params)
+        query = self._compile_statement("insert", _table_name, tuple(kwargs.keys()), _accept_unsafe)
+        return await self.execute(query, tuple(kwargs.values()))
     
     
     async def insert_many(self, table_name: str, data, column_names: tuple = None, accept_unsafe: bool = False) -> None:
@@ -317,34 +843,150 @@ class DatabaseCog(SmartCog):
             if len(data_row) != column_count:
                 raise InvalidQueryData("Mismatching amount of data given.")
         
-        #validate safe table name and column names
-        if not accept_unsafe:
-            if not self.is_safe_parameter(table_name):
-                raise UnsafeQueryParameter(table_name)
-            if column_names:
-                for column in column_names:
-                    if not self.is_safe_parameter(column):
-                        raise UnsafeQueryParameter(column)
+        columns = tuple(column_names) if column_names else column_count
+        query = self._compile_statement("insert", table_name, columns, accept_unsafe)
+        await self.execute_many(query, data)
+    
+    
+    def queue_insert(self, _table_name: str, _accept_unsafe: bool = False, /, **kwargs) -> asyncio.Future:
+        """Like insert, but the row is buffered and inserted in a single transaction along with the other rows queued for
+        the same table and columns, once insert_batch_ms passes or insert_batch_rows rows are queued.
+        Returns a future which resolves with the inserted row's ID (None for WITHOUT ROWID tables, or raises) once the row has been committed.
+        Awaiting it is optional, queued rows are flushed on unload either way.
+        Rows queued within a transaction are not part of it, they are inserted by a flush task once the transaction ends.
+        Their futures can therefore only be awaited after the transaction, awaiting them within it raises TransactionDeadlock."""
+        if len(kwargs) == 0:
+            raise InvalidQueryData("No columns given.")
         
-        columns_string = " (\"" + ("\", \"".join(column_names)) + "\")" if column_names and len(column_names) > 0 else ""
-        questionmarks = "?" + (", ?"*(column_count-1))
-        query = f"INSERT INTO \"{table_name}\"{columns_string} VALUES ({questionmarks})"
+        key = (_table_name, tuple(kwargs.keys()))
+        queue = self._insert_queues.get(key, None)
+        if queue is None:
+            query = self._compile_statement("insert", _table_name, key[1], _accept_unsafe)
+            queue = self._insert_queues[key] = _InsertQueue(_table_name, key[1], query)
         
-        await self.execute_many(query, data)
+        loop = asyncio.get_running_loop()
+        future = _QueuedInsertFuture(self, loop=loop)
+        queue.rows.append(tuple(kwargs.values()))
+        queue.futures.append(future)
+        if len(queue.rows) >= self.insert_batch_rows:
+            self._start_insert_flush(key)
+        elif queue.handle is None:
+            queue.handle = loop.call_later(self.insert_batch_window, self._start_insert_flush, key)
+        return future
+    
+    
+    def _start_insert_flush(self, key: tuple) -> None:
+        """Starts inserting the rows of a queue. Rows queued afterwards go into a new queue."""
+        queue = self._insert_queues.pop(key, None)
+        if queue is None:
+            return
+        if queue.handle is not None:
+            queue.handle.cancel()
+        task = asyncio.create_task(self._flush_insert_queue(queue))
+        #kept referenced until done
+        self._insert_flush_tasks.add(task)
+        task.add_done_callback(self._insert_flush_tasks.discard)
+    
+    
+    async def _has_rowid(self, table_name: str) -> bool:
+        """Checks if a table has a rowid, which is the case unless it was created WITHOUT ROWID."""
+        has_rowid = self._rowid_tables.get(table_name, None)
+        if has_rowid is None:
+            #unquoted, since a quoted name which isn't a column would be read as a string
+            try:
+                await self._fetch_row(self._db, f"SELECT rowid FROM \"{table_name}\" LIMIT 0")
+            except sqlite3.OperationalError as err:
+                #other errors (like a missing table) fail the insert itself
+                if "no such column" not in str(err):
+                    raise err
+                has_rowid = False
+            else:
+                has_rowid = True
+            self._rowid_tables[table_name] = has_rowid
+        return has_rowid
+    
+    
+    async def _insert_queued_rows(self, queue: _InsertQueue) -> list:
+        """Inserts the rows of a queue (within a transaction) and returns their row IDs.
+        Every row reports its own ID, since triggers and rows setting their own IDs break any guess based on the last one.
+        Rows of WITHOUT ROWID tables have no ID, so they get None."""
+        if not await self._has_rowid(queue.table_name):
+            for row in queue.rows:
+                await self._execute(queue.query, row)
+            return [None] * len(queue.rows)
+        if not _SUPPORTS_RETURNING:
+            return [await self._execute(queue.query, row) for row in queue.rows]
+        
+        query = f"{queue.query} RETURNING rowid"
+        rowids = []
+        for row in queue.rows:
+            self.write_operations += 1
+            rowids.append((await self._fetch_row(self._db, query, row))[0])
+        return rowids
+    
+    
+    async def _flush_insert_queue(self, queue: _InsertQueue) -> None:
+        start = time.perf_counter()
+        try:
+            async with self.transaction():
+                rowids = await self._insert_queued_rows(queue)
+        except Exception:
+            #inserted one by one instead, so that only the offending rows fail
+            self.failed_insert_flushes += 1
+            rowids = await asyncio.gather(*(self.execute(queue.query, row) for row in queue.rows), return_exceptions=True)
+        
+        end = time.perf_counter()
+        self.insert_flushes += 1
+        self.flushed_rows += len(queue.rows)
+        self.total_flush_time += end - start
+        self.max_flush_time = max(self.max_flush_time, end - start)
+        self.max_queued_time = max(self.max_queued_time, end - queue.queued_at)
+        
+        for future, rowid in zip(queue.futures, rowids):
+            if future.done():
+                continue
+            if isinstance(rowid, BaseException):
+                future.set_exception(rowid)
+            else:
+                future.set_result(rowid)
+    
+    
+    async def flush_inserts(self) -> None:
+        """Inserts all queued rows right away and waits for all running flushes."""
+        for key in list(self._insert_queues.keys()):
+            self._start_insert_flush(key)
+        if self._insert_flush_tasks:
+            await asyncio.gather(*self._insert_flush_tasks, return_exceptions=True)
+    
+    
+    def get_insert_queue_stats(self) -> dict:
+        """Returns statistics of the write-behind inserts (see .queue_insert).
+        Flush times are from the start of a flush until its rows are committed,
+        queued times are from the first row of a queue being queued until then."""
+        return {
+            "queues": len(self._insert_queues),
+            "pending_rows": sum(len(queue.rows) for queue in self._insert_queues.values()),
+            "running_flushes": len(self._insert_flush_tasks),
+            "flushes": self.insert_flushes,
+            "failed_flushes": self.failed_insert_flushes,
+            "flushed_rows": self.flushed_rows,
+            "avg_rows_per_flush": self.flushed_rows / self.insert_flushes if self.insert_flushes else 0.0,
+            "avg_flush_ms": self.total_flush_time / self.insert_flushes * 1000 if self.insert_flushes else 0.0,
+            "max_flush_ms": self.max_flush_time * 1000,
+            "max_queued_ms": self.max_queued_time * 1000
+        }
     
     
     async def fetch_row_by_id(self, table_name: str, rowid: int, accept_unsafe: bool = False) -> aiosqlite.Row:
         """Shorthand for fetching a row with a given rowid, usually obtained from insert operations."""
-        if not accept_unsafe and not self.is_safe_parameter(table_name):
-            raise UnsafeQueryParameter(table_name)
-        return await self.fetch_row(f"SELECT * FROM \"{table_name}\" WHERE \"rowid\"=?", (rowid,))
+        query = self._compile_statement("fetch_row_by_id", table_name, (), accept_unsafe)
+        return await self.fetch_row(query, (rowid,))
     
     
     async def fetch_row_count(self, table_name: str, accept_unsafe: bool = False) -> int:
         """Returns the number of existing rows in a given table."""
-        if not accept_unsafe and not self.is_safe_parameter(table_name):
-            raise UnsafeQueryParameter(table_name)
-        return await self.fetch_value(f"SELECT COUNT(*) FROM \"{table_name}\"")
+        query = self._compile_statement("fetch_row_count", table_name, (), accept_unsafe)
+        return await self.fetch_value(query)
     
     
     async def fetch_tables(self, include_internal_tables: bool = False) -> list:
@@ -372,5 +1014,6 @@ class DatabaseCog(SmartCog):
         """Returns a list of all column names for a given table."""
         if not accept_unsafe and not self.is_safe_parameter(table_name):
             return []
-        async with self._db.execute(f"SELECT * FROM \"{table_name}\" LIMIT 0") as cursor:
-            return [desc[0] for desc in cursor.description]
+        async with self._reading() as reader:
+            async with reader.execute(f"SELECT * FROM \"{table_name}\" LIMIT 0") as cursor:
+                return [desc[0] for desc in cursor.description]
@@ -142,8 +142,9 @@ class CasesCog(SmartCog):
         source_link: str = None,
         text: str = None,
     ) -> None:
-        """Generic method to add a case in the database."""
-        await self.bot.utils.db.insert("cases",
+        """Generic method to add a case in the database.
+        Cases are inserted in batches, this returns once the case has been committed."""
+        await self.bot.utils.db.queue_insert("cases",
             type_id = case_type_id,
             user_id = user_id,
             mod_id = mod_id,
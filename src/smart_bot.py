@@ -45,7 +45,7 @@ class SmartBot(commands.Bot):
         remove_appcommands_on_unload: bool,
         
         #if autosyncing, commands will only get appended or updated to discord, none will ever get deleted
-        #this should generally not be used, as it forces the bot to upload every other command individually instead of bulk actions
+        #this compares the defined commands with the server-side ones and only uploads the new or changed ones, each individually
         #only handy in cases when you want to use autosync but you're restarting often and don't wanna hit ratelimits for new commands
         avoid_appcommand_deletions: bool = False,
         
@@ -156,6 +156,27 @@ class SmartBot(commands.Bot):
         return logging.Formatter('[{asctime}] [{levelname:<8}] {name}: {message}', dt_fmt, style='{')
 
 
+    #override
+    async def setup_hook(self) -> None:
+        #the application id is known by now, so the persistent app command state can be loaded
+        self.tree.load_sync_state()
+        await super().setup_hook()
+
+
+    #syncs just a newly joined guild, so that it gets the commands meant for all guilds
+    async def on_guild_join(self, guild: discord.Guild):
+        if self.tree.get_all_guilds_commands() and self.is_loaded and self.autosync_appcommands:
+            self.tree.schedule_sync(guild.id, avoid_deletions=self.avoid_appcommand_deletions)
+
+    #forgets everything about a guild the bot is no longer in
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.tree.detach_guild(guild.id)
+
+    #keeps the cached permission overwrites of app commands up to date
+    async def on_raw_app_command_permissions_update(self, payload: discord.RawAppCommandPermissionsUpdateEvent):
+        self.tree.on_command_permissions_update(payload)
+
+
     #error handler that ignores some types of errors
     #ignores errors that come from user actions and handled behavior
     async def on_command_error(self, ctx: commands.Context, err: Exception):
@@ -177,6 +198,7 @@ class SmartBot(commands.Bot):
         before_quit_coro = None,
         before_full_ready_coro = None,
         console_input_coro = None,
+        sync_progress_coro = None,
         reconnect: bool = True
     ) -> bool:
         """Improved run function that lets you pass in your own
@@ -207,6 +229,11 @@ class SmartBot(commands.Bot):
         The returned value will be dispatched throughout the bot via a 'console_input' event.
         If None is returned, this will be prevented from happening.
         
+        sync_progress_coro: must be same as above. If app commands get synced on startup,
+        this coroutine is called every time a sync target (global or a guild) gets finished.
+        Four arguments are passed to this coroutine, the bot and the amount of targets
+        that are done, that have failed and that are remaining.
+        
         
 
         Relevant parts of the original description:
@@ -243,6 +270,8 @@ class SmartBot(commands.Bot):
             raise TypeError("'before_full_ready_coro' must be a coroutine.")
         if console_input_coro and not inspect.iscoroutinefunction(console_input_coro):
             raise TypeError("'console_input_coro' must be a coroutine.")
+        if sync_progress_coro and not inspect.iscoroutinefunction(sync_progress_coro):
+            raise TypeError("'sync_progress_coro' must be a coroutine.")
         
         self._custom_quit_handler = before_quit_coro
 
@@ -274,7 +303,17 @@ class SmartBot(commands.Bot):
                 await before_full_ready_coro(self)
             
             if self.should_sync_commands_on_start():
-                await self.tree.sync_all(avoid_deletions=self.avoid_appcommand_deletions, ignore_errors=True)
+                async def report_sync_progress(done: int, failed: int, remaining: int) -> None:
+                    await sync_progress_coro(self, done, failed, remaining)
+                
+                await self.tree.sync_all(
+                    avoid_deletions=self.avoid_appcommand_deletions,
+                    ignore_errors=True,
+                    progress_callback=report_sync_progress if sync_progress_coro else None
+                )
+            elif self.tree.get_interrupted_sync_targets():
+                #finish a sync that was running when the bot got killed
+                await self.tree.resume_interrupted_sync(ignore_errors=True)
 
             self.is_loaded = True
 
@@ -348,6 +387,7 @@ class SmartBot(commands.Bot):
                 print(get_exception_traceback(e))
         if self.should_sync_commands_on_quit():
             await self.tree.sync_all_defined(just_delete=True, ignore_errors=True)
+        self.tree.save_sync_state(force=True)
 
 
     #override from client
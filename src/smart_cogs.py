@@ -4,7 +4,11 @@ from discord import app_commands
 from discord.utils import MISSING
 
 import asyncio
+import inspect
+import time
+from bisect import bisect_left
 from itertools import chain
+from typing import List, Optional
 
 from smart_bot import SmartBot
 from utils.common import prevent_task_garbage_collection
@@ -38,6 +42,193 @@ class CommandPropertiesMismatch(commands.errors.ExtensionError):
 
 
 
+class AutocompleteSource:
+    """Prefix index of autocomplete choices, answering queries with a binary search over sorted keys.
+    Choices can be given up front (static) or loaded by a function, which is called again once ttl seconds pass
+    (or after .invalidate). Stale choices keep being served while they're reloaded in the background,
+    so that only the very first query ever waits for the loader.
+    Choices can be strings, (name, value) tuples or app_commands.Choice objects.
+    Matching ignores case, and if match_words is True, the starts of later words in a name match too
+    (ranked after names which start with the query).
+    Created by the @indexed_autocomplete decorator, but can also be used directly via .make_callback()."""
+    
+    def __init__(self,
+        loader = None,
+        *,
+        choices = None,
+        ttl: Optional[float] = None,
+        limit: int = 25,
+        match_words: bool = True,
+        name: Optional[str] = None
+    ):
+        self.loader = loader
+        self.ttl = ttl
+        self.limit = limit
+        self.match_words = match_words
+        self.name = name or getattr(loader, "__qualname__", None) or "static"
+        
+        self._choices: List[app_commands.Choice] = []
+        self._keys: List[str] = [] #sorted casefolded names
+        self._key_choices: List[int] = [] #index of the choice of each key
+        self._word_keys: List[str] = [] #sorted casefolded names starting from their later words
+        self._word_key_choices: List[int] = []
+        self._loaded_at: Optional[float] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        
+        #statistics, see .get_stats
+        self.queries = 0
+        self.hits = 0
+        self.total_query_time = 0.0
+        self.max_query_time = 0.0
+        self.refreshes = 0
+        self.failed_refreshes = 0
+        self.last_refresh_time = 0.0
+        
+        if choices is not None:
+            self.set_choices(choices)
+    
+    
+    @staticmethod
+    def _make_choice(choice) -> app_commands.Choice:
+        if isinstance(choice, app_commands.Choice):
+            return choice
+        if isinstance(choice, tuple):
+            return app_commands.Choice(name=str(choice[0]), value=choice[1])
+        return app_commands.Choice(name=str(choice), value=choice)
+    
+    
+    def set_choices(self, choices) -> None:
+        """Replaces all choices and rebuilds the index."""
+        built_choices = [self._make_choice(choice) for choice in choices]
+        keys = []
+        word_keys = []
+        for i, choice in enumerate(built_choices):
+            key = choice.name.casefold()
+            keys.append((key, i))
+            if self.match_words:
+                words = key.split()
+                for j in range(1, len(words)):
+                    word_keys.append((" ".join(words[j:]), i))
+        keys.sort()
+        word_keys.sort()
+        
+        #swapped in at once, so that queries never see a half-built index
+        (self._choices, self._keys, self._key_choices, self._word_keys, self._word_key_choices) = (
+            built_choices,
+            [key for key, _ in keys], [i for _, i in keys],
+            [key for key, _ in word_keys], [i for _, i in word_keys]
+        )
+        self._loaded_at = time.monotonic()
+    
+    
+    def invalidate(self) -> None:
+        """Marks the choices as stale, so that they get reloaded with the next query.
+        Static sources (without a loader) are not affected."""
+        if self.loader is not None and self._loaded_at is not None:
+            self._loaded_at = float("-inf")
+    
+    
+    def is_stale(self) -> bool:
+        """Checks if the choices should be (re)loaded before being used."""
+        if self.loader is None:
+            return False
+        if self._loaded_at is None or self._loaded_at == float("-inf"):
+            return True
+        return self.ttl is not None and time.monotonic() - self._loaded_at >= self.ttl
+    
+    
+    async def refresh(self, *args) -> None:
+        """Reloads the choices by calling the loader with the given arguments (like the cog instance).
+        The loader can be a regular function or a coroutine function. Concurrent refreshes are merged into one."""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._load(*args))
+        await asyncio.shield(self._refresh_task)
+    
+    
+    async def _load(self, *args) -> None:
+        start = time.perf_counter()
+        try:
+            choices = self.loader(*args)
+            if inspect.isawaitable(choices):
+                choices = await choices
+            self.set_choices(choices)
+        except Exception as err:
+            self.failed_refreshes += 1
+            print(f"Failed to load autocomplete choices of '{self.name}', exception: {err}")
+            return
+        self.refreshes += 1
+        self.last_refresh_time = time.perf_counter() - start
+    
+    
+    def search(self, current: str, limit: Optional[int] = None) -> List[app_commands.Choice]:
+        """Returns up to limit (or .limit) choices matching the given text, using only the current index."""
+        start = time.perf_counter()
+        limit = self.limit if limit is None else limit
+        prefix = current.casefold().strip()
+        choices = self._choices
+        results = []
+        seen = set()
+        
+        for (keys, key_choices) in ((self._keys, self._key_choices), (self._word_keys, self._word_key_choices)):
+            i = bisect_left(keys, prefix)
+            while i < len(keys) and len(results) < limit and keys[i].startswith(prefix):
+                choice_index = key_choices[i]
+                if choice_index not in seen:
+                    seen.add(choice_index)
+                    results.append(choices[choice_index])
+                i += 1
+            if len(results) >= limit or not prefix:
+                break
+        
+        elapsed = time.perf_counter() - start
+        self.queries += 1
+        self.hits += bool(results)
+        self.total_query_time += elapsed
+        self.max_query_time = max(self.max_query_time, elapsed)
+        return results
+    
+    
+    async def autocomplete(self, current: str, *args) -> List[app_commands.Choice]:
+        """Returns choices matching the given text, (re)loading them first if needed.
+        args are passed to the loader. Only the first load is waited for, later ones run in the background."""
+        if self.is_stale():
+            if self._loaded_at is None:
+                await self.refresh(*args)
+            elif self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self._load(*args))
+                prevent_task_garbage_collection(self._refresh_task)
+        return self.search(current)
+    
+    
+    def make_callback(self):
+        """Returns a coroutine function usable with @app_commands.autocomplete outside of a class.
+        The loader (if any) is called without arguments."""
+        async def callback(interaction: discord.Interaction, current: str) -> List[app_commands.Choice]:
+            return await self.autocomplete(current)
+        return callback
+    
+    
+    def get_stats(self) -> dict:
+        """Returns the statistics of this source: number of choices, queries, hit rate (queries with any results),
+        average and maximum query time in milliseconds, and the amount and duration of refreshes."""
+        return {
+            "choices": len(self._choices),
+            "queries": self.queries,
+            "hit_rate": self.hits / self.queries if self.queries else 0.0,
+            "avg_ms": self.total_query_time / self.queries * 1000 if self.queries else 0.0,
+            "max_ms": self.max_query_time * 1000,
+            "refreshes": self.refreshes,
+            "failed_refreshes": self.failed_refreshes,
+            "last_refresh_ms": self.last_refresh_time * 1000
+        }
+    
+    
+    def __repr__(self) -> str:
+        return f"<AutocompleteSource {self.name} choices={len(self._choices)} queries={self.queries}>"
+
+
+
+
 class SmartCog(commands.Cog):
     """
     Special custom class attributes:
@@ -53,7 +244,9 @@ class SmartCog(commands.Cog):
     .get_hybrid_commands() -> list
     .get_app_commands_including_hybrid() -> list
     .get_app_commands_including_from_hybrid() -> list
+    .get_all_commands_for_all_guilds() -> list
     .get_only_classic_commands() -> list
+    .get_autocomplete_sources() -> dict
 
     Hidden attributes/functions:
     ._loaded_on_startup
@@ -80,9 +273,8 @@ class SmartCog(commands.Cog):
         #apply custom decorator effects to app/hybrid/classic commands
         for cmd in self.get_all_commands():
             #apply decorators even if it's not a pure app command
-            if cmd.extras.get("__smartcog_command_for_all_guilds__", False):
-                app_commands.guilds(*self.bot.guilds)(cmd)
-            elif cmd.extras.get("__smartcog_command_for_main_guild__", False):
+            #(the guilds of commands for all guilds are managed by the tree, see below)
+            if cmd.extras.get("__smartcog_command_for_main_guild__", False) and not cmd.extras.get("__smartcog_command_for_all_guilds__", False):
                 app_commands.guilds(self.bot.main_server_id)(cmd)
             if cmd.extras.get("__smartcog_command_guild_only__", False):
                 app_commands.guild_only(cmd)
@@ -108,10 +300,20 @@ class SmartCog(commands.Cog):
                         cmd.__discord_app_commands_guild_only__ = guild_only
                         app_commands.guild_only(appcmd)
         
+        #commands for all guilds are stored once in the tree as templates, which also cover guilds joined later
+        for cmd in self.get_all_commands_for_all_guilds():
+            appcmd = cmd.app_command if getattr(cmd, "__commands_is_hybrid__", False) else cmd
+            if isinstance(appcmd, (app_commands.Command, app_commands.Group, app_commands.ContextMenu)):
+                self.bot.tree.register_all_guilds_command(appcmd)
+        
         #apply efects of previous decorators to classical/hybrid commands
         for cmd in self.get_commands():
             guild_ids = getattr(cmd, "__discord_app_commands_default_guilds__", None)
             guild_only = getattr(cmd, "__discord_app_commands_guild_only__", False)
+            if cmd.extras.get("__smartcog_command_for_all_guilds__", False):
+                #allowed in any guild the bot is in, including ones joined later
+                guild_ids = None
+                guild_only = True
             if guild_ids or guild_only:
                 for walkedcmd in chain([cmd], cmd.walk_commands() if getattr(cmd, "walk_commands", None) else []):
                     allowed_contexts(guild_ids, guild_only)(walkedcmd)
@@ -142,11 +344,11 @@ class SmartCog(commands.Cog):
         Syncs app commands and runs all functions decorated to run on ready in this cog."""
         #sync guilds with appcommands from this cog
         #cannot be done on cog_load because the commands aren't registered yet
+        #the sync is debounced, so that reloading multiple cogs at once only syncs every guild once
         if not self._loaded_on_startup and self.bot.autosync_appcommands:
-            await self.bot.tree.sync_given(
+            await self.bot.tree.schedule_sync_given(
                 *self.get_app_commands_including_from_hybrid(),
-                avoid_deletions=self.bot.avoid_appcommand_deletions,
-                ignore_errors=True
+                avoid_deletions=self.bot.avoid_appcommand_deletions
             )
         
         #run @run_when_ready decorated functions
@@ -159,10 +361,31 @@ class SmartCog(commands.Cog):
     
     
     
+    #override
+    async def _eject(self, bot: SmartBot, guild_ids):
+        if self.bot.is_loaded and not self.bot.is_quitting and self.bot.remove_appcommands_on_unload and not self.bot.avoid_appcommand_deletions:
+            #scheduled while commands for all guilds still resolve to every guild, the sync itself runs once they're gone from the tree
+            #not awaited, so that a reload can schedule its load sync within the same quiet window
+            self.bot.tree.schedule_sync_given(*self.get_app_commands_including_from_hybrid())
+        #commands for all guilds have every guild as their guilds, which would make discord.py remove them from the tree once per guild
+        #instead, each template is dropped once here and the command is left without guilds to remove it from
+        if not guild_ids:
+            for cmd in self.get_all_commands_for_all_guilds():
+                appcmd = cmd.app_command if getattr(cmd, "__commands_is_hybrid__", False) else cmd
+                if appcmd is not None:
+                    self.bot.tree.unregister_all_guilds_command(appcmd)
+                    appcmd._guild_ids = []
+        await super()._eject(bot, guild_ids)
+    
+    
+    
     #automatically called when unloading. if overridden, must call `await super().cog_unload()` at the end
     async def cog_unload(self):
-        if self.bot.is_loaded and not self.bot.is_quitting and self.bot.remove_appcommands_on_unload and not self.bot.avoid_appcommand_deletions:
-            await self.bot.tree.unsync_given(*self.get_app_commands_including_from_hybrid(), ignore_errors=True)
+        for cmd in self.get_all_commands_for_all_guilds():
+            appcmd = cmd.app_command if getattr(cmd, "__commands_is_hybrid__", False) else cmd
+            if appcmd is not None:
+                self.bot.tree.unregister_all_guilds_command(appcmd)
+        #the sync removing the commands from Discord is scheduled by ._eject
         await super().cog_unload()
     
     
@@ -183,10 +406,24 @@ class SmartCog(commands.Cog):
         """Returns a list of app commands defined in this cog. From hybrid commands, the inner app command is returned."""
         return [cmd.app_command for cmd in self.get_hybrid_commands() if cmd.app_command] + self.get_app_commands()
     
+    def get_all_commands_for_all_guilds(self) -> list:
+        """Returns all classic, hybrid and app commands marked with @for_all_guilds."""
+        return [cmd for cmd in self.get_all_commands() if cmd.extras.get("__smartcog_command_for_all_guilds__", False)]
+    
     def get_only_classic_commands(self) -> list:
         """Returns a list of all classic commands defined in this cog. Hybrid commands are ignored."""
         return [cmd for cmd in self.get_commands() if not getattr(cmd, "__commands_is_hybrid__", False)]
     
+    def get_autocomplete_sources(self) -> dict:
+        """Returns all autocomplete sources made by @indexed_autocomplete in this cog, by the name of their callback."""
+        results = {}
+        for cls in reversed(type(self).__mro__):
+            for name, value in cls.__dict__.items():
+                source = getattr(value, "__smartcog_autocomplete_source__", None)
+                if source is not None:
+                    results[name] = source
+        return results
+    
     
 
 ##################################################
@@ -270,6 +507,30 @@ def guilds_only(cmd):
     return cmd
 
 
+#DECORATOR for cog methods
+def indexed_autocomplete(*, ttl: Optional[float] = None, limit: int = 25, match_words: bool = True):
+    """Turns a cog method returning all possible choices into an autocomplete callback for @app_commands.autocomplete,
+    which answers from a prefix index instead of scanning the choices on every keystroke (see AutocompleteSource).
+    The method gets called with just the cog instance the first time it's needed, then again once ttl seconds pass
+    (never if None) or after .autocomplete_source.invalidate() is called. It can also be a coroutine
+    (like when loading the choices from the database).
+    The source is available as .autocomplete_source on the resulting callback and via SmartCog.get_autocomplete_sources."""
+    def decorator(func):
+        source = AutocompleteSource(func, ttl=ttl, limit=limit, match_words=match_words)
+        
+        async def callback(_self, interaction: discord.Interaction, current: str) -> List[app_commands.Choice]:
+            return await source.autocomplete(current, _self)
+        
+        #not functools.wraps, since discord.py would check the signature of __wrapped__ instead of the callback's
+        for attr in ("__module__", "__name__", "__qualname__", "__doc__"):
+            setattr(callback, attr, getattr(func, attr))
+        callback.__smartcog_autocomplete_source__ = source
+        callback.autocomplete_source = source
+        return callback
+    
+    return decorator
+
+
 #DECORATOR for any command
 def run_when_ready(func):
     """Decorator for marking a cog coroutine to be executed when the cog is fully ready."""
@@ -1,13 +1,26 @@
 import discord
-from discord.app_commands import AppCommand, Command, Group, ContextMenu
+from discord.app_commands import AppCommand, Command, Group, ContextMenu, GuildAppCommandPermissions
 from discord.ext.commands.hybrid import HybridAppCommand
-from discord.app_commands.errors import MissingApplicationID
-from discord.utils import MISSING
+from discord.app_commands.errors import MissingApplicationID, CommandAlreadyRegistered, CommandNotFound, CommandSignatureMismatch, AppCommandError
+from discord.app_commands.namespace import Namespace, ResolveKey
+from discord.utils import MISSING, _get_as_snowflake
 
-from typing import Optional, Union, List, Dict, Set
+from typing import Optional, Union, List, Dict, Set, Tuple
 from collections.abc import Iterable
 
+import os
+import sys
+import json
+import time
+import enum
+import asyncio
+import hashlib
 from itertools import chain
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.persistence import load_json_file, save_json_file, append_json_lines, load_json_lines, delete_file
+from custom_errors import InvalidAppCommands
 
 
 """
@@ -35,6 +48,313 @@ max 100 permission overwrites (enable or disable commands for up to 100 users, r
 ClientsideAppCommand = Union[Command, HybridAppCommand, Group, ContextMenu]
 AnyCommand = Union[ClientsideAppCommand, AppCommand]
 
+#limits from above, checked before syncing, see SmartCommandTree.validate_payload
+_MAX_COMMANDS_PER_TYPE = {
+    discord.AppCommandType.chat_input.value: 100,
+    discord.AppCommandType.user.value: 5,
+    discord.AppCommandType.message.value: 5
+}
+_MAX_NAME_LENGTH = 32
+_MAX_DESCRIPTION_LENGTH = 100
+_MAX_OPTIONS = 25
+_MAX_CHOICES = 25
+_MAX_CHOICE_LENGTH = 100
+_SUBCOMMAND_OPTION_TYPES = (1, 2) #subcommand, subcommand group
+
+#values of clientside payload fields which Discord may leave out of its own payloads
+_PAYLOAD_DEFAULT_VALUES = (None, False, [], {}, "")
+
+#key for the global ratelimit in SmartCommandTree._ratelimited_until, which otherwise uses sync targets as keys
+_GLOBAL_RATELIMIT = "global"
+#payload fields kept per command by CompactAppCommand, the rest of a payload is shared between identical commands
+_COMPACT_RECORD_KEYS = ("id", "guild_id", "version")
+#objects visited by SmartCommandTree.measure_cache_memory between yields to the event loop
+_MEMORY_WALK_CHUNK = 5000
+
+
+class _SharedPayload:
+    """Part of a server-side payload shared by every CompactAppCommand with identical contents
+    (everything except the id, guild id and version), counting how many records reference it."""
+    
+    __slots__ = ("key", "payload", "references")
+    
+    def __init__(self, key: str, payload: dict):
+        self.key = key
+        self.payload = payload
+        self.references = 0
+    
+    def __repr__(self) -> str:
+        return f"<_SharedPayload name={self.payload.get('name')!r} references={self.references}>"
+
+
+
+class CompactAppCommand:
+    """Slim record of a cached server-side command, stored instead of a full AppCommand in the compact cache mode
+    (see SmartCommandTree.set_compact_cache). Only the id, guild id and version are kept per command, the rest
+    of its payload is shared with all other cached commands with identical contents (like the same command synced
+    to many guilds). The shared part must not be modified."""
+    
+    __slots__ = ("id", "guild_id", "version", "shared")
+    
+    def __init__(self, cmd_id: int, guild_id: Optional[int], version: Optional[int], shared: _SharedPayload):
+        self.id = cmd_id
+        self.guild_id = guild_id
+        self.version = version
+        self.shared = shared
+    
+    @property
+    def name(self) -> str:
+        return self.shared.payload["name"]
+    
+    @property
+    def type(self) -> discord.AppCommandType:
+        return discord.AppCommandType(self.shared.payload.get("type", discord.AppCommandType.chat_input.value))
+    
+    @property
+    def payload(self) -> dict:
+        """The payload received from Discord, rebuilt from the shared part."""
+        payload = dict(self.shared.payload)
+        payload["id"] = str(self.id)
+        if self.guild_id is not None:
+            payload["guild_id"] = str(self.guild_id)
+        if self.version is not None:
+            payload["version"] = str(self.version)
+        return payload
+    
+    def __repr__(self) -> str:
+        return f"<CompactAppCommand id={self.id} name={self.name!r} type={self.type!r} guild_id={self.guild_id}>"
+
+
+
+class _LazyAppCommandDict(dict):
+    """Dictionary holding AppCommands, in which any value that isn't an AppCommand yet
+    gets turned into one by the given loader function the first time it's accessed.
+    Values that are CompactAppCommands are turned into AppCommands on every access, but are never replaced by them."""
+    
+    __slots__ = ("_loader",)
+    
+    def __init__(self, loader):
+        super().__init__()
+        self._loader = loader
+    
+    def _materialize(self, key, value) -> AppCommand:
+        if not isinstance(value, AppCommand):
+            keep = not isinstance(value, CompactAppCommand)
+            value = self._loader(value)
+            if keep:
+                dict.__setitem__(self, key, value)
+        return value
+    
+    def __getitem__(self, key) -> AppCommand:
+        return self._materialize(key, dict.__getitem__(self, key))
+    
+    def get(self, key, default = None):
+        if not dict.__contains__(self, key):
+            return default
+        return self[key]
+    
+    def pop(self, key, *default):
+        if not dict.__contains__(self, key):
+            return dict.pop(self, key, *default)
+        value = self[key]
+        dict.pop(self, key)
+        return value
+    
+    def pop_raw(self, key, *default):
+        """Pops a value without turning it into an AppCommand."""
+        return dict.pop(self, key, *default)
+    
+    def values(self) -> list:
+        return [self[key] for key in list(dict.keys(self))]
+    
+    def items(self) -> list:
+        return [(key, self[key]) for key in list(dict.keys(self))]
+    
+    def iter_raw_items(self):
+        """Iterates over the items without turning values into AppCommands."""
+        return dict.items(self)
+
+
+
+class _AllGuildIds:
+    """Live, read-only collection of the ids of all guilds the client is in.
+    Used as the guilds of template commands (see SmartCommandTree.register_all_guilds_command),
+    so that they don't need to hold a list of every guild."""
+    
+    __slots__ = ("_client",)
+    
+    def __init__(self, client):
+        self._client = client
+    
+    def __iter__(self):
+        return iter([guild.id for guild in self._client.guilds])
+    
+    def __len__(self) -> int:
+        return len(self._client.guilds)
+    
+    def __contains__(self, guild_id) -> bool:
+        return isinstance(guild_id, int) and self._client.get_guild(guild_id) is not None
+    
+    def __bool__(self) -> bool:
+        #never empty in the sense of being global
+        return True
+    
+    def __repr__(self) -> str:
+        return "<all guilds>"
+
+
+
+class DeltaSyncReport:
+    """Report of what has been sent to Discord during a delta sync of a single target (guild id or None for global).
+    Lists hold the names of commands for which the given action was made.
+    deferred: True if nothing was sent, since the creations wouldn't fit into the remaining creation budget of the target."""
+    
+    __slots__ = ("guild_id", "fetched", "deferred", "created", "edited", "deleted", "unchanged", "failed")
+    
+    def __init__(self, guild_id: Optional[int]):
+        self.guild_id = guild_id
+        self.fetched = False
+        self.deferred = False
+        self.created: List[str] = []
+        self.edited: List[str] = []
+        self.deleted: List[str] = []
+        self.unchanged: List[str] = []
+        self.failed: List[str] = []
+    
+    @property
+    def requests_made(self) -> int:
+        """Total number of requests made (including failed ones)."""
+        return int(self.fetched) + len(self.created) + len(self.edited) + len(self.deleted) + len(self.failed)
+    
+    def __repr__(self) -> str:
+        return (
+            f"<DeltaSyncReport guild_id={self.guild_id} fetched={self.fetched} deferred={self.deferred} created={self.created} "
+            f"edited={self.edited} deleted={self.deleted} unchanged={len(self.unchanged)} failed={self.failed}>"
+        )
+
+
+
+class AppCommandsSyncDiff:
+    """Changes of the cached server-side commands of a single target (guild id or None for global) made by a sync,
+    dispatched with the 'app_commands_synced' event. Lists hold AppCommands, the removed ones as they were before the sync.
+    previously_cached: False if the target wasn't cached before the sync, in which case everything counts as added."""
+    
+    __slots__ = ("guild_id", "previously_cached", "added", "edited", "removed")
+    
+    def __init__(self, guild_id: Optional[int], previously_cached: bool):
+        self.guild_id = guild_id
+        self.previously_cached = previously_cached
+        self.added: List[AppCommand] = []
+        self.edited: List[AppCommand] = []
+        self.removed: List[AppCommand] = []
+    
+    def __bool__(self) -> bool:
+        return bool(self.added or self.edited or self.removed)
+    
+    def __repr__(self) -> str:
+        return (
+            f"<AppCommandsSyncDiff guild_id={self.guild_id} previously_cached={self.previously_cached} "
+            f"added={[cmd.name for cmd in self.added]} edited={[cmd.name for cmd in self.edited]} removed={[cmd.name for cmd in self.removed]}>"
+        )
+
+
+
+
+class TargetSyncPlan:
+    """Estimate of what a sync of a single target (guild id or None for global) would send to Discord.
+    Lists hold the names of commands for which the given action would be made. If the target isn't cached,
+    its server-side state is unknown, so every defined command is counted as created (worst case).
+    Targets exceeding Discord's limits (violations) or the remaining creation budget (deferred) wouldn't be synced at all."""
+    
+    __slots__ = ("guild_id", "cached", "skipped", "violations", "deferred", "requests", "created", "edited", "deleted", "unchanged")
+    
+    def __init__(self, guild_id: Optional[int], cached: bool):
+        self.guild_id = guild_id
+        self.cached = cached
+        self.skipped = False
+        self.violations: List[CommandLimitViolation] = []
+        self.deferred = False
+        self.requests = 0
+        self.created: List[str] = []
+        self.edited: List[str] = []
+        self.deleted: List[str] = []
+        self.unchanged: List[str] = []
+    
+    def __repr__(self) -> str:
+        return (
+            f"<TargetSyncPlan guild_id={self.guild_id} cached={self.cached} skipped={self.skipped} "
+            f"violations={len(self.violations)} deferred={self.deferred} requests={self.requests} "
+            f"created={self.created} edited={self.edited} deleted={self.deleted} unchanged={len(self.unchanged)}>"
+        )
+
+
+
+class SyncPlan:
+    """Estimate of what a sync strategy (like "sync_all") would send to Discord, made of one TargetSyncPlan per target."""
+    
+    __slots__ = ("strategy", "targets")
+    
+    def __init__(self, strategy: str):
+        self.strategy = strategy
+        self.targets: Dict[Optional[int], TargetSyncPlan] = {}
+    
+    @property
+    def requests(self) -> int:
+        """Total number of requests that would be made."""
+        return sum(target.requests for target in self.targets.values())
+    
+    @property
+    def creations(self) -> int:
+        """Total number of commands that would be newly created, which count against Discord's daily creation limit."""
+        return sum(len(target.created) for target in self.targets.values())
+    
+    @property
+    def skipped(self) -> int:
+        """Number of targets that are already up to date, so they wouldn't need any request."""
+        return sum(1 for target in self.targets.values() if target.requests == 0 and not target.violations and not target.deferred)
+    
+    @property
+    def invalid(self) -> int:
+        """Number of targets that wouldn't be synced, since their commands exceed Discord's limits."""
+        return sum(1 for target in self.targets.values() if target.violations)
+    
+    @property
+    def deferred(self) -> int:
+        """Number of targets that would be deferred, since they'd create more commands than their remaining creation budget allows."""
+        return sum(1 for target in self.targets.values() if target.deferred)
+    
+    @property
+    def uncached(self) -> int:
+        """Number of targets with unknown server-side state, for which the creations are only a worst-case estimate."""
+        return sum(1 for target in self.targets.values() if not target.cached)
+    
+    def __repr__(self) -> str:
+        return (
+            f"<SyncPlan strategy={self.strategy!r} targets={len(self.targets)} requests={self.requests} "
+            f"creations={self.creations} skipped={self.skipped} invalid={self.invalid} deferred={self.deferred} uncached={self.uncached}>"
+        )
+
+
+class CommandLimitViolation:
+    """A single way in which a command payload exceeds Discord's limits, found before syncing it.
+    command is the name of the offending command (None if the whole target is affected)
+    and path points to the offending field, like "ban.options.reason.description"."""
+    
+    __slots__ = ("guild_id", "command", "path", "message")
+    
+    def __init__(self, guild_id: Optional[int], command: Optional[str], path: str, message: str):
+        self.guild_id = guild_id
+        self.command = command
+        self.path = path
+        self.message = message
+    
+    def __str__(self) -> str:
+        return f"{self.path}: {self.message}" if self.path else self.message
+    
+    def __repr__(self) -> str:
+        return f"<CommandLimitViolation guild_id={self.guild_id} command={self.command!r} path={self.path!r} message={self.message!r}>"
+
+
 
 #local utility function
 def unpack_guild_object(guild) -> tuple:
@@ -51,132 +371,1518 @@ class SmartCommandTree(discord.app_commands.CommandTree):
     def __init__(self, *args, fallback_to_global: bool = False, **kwargs):
         super().__init__(*args, fallback_to_global=fallback_to_global, **kwargs)
         
-        #the cache will only be populated after syncing, unless populated explicitly
-        #the only time this can de-sync is when a method on the AppCommand object itself is called, bypassing the tree
-        self.app_commands_cache: Dict[int, AppCommand] = {} #command id : command
-        #[type][guild id or none][command name] = command
-        self.app_commands_cache_structured: Dict[discord.AppCommandType, Dict[Union[int, None], Dict[str, AppCommand]]] = {
-            cmd_type: {} for cmd_type in discord.AppCommandType
-        }
-
+        #the cache will only be populated after syncing, unless populated explicitly
+        #the only time this can de-sync is when a method on the AppCommand object itself is called, bypassing the tree
+        #values of both caches can also be AppCommand ids, which get turned into AppCommands lazily once accessed
+        #(this happens to commands loaded from the cache snapshot)
+        self.app_commands_cache: Dict[int, AppCommand] = _LazyAppCommandDict(self._materialize_app_command) #command id : command
+        #[type][guild id or none][command name] = command
+        self.app_commands_cache_structured: Dict[discord.AppCommandType, Dict[Union[int, None], Dict[str, AppCommand]]] = {
+            cmd_type: {} for cmd_type in discord.AppCommandType
+        }
+        #command id : raw payload received from Discord (except for CompactAppCommands, which rebuild their payloads)
+        self._app_command_payloads: Dict[int, dict] = {}
+        #in the compact mode, both caches hold CompactAppCommands instead of AppCommands, see .set_compact_cache
+        self._compact_cache = False
+        self._shared_payloads: Dict[str, _SharedPayload] = {} #canonical json : shared part of CompactAppCommand payloads
+        
+        #index of clientside commands, mirroring the structure of the AppCommand cache
+        #[type][guild id or none][command name] = command, kept up to date by add_command/remove_command/clear_commands
+        #locations without commands are never kept here
+        self.client_commands_structured: Dict[discord.AppCommandType, Dict[Union[int, None], Dict[str, ClientsideAppCommand]]] = {
+            cmd_type: {} for cmd_type in discord.AppCommandType
+        }
+        self._cached_targets: Set[Optional[int]] = set() #guild ids (or None for global) for which the cache is complete
+        #command id : (guild id or None, type, name) of every AppCommand seen in any sync or fetch, even if evicted from the cache
+        self.app_command_locations: Dict[int, tuple] = {}
+        #command id : time.monotonic() until which the id is known not to resolve to any AppCommand
+        self._unknown_command_ids: Dict[int, float] = {}
+        self.unknown_command_id_ttl = 300.0
+        #mention strings of every cached slash command and its subcommands, kept up to date along with the cache
+        #(qualified name, guild id or None) : "</qualified name:command id>"
+        self.command_mentions: Dict[tuple, str] = {}
+        self._command_mention_keys: Dict[int, List[tuple]] = {} #command id : keys of its mentions
+        #cached commands of targets being synced as they were before the sync, see ._recording_sync_diff
+        #guild id or None : {(type, name) : (AppCommand, payload) or None}
+        self._sync_diff_baselines: Dict[Optional[int], Dict[tuple, Optional[tuple]]] = {}
+        self._sync_diff_depths: Dict[Optional[int], int] = {}
+        self._sync_diff_previously_cached: Dict[Optional[int], bool] = {}
+        
+        #permission overwrites of commands (or of the whole application) per guild, see .get_command_permissions
+        #guild id : {command id or application id : permissions}, targets without any overwrites aren't stored
+        self._command_permissions: Dict[int, Dict[int, GuildAppCommandPermissions]] = {}
+        self._permissions_cached_guilds: Set[int] = set() #guilds whose overwrites have all been fetched
+        #guild id : targets whose overwrites have changed since they were fetched, according to gateway events
+        self._stale_command_permissions: Dict[int, Set[int]] = {}
+        
+        #persistent state, saved in the bot's data directory and loaded once the application id is known
+        #the AppCommand cache snapshot lets the cache be used right after a restart, without any fetches
+        #digests of the last successfully synced payloads let syncs of unchanged targets be skipped, even across restarts
+        self.cache_snapshot_file = "appcommands_cache_snapshot.json"
+        self.sync_digests_file = "appcommands_sync_digests.json"
+        self._synced_digests: Dict[Optional[int], str] = {} #guild id or None for global : digest
+        self._sync_state_loaded = False
+        self._sync_state_dirty = False
+        self._cache_snapshot_dirty = False
+        self._sync_state_saving_deferred = 0
+        #the files are written on a background thread, at most once per this many seconds, see .save_sync_state
+        self.sync_state_save_delay = 1.0
+        self._sync_state_save_handle: Optional[asyncio.TimerHandle] = None
+        self._persistence_executor: Optional[ThreadPoolExecutor] = None
+        #while saving is deferred, every synced target is also appended to this journal right away,
+        #so that a killed process can pick up where it left off, see .resume_interrupted_sync
+        self.sync_journal_file = "appcommands_sync_journal.jsonl"
+        self._active_sync_journal_runs: Set[str] = set()
+        self._sync_journal_buffer: List[dict] = [] #records written together once the current loop iteration ends
+        #targets whose cached commands were lost along with a killed process, refetched by .resume_interrupted_sync
+        self._journal_refetch_targets: Set[Optional[int]] = set()
+        self._sync_journal_dirty = False
+        self._interrupted_sync_targets: Dict[Optional[int], bool] = {} #guild id or None for global : just_delete
+        
+        #commands created within the last day per target, which count against Discord's daily creation limit
+        #creation times are taken from the command ids, so commands created by anything else are counted too once seen
+        self.creation_quota_file = "appcommands_creation_quota.json"
+        self.daily_creation_limit = 200
+        self.creation_window = 86400.0
+        self._command_creations: Dict[Optional[int], Dict[int, float]] = {} #guild id or None for global : {command id : unix time}
+        self._creation_quota_dirty = False
+        self.deferred_sync_targets: Set[Optional[int]] = set() #targets left out of syncs because of the creation budget
+        
+        #syncs and fetches of multiple targets are ran concurrently, up to these amounts at once
+        self.max_concurrent_syncs = 8
+        self.max_concurrent_fetches = 8
+        #fetches currently in progress, shared by everyone fetching the same target at the same time
+        self._inflight_fetches: Dict[Optional[int], asyncio.Future] = {}
+        #ratelimited sync requests are retried up to this amount of times, with exponential backoff
+        self.sync_max_retries = 5
+        self.sync_retry_base_delay = 1.0
+        self._ratelimited_until: Dict[Optional[Union[int, str]], float] = {} #target (or _GLOBAL_RATELIMIT) : loop time
+        
+        #payloads made by .to_dict() are reused until the tree changes, see .get_command_payload
+        #targets with the exact same commands also share the payload list and its digest
+        #commands can be modified in place, so cached payloads are only trusted within the epoch they were checked in,
+        #which lasts for a single bulk operation (see ._reusing_payloads) or for a single call outside of one
+        self._command_payload_cache: Dict[int, tuple] = {} #id(command) : (command, payload, epoch)
+        self._target_payload_cache: Dict[tuple, tuple] = {} #ids of commands : (payload list, digest, epoch)
+        self._payload_epoch = 0
+        self._reusing_payloads_depth = 0
+        #limit violations found in payload lists, which only depend on the payloads themselves
+        self._payload_violations_cache: Dict[str, List[tuple]] = {} #digest : [(command name, path, message)]
+        
+        #commands that belong to every guild the bot is in (see .register_all_guilds_command), keyed by (type, name)
+        #once added to the tree, they're stored just once as templates, which every guild the bot is in resolves to
+        self._all_guilds_commands: Dict[tuple, ClientsideAppCommand] = {}
+        self._all_guild_ids = _AllGuildIds(self.client)
+        self._template_commands: Dict[str, ClientsideAppCommand] = {} #name : slash command or group
+        self._template_context_menus: Dict[tuple, ClientsideAppCommand] = {} #(name, type value) : context menu
+        
+        #reports from the last delta sync, which is used instead of syncing individually when avoiding deletions
+        self.last_delta_sync_reports: Dict[Optional[int], DeltaSyncReport] = {}
+        
+        #syncs scheduled by .schedule_sync_given are collected and ran together once no new ones came in for this many seconds
+        self.sync_debounce_delay = 2.0
+        self._scheduled_sync_targets: Set[Optional[int]] = set() #targets to fully sync
+        self._scheduled_delta_commands: Dict[Optional[int], Optional[List[ClientsideAppCommand]]] = {} #target : commands to delta sync (None for all)
+        self._scheduled_sync_future: Optional[asyncio.Future] = None
+        self._scheduled_sync_handle: Optional[asyncio.TimerHandle] = None
+        self._running_scheduled_sync_future: Optional[asyncio.Future] = None
+        self._scheduled_sync_task: Optional[asyncio.Task] = None #kept to prevent garbage collection
+
+    
+    
+    #custom
+    @staticmethod
+    def get_command_type(cmd: AnyCommand) -> discord.AppCommandType:
+        """Returns the type of the command as AppCommandType. Can be chat_input, user or message."""
+        return getattr(cmd, "type", discord.AppCommandType.chat_input)
+    
+    
+    #custom
+    @staticmethod
+    def get_command_locations(cmd: AnyCommand) -> List[Optional[int]]:
+        """Returns a list of guild ids (or [None] for global) for which a given command is defined."""
+        #server-side AppCommands
+        guild_id = getattr(cmd, "guild_id", MISSING)
+        if guild_id is not MISSING:
+            return [guild_id]
+        
+        #clientside app commands
+        guild_ids = getattr(cmd, "_guild_ids", None)
+        if not guild_ids: #also checks empty list
+            return [None]
+        return guild_ids
+    
+    
+    #custom
+    @classmethod
+    def get_command_keys(cls, cmd: AnyCommand) -> List[tuple]:
+        """Returns the keys (type, name, guild id or None for global) of a command in every location it's defined in.
+        These keys are used by the clientside command index."""
+        cmd_type = cls.get_command_type(cmd)
+        return [(cmd_type, cmd.name, guild_id) for guild_id in cls.get_command_locations(cmd)]
+    
+    
+    #custom
+    @classmethod
+    def equal_commands(cls, cmd1: AnyCommand, cmd2: AnyCommand) -> bool:
+        """Checks if 2 given commands are equal. This can compare clientside and serverside commands at the same time."""
+        if cmd1.name != cmd2.name:
+            return False
+        
+        if cls.get_command_type(cmd1) != cls.get_command_type(cmd2):
+            return False
+        
+        #check guild overlap
+        return not set(cls.get_command_locations(cmd1)).isdisjoint(cls.get_command_locations(cmd2))
+    
+    
+    #custom
+    @classmethod
+    def get_equal_command_from(cls, command: AnyCommand, iterable: Iterable[AnyCommand]) -> Optional[AnyCommand]:
+        """Returns a matching command from the given iterable, or None if not found.
+        To find a matching clientside command from this tree, use .get_equal_client_command instead."""
+        for cmd in iterable:
+            if cls.equal_commands(command, cmd):
+                return cmd
+        return None
+    
+    #custom
+    @classmethod
+    def get_equal_commands_from(cls, command: AnyCommand, iterable: Iterable[AnyCommand]) -> List[AnyCommand]:
+        """Returns a list of matching commands from the given iterable.
+        To find matching clientside commands from this tree, use .get_equal_client_commands instead."""
+        return [cmd for cmd in iterable if cls.equal_commands(command, cmd)]
+    
+    
+    #custom
+    def get_client_command(self,
+        cmd_name: str,
+        guild_id: Optional[int],
+        cmd_type: discord.AppCommandType = discord.AppCommandType.chat_input
+    ) -> Optional[ClientsideAppCommand]:
+        """Returns a clientside command by name, type and guild (global if None) using the clientside command index.
+        Template commands are returned for every guild the bot is in."""
+        cmd = self.client_commands_structured[cmd_type].get(guild_id, {}).get(cmd_name, None)
+        if cmd is None and guild_id is not None:
+            cmd = self._get_template_command(cmd_name, cmd_type)
+            if cmd is not None and guild_id not in self._all_guild_ids:
+                return None
+        return cmd
+    
+    
+    #custom
+    def _get_template_command(self, cmd_name: str, cmd_type: discord.AppCommandType) -> Optional[ClientsideAppCommand]:
+        """Returns a template command by name and type, or None if not found."""
+        if cmd_type == discord.AppCommandType.chat_input:
+            return self._template_commands.get(cmd_name, None)
+        return self._template_context_menus.get((cmd_name, cmd_type.value), None)
+    
+    
+    #custom
+    def get_equal_client_command(self, command: AnyCommand) -> Optional[ClientsideAppCommand]:
+        """Returns a clientside command from this tree that is equal to the given one (see .equal_commands), or None if not found."""
+        for (cmd_type, name, guild_id) in self.get_command_keys(command):
+            cmd = self.get_client_command(name, guild_id, cmd_type)
+            if cmd is not None:
+                return cmd
+        return None
+    
+    
+    #custom
+    def get_equal_client_commands(self, command: AnyCommand) -> List[ClientsideAppCommand]:
+        """Returns a list of clientside commands from this tree that are equal to the given one (see .equal_commands)."""
+        results = []
+        for (cmd_type, name, guild_id) in self.get_command_keys(command):
+            cmd = self.get_client_command(name, guild_id, cmd_type)
+            if cmd is not None and cmd not in results:
+                results.append(cmd)
+        return results
+    
+    
+    #custom
+    def _index_client_command(self, cmd_type: discord.AppCommandType, name: str, guild_id: Optional[int]) -> None:
+        """Updates the clientside command index entry for a given key, based on what's actually stored in the tree.
+        Template commands are never indexed per guild."""
+        if cmd_type == discord.AppCommandType.chat_input:
+            if guild_id is None:
+                cmd = self._global_commands.get(name, None)
+            else:
+                cmd = self._guild_commands.get(guild_id, {}).get(name, None)
+        else:
+            cmd = self._context_menus.get((name, guild_id, cmd_type.value), None)
+        guilds_with_commands_of_type = self.client_commands_structured[cmd_type]
+        if cmd is not None:
+            guilds_with_commands_of_type.setdefault(guild_id, {})[name] = cmd
+            return
+        commands = guilds_with_commands_of_type.get(guild_id, None)
+        if commands is not None:
+            commands.pop(name, None)
+            if not commands:
+                #only locations with some commands are kept in the index
+                del guilds_with_commands_of_type[guild_id]
+    
+    
+    #override
+    def add_command(self, command, /, *, guild = MISSING, guilds = MISSING, override: bool = False) -> None:
+        """Adds a command to the tree (see the original discord.py documentation) and to the clientside command index.
+        Commands registered with .register_all_guilds_command are stored as templates instead, unless added to specific guilds."""
+        cmd_type = self.get_command_type(command)
+        if guild is MISSING and guilds is MISSING and self._all_guilds_commands.get((cmd_type, command.name), None) is command:
+            if not override and self._get_template_command(command.name, cmd_type) is not None:
+                raise CommandAlreadyRegistered(command.name, None)
+            if cmd_type == discord.AppCommandType.chat_input:
+                self._template_commands[command.name] = command
+            else:
+                self._template_context_menus[(command.name, cmd_type.value)] = command
+            self.invalidate_payload_cache()
+            return
+        
+        super().add_command(command, guild=guild, guilds=guilds, override=override)
+        self.invalidate_payload_cache()
+        
+        if guild is not MISSING:
+            guild_ids = [unpack_guild_object(guild)[1]]
+        elif guilds is not MISSING:
+            guild_ids = [unpack_guild_object(g)[1] for g in guilds]
+        else:
+            guild_ids = getattr(command, "_guild_ids", None) or [None]
+        
+        for guild_id in guild_ids:
+            self._index_client_command(cmd_type, command.name, guild_id)
+    
+    
+    #override
+    def remove_command(self, command: str, /, *, guild = None, type: discord.AppCommandType = discord.AppCommandType.chat_input):
+        """Removes a command from the tree (see the original discord.py documentation) and from the clientside command index.
+        If the command isn't found in the given guild (or global if None) itself, but it's a template command,
+        the template is removed, meaning the command gets removed from every guild."""
+        (_, guild_id) = unpack_guild_object(guild)
+        removed = super().remove_command(command, guild=guild, type=type)
+        if removed is None and (guild_id is None or guild_id in self._all_guild_ids):
+            if type == discord.AppCommandType.chat_input:
+                removed = self._template_commands.pop(command, None)
+            else:
+                removed = self._template_context_menus.pop((command, type.value), None)
+        if removed is None:
+            return None
+        self.invalidate_payload_cache()
+        self._index_client_command(type, command, guild_id)
+        return removed
+    
+    
+    #override
+    def clear_commands(self, *, guild, type: Optional[discord.AppCommandType] = None) -> None:
+        """Clears commands from the tree (see the original discord.py documentation) and from the clientside command index.
+        Template commands are not cleared, since they don't belong to any single guild."""
+        super().clear_commands(guild=guild, type=type)
+        self.invalidate_payload_cache()
+        guild_id = unpack_guild_object(guild)[1]
+        for cmd_type, guilds_with_commands_of_type in self.client_commands_structured.items():
+            if type is None or type == cmd_type:
+                guilds_with_commands_of_type.pop(guild_id, None)
+    
+    
+    #custom
+    def _get_guild_templates(self, guild_id: Optional[int], cmd_type: Optional[discord.AppCommandType] = None) -> List[ClientsideAppCommand]:
+        """Returns the template commands (of the given type, or of all types if None) that apply to a guild,
+        which are those not shadowed by the guild's own commands with the same name and type."""
+        if guild_id is None or not (self._template_commands or self._template_context_menus) or guild_id not in self._all_guild_ids:
+            return []
+        results = []
+        if cmd_type is None or cmd_type == discord.AppCommandType.chat_input:
+            own_commands = self._guild_commands.get(guild_id, {})
+            results.extend(cmd for name, cmd in self._template_commands.items() if name not in own_commands)
+        for (name, type_value), cmd in self._template_context_menus.items():
+            if (cmd_type is None or cmd_type.value == type_value) and (name, guild_id, type_value) not in self._context_menus:
+                results.append(cmd)
+        return results
+    
+    
+    #override
+    def get_command(self, command: str, /, *, guild = None, type: discord.AppCommandType = discord.AppCommandType.chat_input):
+        """Gets a command from the tree (see the original discord.py documentation).
+        For guilds without their own command with the name, template commands are returned."""
+        cmd = super().get_command(command, guild=guild, type=type)
+        if cmd is None and guild is not None and guild.id in self._all_guild_ids:
+            cmd = self._get_template_command(command, type)
+        return cmd
+    
+    
+    #override
+    def get_commands(self, *, guild = None, type: Optional[discord.AppCommandType] = None) -> List[ClientsideAppCommand]:
+        """Gets all commands of a guild (or global if None) from the tree (see the original discord.py documentation),
+        including the template commands which apply to it."""
+        if type is None:
+            return self._get_all_commands(guild=guild)
+        commands = super().get_commands(guild=guild, type=type)
+        if guild is not None:
+            commands.extend(self._get_guild_templates(guild.id, type))
+        return commands
+    
+    
+    #override
+    def walk_commands(self, *, guild = None, type: discord.AppCommandType = discord.AppCommandType.chat_input):
+        """Walks through all commands of a guild (or global if None) and their children (see the original discord.py documentation),
+        including the template commands which apply to it."""
+        yield from super().walk_commands(guild=guild, type=type)
+        if guild is not None:
+            for cmd in self._get_guild_templates(guild.id, type):
+                yield cmd
+                if isinstance(cmd, Group):
+                    yield from cmd.walk_commands()
+    
+    
+    #override
+    def _get_all_commands(self, *, guild = None) -> List[ClientsideAppCommand]:
+        """Returns all clientside commands of a guild (or global if None), including the template commands which apply to it."""
+        commands = super()._get_all_commands(guild=guild)
+        if guild is not None:
+            commands.extend(self._get_guild_templates(guild.id))
+        return commands
+    
+    
+    #override
+    def _get_context_menu(self, data: dict) -> Optional[ContextMenu]:
+        """Finds the context menu of an interaction, falling back to the template context menus for guilds without their own."""
+        guild_id = _get_as_snowflake(data, "guild_id")
+        cmd_type = data.get("type", discord.AppCommandType.chat_input.value)
+        if guild_id is not None and (data["name"], guild_id, cmd_type) not in self._context_menus and guild_id in self._all_guild_ids:
+            template = self._template_context_menus.get((data["name"], cmd_type), None)
+            if template is not None:
+                return template
+        return super()._get_context_menu(data)
+    
+    
+    #override
+    def _get_app_command_options(self, data: dict) -> tuple:
+        """Finds the slash command of an interaction along with its options (see discord.py),
+        resolving to the template commands for guilds without their own command with the name."""
+        name = data["name"]
+        guild_id = _get_as_snowflake(data, "guild_id")
+        if guild_id is None or name in self._guild_commands.get(guild_id, {}) or guild_id not in self._all_guild_ids:
+            return super()._get_app_command_options(data)
+        command = self._template_commands.get(name, None)
+        if command is None:
+            return super()._get_app_command_options(data)
+        
+        #same walk through subcommands as in discord.py
+        parents = []
+        options = data.get("options", [])
+        while options and options[0].get("type", 0) in _SUBCOMMAND_OPTION_TYPES:
+            parents.append(name)
+            name = options[0]["name"]
+            command = command._get_internal_command(name)
+            if command is None:
+                raise CommandNotFound(name, parents)
+            options = options[0].get("options", [])
+        
+        if isinstance(command, Group):
+            #groups can't be invoked, so Discord's data is out of date
+            raise CommandSignatureMismatch(command)
+        return (command, options)
+    
+    
+    #override
+    async def _call_context_menu(self, interaction: discord.Interaction, data: dict, type: int) -> None:
+        """Runs the context menu of an interaction (see discord.py), using the template context menu
+        for guilds without their own one with the name."""
+        guild_id = _get_as_snowflake(data, "guild_id")
+        ctx_menu = None
+        if guild_id is not None and (data["name"], guild_id, type) not in self._context_menus and guild_id in self._all_guild_ids:
+            ctx_menu = self._template_context_menus.get((data["name"], type), None)
+        if ctx_menu is None:
+            return await super()._call_context_menu(interaction, data, type)
+        
+        #same as in discord.py from here on
+        interaction._cs_command = ctx_menu
+        resolved = Namespace._get_resolved_items(interaction, data.get("resolved", {}))
+        value = resolved.get(ResolveKey.any_with(data.get("target_id")))
+        if value is None:
+            raise AppCommandError("This should not happen if Discord sent well-formed data.")
+        
+        try:
+            await ctx_menu._invoke(interaction, value)
+        except AppCommandError as err:
+            if ctx_menu.on_error is not None:
+                await ctx_menu.on_error(interaction, err)
+            await self.on_error(interaction, err)
+        else:
+            self.client.dispatch("app_command_completion", interaction, ctx_menu)
+    
+    
+    #custom
+    def invalidate_payload_cache(self, *commands: ClientsideAppCommand) -> None:
+        """Forgets the cached payloads of the given commands, or of all commands if none are given.
+        This happens automatically whenever the tree changes. Modified commands are also noticed on their own
+        once their payload is checked again (see .get_command_payload), which this makes happen right away."""
+        if commands:
+            for cmd in commands:
+                self._command_payload_cache.pop(id(cmd), None)
+        else:
+            self._command_payload_cache.clear()
+        self._target_payload_cache.clear()
+        self._payload_violations_cache.clear()
+    
+    
+    #custom
+    @contextmanager
+    def _reusing_payloads(self):
+        """Context manager within which cached payloads are checked against their commands only once,
+        so that bulk operations over many targets don't rebuild them for every target. Outside of it,
+        every call of .get_command_payload and .get_commands_payload checks them again.
+        Commands modified while one of these blocks is running are only noticed once they all exit."""
+        if self._reusing_payloads_depth == 0:
+            self._payload_epoch += 1
+        self._reusing_payloads_depth += 1
+        try:
+            yield
+        finally:
+            self._reusing_payloads_depth -= 1
+    
+    #custom
+    def _get_payload_epoch(self) -> int:
+        if self._reusing_payloads_depth == 0:
+            self._payload_epoch += 1
+        return self._payload_epoch
+    
+    
+    #custom
+    def get_command_payload(self, cmd: ClientsideAppCommand, *, epoch: Optional[int] = None) -> dict:
+        """Returns the payload of a clientside command (made by .to_dict()), reusing it between targets and syncs.
+        The cached payload is checked against a new one once per epoch (see ._reusing_payloads), so that commands
+        modified in place are noticed. If it didn't change, the very same payload object is returned.
+        The returned payload is shared, so it must not be modified."""
+        if epoch is None:
+            epoch = self._get_payload_epoch()
+        cached = self._command_payload_cache.get(id(cmd), None)
+        if cached is not None and cached[0] is cmd and cached[2] == epoch:
+            return cached[1]
+        payload = cmd.to_dict()
+        if cached is not None and cached[0] is cmd and cached[1] == payload:
+            payload = cached[1]
+        #the command is kept in the cache as well, so its id can't get reused by a different object
+        self._command_payload_cache[id(cmd)] = (cmd, payload, epoch)
+        return payload
+    
+    
+    #custom
+    def get_commands_payload(self, commands: List[ClientsideAppCommand]) -> Tuple[List[dict], str]:
+        """Returns the payload list of the given commands along with its digest (see .compute_payload_digest).
+        Both are computed only once for every distinct list of commands until one of them changes,
+        so that targets with the same commands (like those of @for_all_guilds) don't rebuild them.
+        The returned payload list is shared, so it must not be modified."""
+        epoch = self._get_payload_epoch()
+        key = tuple(id(cmd) for cmd in commands)
+        cached = self._target_payload_cache.get(key, None)
+        if cached is not None and cached[2] == epoch:
+            return cached[:2]
+        payload = [self.get_command_payload(cmd, epoch=epoch) for cmd in commands]
+        if cached is not None and all(new is old for new, old in zip(payload, cached[0])):
+            #none of the commands changed, so neither did the digest
+            payload = cached[0]
+            digest = cached[1]
+        else:
+            digest = self.compute_payload_digest(payload)
+        #all commands of the key are kept alive by the command payload cache, so the key stays valid
+        self._target_payload_cache[key] = (payload, digest, epoch)
+        return (payload, digest)
+    
+    
+    #custom
+    def register_all_guilds_command(self, command: ClientsideAppCommand) -> None:
+        """Marks a clientside command as belonging to every guild the bot is in. This must be done before the command
+        is added to the tree. Once added (without specifying any guilds), the command is stored just once as a template,
+        which every guild the bot is in (including ones joined later) resolves to in lookups, syncs and location queries.
+        The guilds of the command become a live collection of all guilds the bot is in."""
+        command._guild_ids = self._all_guild_ids
+        self._all_guilds_commands[(self.get_command_type(command), command.name)] = command
+    
+    
+    #custom
+    def unregister_all_guilds_command(self, command: ClientsideAppCommand) -> None:
+        """Forgets that a command belongs to every guild. If it's still a template, it's removed from the tree as well."""
+        cmd_type = self.get_command_type(command)
+        key = (cmd_type, command.name)
+        if self._all_guilds_commands.get(key, None) is not command:
+            return
+        del self._all_guilds_commands[key]
+        if self._get_template_command(command.name, cmd_type) is command:
+            if cmd_type == discord.AppCommandType.chat_input:
+                del self._template_commands[command.name]
+            else:
+                del self._template_context_menus[(command.name, cmd_type.value)]
+            self.invalidate_payload_cache()
+    
+    
+    #custom
+    def get_all_guilds_commands(self) -> List[ClientsideAppCommand]:
+        """Returns all template commands, which belong to every guild the bot is in."""
+        return list(chain(self._template_commands.values(), self._template_context_menus.values()))
+    
+    
+    #custom
+    def detach_guild(self, guild_id: int) -> None:
+        """Forgets everything about a guild the bot is no longer in: its server-side commands are evicted from the cache,
+        syncs scheduled for it are cancelled and clientside commands added explicitly for that guild are removed from the tree.
+        Template commands stop applying to it on their own. If the bot joins the guild again, its explicit commands
+        are only back once the extensions defining them get reloaded."""
+        self._scheduled_sync_targets.discard(guild_id)
+        self._scheduled_delta_commands.pop(guild_id, None)
+        self.clear_commands(guild=discord.Object(id=guild_id))
+        #left behind empty by discord.py
+        self._guild_commands.pop(guild_id, None)
+        
+        for guilds_with_commands_of_type in self.app_commands_cache_structured.values():
+            structured = guilds_with_commands_of_type.get(guild_id, None)
+            if structured:
+                for _, cmd in structured.iter_raw_items():
+                    self.app_command_locations.pop(cmd if isinstance(cmd, int) else cmd.id, None)
+        self._clear_cache(guild_id)
+        self._set_synced_digest(guild_id, None)
+        self.invalidate_command_permissions(guild_id)
+    
+    
+    #custom
+    @staticmethod
+    def validate_payload(payload: List[dict]) -> List[tuple]:
+        """Checks a list of command payloads (as made by .to_dict()) of a single target against Discord's limits
+        (see the top of this module). The daily limit of new commands isn't checked here.
+        Returns a list of tuples (command name or None, path to the offending field, message), empty if everything is valid."""
+        violations = []
+        
+        def check_string(name: Optional[str], path: str, value, max_length: int, field: str, required: bool = True) -> None:
+            if value is None or value == "":
+                if required:
+                    violations.append((name, path, f"{field} is missing"))
+            elif len(value) > max_length:
+                violations.append((name, path, f"{field} is {len(value)} characters long, the limit is {max_length}"))
+        
+        def check_options(name: str, path: str, options: list) -> None:
+            if len(options) > _MAX_OPTIONS:
+                violations.append((name, path, f"{len(options)} options, the limit is {_MAX_OPTIONS}"))
+            for option in options:
+                option_path = f"{path}.{option.get('name', '?')}"
+                check_string(name, option_path, option.get("name"), _MAX_NAME_LENGTH, "name")
+                check_string(name, option_path, option.get("description"), _MAX_DESCRIPTION_LENGTH, "description")
+                choices = option.get("choices") or []
+                if len(choices) > _MAX_CHOICES:
+                    violations.append((name, option_path, f"{len(choices)} choices, the limit is {_MAX_CHOICES}"))
+                for choice in choices:
+                    check_string(name, f"{option_path}.choices", choice.get("name"), _MAX_CHOICE_LENGTH, "choice name")
+                    if isinstance(choice.get("value"), str):
+                        check_string(name, f"{option_path}.choices", choice["value"], _MAX_CHOICE_LENGTH, "choice value", required=False)
+                if option.get("type") in _SUBCOMMAND_OPTION_TYPES:
+                    check_options(name, f"{option_path}.options", option.get("options") or [])
+        
+        counts = {}
+        names = set()
+        for cmd in payload:
+            name = cmd.get("name")
+            cmd_type = cmd.get("type", discord.AppCommandType.chat_input.value)
+            counts[cmd_type] = counts.get(cmd_type, 0) + 1
+            if (cmd_type, name) in names:
+                violations.append((name, name, "defined more than once"))
+            names.add((cmd_type, name))
+            
+            check_string(name, name, name, _MAX_NAME_LENGTH, "name")
+            if cmd_type == discord.AppCommandType.chat_input.value:
+                check_string(name, name, cmd.get("description"), _MAX_DESCRIPTION_LENGTH, "description")
+                check_options(name, f"{name}.options", cmd.get("options") or [])
+        
+        for cmd_type, count in counts.items():
+            limit = _MAX_COMMANDS_PER_TYPE.get(cmd_type, None)
+            if limit is not None and count > limit:
+                violations.append((None, "", f"{count} {discord.AppCommandType(cmd_type).name} commands, the limit is {limit}"))
+        return violations
+    
+    
+    #custom
+    def validate_target(self, guild = None, commands: Optional[List[ClientsideAppCommand]] = None) -> List[CommandLimitViolation]:
+        """Checks the commands of a guild (or global if None) against Discord's limits without making any requests.
+        commands: the commands to check, all commands defined for the target by default.
+        Returns a list of violations, empty if the target can be synced."""
+        (guild, guild_id) = unpack_guild_object(guild)
+        if commands is None:
+            commands = self._get_all_commands(guild=guild)
+        (payload, digest) = self.get_commands_payload(commands)
+        
+        violations = self._payload_violations_cache.get(digest, None)
+        if violations is None:
+            violations = self._payload_violations_cache[digest] = self.validate_payload(payload)
+        return [CommandLimitViolation(guild_id, name, path, message) for name, path, message in violations]
+    
+    
+    #custom
+    def validate_all_targets(self) -> Dict[Optional[int], List[CommandLimitViolation]]:
+        """Checks the commands of every target (global and all guilds the bot is in) against Discord's limits.
+        Returns a dictionary of violations per target, containing only the invalid targets."""
+        results = {}
+        for guild_id in chain([None], (guild.id for guild in self.client.guilds)):
+            violations = self.validate_target(guild_id)
+            if violations:
+                results[guild_id] = violations
+        return results
+    
+    
+    #custom
+    def _get_valid_targets(self, guild_ids: Iterable[Optional[int]], *, just_delete: bool = False) -> List[Optional[int]]:
+        """Filters out targets whose commands exceed Discord's limits, printing their violations.
+        Targets that would create more commands than their remaining daily creation budget allows are deferred
+        (left out and remembered in .deferred_sync_targets) until the budget frees up."""
+        if just_delete:
+            return list(guild_ids)
+        
+        valid = []
+        for guild_id in guild_ids:
+            violations = self.validate_target(guild_id)
+            if violations:
+                print(f"Skipping sync of {self._get_target_name(guild_id)}, {InvalidAppCommands(guild_id, violations)}")
+            elif not self._fits_creation_budget(guild_id):
+                self.deferred_sync_targets.add(guild_id)
+                print(f"Deferring sync of {self._get_target_name(guild_id)}, not enough of the daily command creation budget is left")
+            else:
+                self.deferred_sync_targets.discard(guild_id)
+                valid.append(guild_id)
+        return valid
+    
+    
+    #custom
+    @staticmethod
+    def compute_payload_digest(payload: list) -> str:
+        """Returns a canonical digest of a list of command payloads (as made by .to_dict()).
+        The order of commands and of dictionary keys does not affect the result."""
+        canonical = sorted(json.dumps(cmd, sort_keys=True, separators=(",", ":")) for cmd in payload)
+        return hashlib.sha256("\n".join(canonical).encode("utf-8")).hexdigest()
+    
+    
+    #custom
+    def _get_data_file_path(self, filename: str) -> Optional[str]:
+        """Returns the path to a file in the bot's data directory, or None if the client doesn't have one."""
+        paths = getattr(self.client, "paths", None)
+        data_dir = getattr(paths, "data_dir", None)
+        if not data_dir or not filename:
+            return None
+        return os.path.join(data_dir, filename)
+    
+    
+    #custom
+    def load_sync_state(self) -> None:
+        """Loads the persistent sync state (sync digests and the AppCommand cache snapshot) from the data directory.
+        This is done automatically when needed, but it does nothing until the application id is known,
+        and only ever happens once. State saved by a different application is ignored."""
+        if self._sync_state_loaded or self.client.application_id is None:
+            return
+        self._sync_state_loaded = True
+        
+        path = self._get_data_file_path(self.sync_digests_file)
+        data = load_json_file(path) if path else None
+        if isinstance(data, dict) and data.get("application_id") == self.client.application_id:
+            for target, digest in data.get("targets", {}).items():
+                self._synced_digests.setdefault(None if target == "global" else int(target), digest)
+        
+        path = self._get_data_file_path(self.cache_snapshot_file)
+        data = load_json_file(path) if path else None
+        if isinstance(data, dict) and data.get("application_id") == self.client.application_id:
+            self._load_cache_snapshot(data)
+        
+        path = self._get_data_file_path(self.creation_quota_file)
+        data = load_json_file(path) if path else None
+        if isinstance(data, dict) and data.get("application_id") == self.client.application_id:
+            for target, creations in data.get("targets", {}).items():
+                self._command_creations.setdefault(None if target == "global" else int(target), {}).update(
+                    (int(cmd_id), created_at) for cmd_id, created_at in creations.items()
+                )
+        
+        #the journal is newer than all of the files above
+        path = self._get_data_file_path(self.sync_journal_file)
+        records = load_json_lines(path) if path else []
+        if records:
+            if isinstance(records[0], dict) and records[0].get("application_id") == self.client.application_id:
+                self._replay_sync_journal(records[1:])
+            self._sync_journal_dirty = True
+            self.save_sync_state()
+    
+    
+    #custom
+    def _replay_sync_journal(self, records: list) -> None:
+        """Applies the records of a sync journal left behind by a previous run, see ._append_to_sync_journal."""
+        runs: Dict[str, Dict[Optional[int], bool]] = {} #run id : unfinished targets
+        for record in records:
+            if not isinstance(record, dict):
+                continue
+            if "begin" in record:
+                runs[record["run"]] = {(None if target == "global" else int(target)): bool(just_delete) for target, just_delete in record["begin"]}
+            elif "end" in record:
+                runs.pop(record["run"], None)
+            elif "done" in record:
+                guild_id = None if record["done"] == "global" else int(record["done"])
+                #the saved cache of the target is older than the sync, so it's dropped and fetched again later
+                self._clear_cache(guild_id)
+                self._journal_refetch_targets.add(guild_id)
+                self._synced_digests[guild_id] = record["digest"]
+                self._sync_state_dirty = True
+                for unfinished_targets in runs.values():
+                    unfinished_targets.pop(guild_id, None)
+        
+        for unfinished_targets in runs.values():
+            self._interrupted_sync_targets.update(unfinished_targets)
+    
+    
+    #custom
+    def _append_to_sync_journal(self, record: dict) -> None:
+        """Appends a record to the sync journal, creating it if needed. Records are dictionaries of one of the forms:
+        {"run": id, "begin": [[target, just_delete], ...]} when a sync of multiple targets starts,
+        {"done": target, "digest": digest} when a target is synced
+        and {"run": id, "end": True} when the sync of multiple targets ends (even if not successfully).
+        Targets are guild ids as strings or "global".
+        Records appended within the same iteration of the event loop are written (and synced to the disk) together."""
+        if not self._sync_state_loaded or not self._get_data_file_path(self.sync_journal_file):
+            return
+        self._sync_journal_buffer.append(record)
+        self._sync_journal_dirty = True
+        if len(self._sync_journal_buffer) > 1:
+            return
+        try:
+            asyncio.get_running_loop().call_soon(self._flush_sync_journal)
+        except RuntimeError:
+            self._flush_sync_journal()
+    
+    
+    #custom
+    def _flush_sync_journal(self) -> None:
+        """Writes the buffered records of the sync journal on the persistence thread."""
+        if not self._sync_journal_buffer:
+            return
+        records = self._sync_journal_buffer
+        self._sync_journal_buffer = []
+        path = self._get_data_file_path(self.sync_journal_file)
+        header = {"application_id": self.client.application_id}
+        
+        def job() -> None:
+            try:
+                append_json_lines(path, records if os.path.exists(path) else [header, *records])
+            except OSError as err:
+                print(f"Failed to write into the app command sync journal, exception: {err}")
+        
+        self._run_persistence_job(job)
+    
+    
+    #custom
+    def _journal_synced_target(self, guild_id: Optional[int], digest: str) -> None:
+        """Records a successfully synced target in the journal, unless the state is going to be saved right away anyway.
+        Only the digest is recorded, the commands of the target are fetched again when resuming."""
+        self._interrupted_sync_targets.pop(guild_id, None)
+        self._journal_refetch_targets.discard(guild_id)
+        if self._sync_state_saving_deferred > 0:
+            self._append_to_sync_journal({"done": "global" if guild_id is None else str(guild_id), "digest": digest})
+    
+    
+    #custom
+    @contextmanager
+    def _journaled_sync_run(self, targets: Dict[Optional[int], bool]):
+        """Context manager that records the start and the end of a sync of multiple targets in the journal.
+        targets: dictionary of guild id (or None for global) : just_delete"""
+        self.load_sync_state()
+        run_id = os.urandom(6).hex()
+        self._active_sync_journal_runs.add(run_id)
+        self._append_to_sync_journal({
+            "run": run_id,
+            "begin": [["global" if guild_id is None else str(guild_id), just_delete] for guild_id, just_delete in targets.items()]
+        })
+        try:
+            yield
+        finally:
+            self._active_sync_journal_runs.discard(run_id)
+            self._append_to_sync_journal({"run": run_id, "end": True})
+    
+    
+    #custom
+    def get_interrupted_sync_targets(self) -> Dict[Optional[int], bool]:
+        """Returns the targets (guild ids or None for global) of syncs that were started, but never finished
+        because the process got killed, mapped to whether they were supposed to just be cleared."""
+        self.load_sync_state()
+        return dict(self._interrupted_sync_targets)
+    
+    
+    #custom
+    async def resume_interrupted_sync(self, *, ignore_errors: bool = False, progress_callback = None) -> List[AppCommand]:
+        """Syncs only the targets of a sync that never finished because the process got killed (see .get_interrupted_sync_targets).
+        Targets that were completed before that are not synced again. Guilds the bot is no longer in are skipped.
+        Targets are synced concurrently, see ._run_sync_jobs. Afterwards, the completed targets are fetched,
+        since the journal only records their digests."""
+        targets = {
+            guild_id: just_delete for guild_id, just_delete in self.get_interrupted_sync_targets().items()
+            if guild_id is None or self.client.get_guild(guild_id)
+        }
+        self._interrupted_sync_targets.clear()
+        
+        with self._deferred_sync_state_saving():
+            with self._journaled_sync_run(targets):
+                results = await self._run_sync_jobs(
+                    [self._make_sync_job(guild_id, just_delete=just_delete) for guild_id, just_delete in targets.items()],
+                    ignore_errors=ignore_errors,
+                    progress_callback=progress_callback
+                )
+            
+            refetch_targets = [
+                guild_id for guild_id in self._journal_refetch_targets
+                if (guild_id is None or self.client.get_guild(guild_id)) and not self.is_target_cached(guild_id)
+            ]
+            self._journal_refetch_targets.clear()
+            await self.fetch_commands_from(refetch_targets, ignore_errors=True)
+        return results
+    
+    
+    #custom
+    def _get_synced_digests(self) -> Dict[Optional[int], str]:
+        """Returns the digests of the last synced payloads per target, loading them from the data directory first if needed."""
+        self.load_sync_state()
+        return self._synced_digests
+    
+    
+    #custom
+    def _set_synced_digest(self, guild_id: Optional[int], digest: Optional[str]) -> None:
+        """Remembers the digest of the payload last synced to the given target (None for global).
+        Passing a digest of None forgets it, meaning the next sync to that target can't be skipped."""
+        digests = self._get_synced_digests()
+        if digest is None:
+            if digests.pop(guild_id, None) is None:
+                return
+        elif digests.get(guild_id, None) == digest:
+            return
+        else:
+            digests[guild_id] = digest
+        self._sync_state_dirty = True
+        self.save_sync_state()
+    
+    
+    #custom
+    def forget_synced_digests(self) -> None:
+        """Forgets all remembered sync digests, forcing the next syncs to every target to actually be made."""
+        self._get_synced_digests().clear()
+        self._sync_state_dirty = True
+        self.save_sync_state()
+    
+    
+    #custom
+    def _run_persistence_job(self, job, *, wait: bool = False) -> None:
+        """Runs a function writing persistent files on a single background thread, so that the disk doesn't block the event loop.
+        Jobs run one at a time, in the order they were given in.
+        wait: if True, blocks until the job (and all jobs before it) are done."""
+        if self._persistence_executor is None:
+            self._persistence_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="appcommands_persistence")
+        future = self._persistence_executor.submit(job)
+        if wait:
+            future.result()
+    
+    
+    #custom
+    async def wait_for_persistence(self) -> None:
+        """Waits until all persistent files that are being written in the background have been written,
+        including buffered records of the sync journal. Saves that are still delayed (see .save_sync_state) aren't waited for."""
+        self._flush_sync_journal()
+        if self._persistence_executor is not None:
+            await asyncio.wrap_future(self._persistence_executor.submit(lambda: None))
+    
+    
+    #custom
+    def save_sync_state(self, *, force: bool = False) -> None:
+        """Saves the persistent sync state (sync digests and the AppCommand cache snapshot) into the data directory
+        if it changed. While saving is deferred (during bulk operations), this does nothing unless forced.
+        The state is collected on the event loop and written on a background thread, at most once per .sync_state_save_delay seconds.
+        When forced (or called outside of the event loop), it's saved right away and this blocks until the files are written."""
+        if self._sync_state_saving_deferred > 0 and not force:
+            return
+        if not self._sync_state_loaded:
+            #never overwrite state that hasn't even been loaded yet
+            return
+        
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if force or loop is None or self.sync_state_save_delay <= 0:
+            if self._sync_state_save_handle is not None:
+                self._sync_state_save_handle.cancel()
+                self._sync_state_save_handle = None
+            self._run_persistence_job(self._make_sync_state_saving_job(), wait=force or loop is None)
+        elif self._sync_state_save_handle is None:
+            self._sync_state_save_handle = loop.call_later(self.sync_state_save_delay, self._save_delayed_sync_state)
     
     
     #custom
-    @staticmethod
-    def get_command_type(cmd: AnyCommand) -> discord.AppCommandType:
-        """Returns the type of the command as AppCommandType. Can be chat_input, user or message."""
-        return getattr(cmd, "type", discord.AppCommandType.chat_input)
+    def _save_delayed_sync_state(self) -> None:
+        self._sync_state_save_handle = None
+        if self._sync_state_saving_deferred > 0:
+            #saved once the deferring block exits
+            return
+        self._run_persistence_job(self._make_sync_state_saving_job())
     
     
     #custom
-    @staticmethod
-    def get_command_locations(cmd: AnyCommand) -> List[Optional[int]]:
-        """Returns a list of guild ids (or [None] for global) for which a given command is defined."""
-        #server-side AppCommands
-        guild_id = getattr(cmd, "guild_id", MISSING)
-        if guild_id is not MISSING:
-            return [guild_id]
+    def _make_sync_state_saving_job(self):
+        """Collects the parts of the persistent sync state that changed and returns a function that writes them.
+        The collected data is never modified afterwards (payloads are replaced rather than modified),
+        so the function can run on a different thread."""
+        files = [] #(path, data, description)
+        if self._sync_state_dirty:
+            self._sync_state_dirty = False
+            path = self._get_data_file_path(self.sync_digests_file)
+            if path:
+                files.append((path, {
+                    "application_id": self.client.application_id,
+                    "targets": {
+                        "global" if guild_id is None else str(guild_id): digest for guild_id, digest in self._synced_digests.items()
+                    }
+                }, "sync digests"))
         
-        #clientside app commands
-        guild_ids = getattr(cmd, "_guild_ids", None)
-        if not guild_ids: #also checks empty list
-            return [None]
-        return guild_ids
+        if self._cache_snapshot_dirty:
+            self._cache_snapshot_dirty = False
+            path = self._get_data_file_path(self.cache_snapshot_file)
+            if path:
+                files.append((path, self._make_cache_snapshot(), "cache snapshot"))
+        
+        quota_file = None
+        if self._creation_quota_dirty:
+            self._creation_quota_dirty = False
+            path = self._get_data_file_path(self.creation_quota_file)
+            if path:
+                for guild_id in list(self._command_creations.keys()):
+                    self._prune_command_creations(guild_id)
+                quota_file = (path, {
+                    "application_id": self.client.application_id,
+                    "targets": {
+                        "global" if guild_id is None else str(guild_id): {str(cmd_id): created_at for cmd_id, created_at in creations.items()}
+                        for guild_id, creations in self._command_creations.items()
+                    }
+                })
+        
+        #everything the journal holds is saved by now, except for syncs that are still running or were interrupted
+        journal_path = None
+        interrupted_record = None
+        if self._sync_journal_dirty and not self._active_sync_journal_runs:
+            self._sync_journal_dirty = False
+            #buffered records are covered by the saved state as well
+            self._sync_journal_buffer.clear()
+            journal_path = self._get_data_file_path(self.sync_journal_file)
+            if self._interrupted_sync_targets:
+                interrupted_record = {
+                    "run": "interrupted",
+                    "begin": [["global" if guild_id is None else str(guild_id), just_delete] for guild_id, just_delete in self._interrupted_sync_targets.items()]
+                }
+        else:
+            #records of syncs that are still running are written before the state, since the journal is newer
+            self._flush_sync_journal()
+        header = {"application_id": self.client.application_id}
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        
+        def job() -> None:
+            saving_failed = False
+            for path, data, description in files:
+                try:
+                    save_json_file(path, data)
+                except OSError as err:
+                    saving_failed = True
+                    print(f"Failed to save app command {description}, exception: {err}")
+            
+            if quota_file:
+                try:
+                    save_json_file(*quota_file)
+                except OSError as err:
+                    print(f"Failed to save app command creation quota, exception: {err}")
+            
+            if journal_path:
+                if saving_failed:
+                    #the journal is still needed, so it has to be deleted by a later save
+                    if loop is not None and not loop.is_closed():
+                        loop.call_soon_threadsafe(setattr, self, "_sync_journal_dirty", True)
+                    else:
+                        self._sync_journal_dirty = True
+                    return
+                delete_file(journal_path)
+                if interrupted_record:
+                    try:
+                        append_json_lines(journal_path, [header, interrupted_record])
+                    except OSError as err:
+                        print(f"Failed to write into the app command sync journal, exception: {err}")
+        
+        return job
     
     
     #custom
-    @staticmethod
-    def equal_commands(cmd1: AnyCommand, cmd2: AnyCommand) -> bool:
-        """Checks if 2 given commands are equal. This can compare clientside and serverside commands at the same time."""
-        if cmd1.name != cmd2.name:
-            return False
+    @contextmanager
+    def _recording_sync_diff(self, guild_id: Optional[int]):
+        """Context manager that records changes made to the cached commands of a target (global if None)
+        and dispatches them as an 'app_commands_synced' event with an AppCommandsSyncDiff once the outermost block exits,
+        if anything changed. Only commands that actually changed in the cache are looked at."""
+        depth = self._sync_diff_depths.get(guild_id, 0)
+        self._sync_diff_depths[guild_id] = depth + 1
+        if depth == 0:
+            self._sync_diff_baselines[guild_id] = {}
+            self._sync_diff_previously_cached[guild_id] = guild_id in self._cached_targets
+        try:
+            yield
+        finally:
+            self._sync_diff_depths[guild_id] -= 1
+            if self._sync_diff_depths[guild_id] == 0:
+                del self._sync_diff_depths[guild_id]
+                baseline = self._sync_diff_baselines.pop(guild_id)
+                diff = AppCommandsSyncDiff(guild_id, self._sync_diff_previously_cached.pop(guild_id))
+                for (cmd_type, name), before in baseline.items():
+                    after = self.get_cached_app_command(name, guild_id, cmd_type)
+                    if after is None:
+                        if before is not None:
+                            diff.removed.append(before[0])
+                    elif before is None:
+                        diff.added.append(after)
+                    elif self._get_app_command_payload(after) != before[1]:
+                        diff.edited.append(after)
+                if diff:
+                    self.client.dispatch("app_commands_synced", diff)
+    
+    
+    #custom
+    def _note_sync_diff_change(self, guild_id: Optional[int], cmd_type: discord.AppCommandType, name: str) -> None:
+        """Remembers the cached command under the given key before it gets changed, if its target is being recorded."""
+        baseline = self._sync_diff_baselines.get(guild_id, None)
+        if baseline is None or (cmd_type, name) in baseline:
+            return
+        before = self.app_commands_cache_structured[cmd_type].get(guild_id, {}).get(name, None)
+        baseline[(cmd_type, name)] = None if before is None else (before, self._get_app_command_payload(before))
+    
+    
+    #custom
+    def _note_sync_diff_target(self, guild_id: Optional[int]) -> None:
+        """Remembers all cached commands of a target before they get changed, if the target is being recorded."""
+        if guild_id not in self._sync_diff_baselines:
+            return
+        for cmd_type, guilds_with_commands_of_type in self.app_commands_cache_structured.items():
+            for name in list(guilds_with_commands_of_type.get(guild_id, {}).keys()):
+                self._note_sync_diff_change(guild_id, cmd_type, name)
+    
+    
+    #custom
+    @contextmanager
+    def _deferred_sync_state_saving(self):
+        """Context manager that postpones saving of the persistent sync state until the outermost block exits."""
+        self._sync_state_saving_deferred += 1
+        try:
+            #bulk operations also check the cached payloads just once
+            with self._reusing_payloads():
+                yield
+        finally:
+            self._sync_state_saving_deferred -= 1
+            if self._sync_state_saving_deferred == 0:
+                self.save_sync_state()
+    
+    
+    #custom
+    def _make_cache_snapshot(self) -> dict:
+        """Returns the AppCommand cache in a json-serializable form, along with the targets it is known to be complete for."""
+        commands = []
+        for cmd_id, cmd in self.app_commands_cache.iter_raw_items():
+            commands.append(self._app_command_payloads[cmd] if isinstance(cmd, int) else self._get_app_command_payload(cmd))
         
-        if self.get_command_type(cmd1) != self.get_command_type(cmd2):
-            return False
+        return {
+            "application_id": self.client.application_id,
+            "targets": ["global" if guild_id is None else str(guild_id) for guild_id in self._cached_targets],
+            "commands": commands
+        }
+    
+    
+    #custom
+    def _load_cache_snapshot(self, snapshot: dict) -> None:
+        """Fills the AppCommand cache from a snapshot made by ._make_cache_snapshot.
+        The AppCommand objects are only created once they are accessed.
+        Targets that are already cached are left untouched."""
+        targets = set(None if target == "global" else int(target) for target in snapshot.get("targets", []))
+        targets.difference_update(self._cached_targets)
         
-        #check guild overlap
-        loc1 = self.get_command_locations(cmd1)
-        loc2 = self.get_command_locations(cmd2)
-        for loc in loc1:
-            if loc in loc2:
-                return True
+        for payload in snapshot.get("commands", []):
+            guild_id = int(payload["guild_id"]) if payload.get("guild_id") else None
+            if guild_id not in targets:
+                continue
+            cmd_id = int(payload["id"])
+            cmd_type = discord.AppCommandType(payload.get("type", discord.AppCommandType.chat_input.value))
+            self._release_compact_record(dict.get(self.app_commands_cache, cmd_id, None))
+            if self._compact_cache:
+                value = self._make_compact_record_from_payload(payload)
+            else:
+                value = cmd_id
+                self._app_command_payloads[cmd_id] = payload
+            self.app_commands_cache[cmd_id] = value
+            self._get_structured_cache(cmd_type, guild_id)[payload["name"]] = value
+            self.app_command_locations.setdefault(cmd_id, (guild_id, cmd_type, payload["name"]))
+            self._index_command_mentions(cmd_id, guild_id, payload)
         
-        return False
+        self._cached_targets.update(targets)
     
     
     #custom
-    @staticmethod
-    def get_equal_command_from(command: AnyCommand, iterable: Iterable[AnyCommand]) -> Optional[AnyCommand]:
-        """Returns a matching command from the given iterable, or None if not found."""
-        for cmd in iterable:
-            if self.equal_commands(command, cmd):
-                return cmd
-        return None
+    def _get_structured_cache(self, cmd_type: discord.AppCommandType, guild_id: Optional[int]) -> _LazyAppCommandDict:
+        """Returns the dictionary of cached AppCommands of a given type from the given target, creating it if needed."""
+        guilds_with_commands_of_type = self.app_commands_cache_structured[cmd_type]
+        structured = guilds_with_commands_of_type.get(guild_id, None)
+        if structured is None:
+            #values can be AppCommand ids that haven't been turned into AppCommands yet, or CompactAppCommands
+            structured = guilds_with_commands_of_type[guild_id] = _LazyAppCommandDict(self._materialize_structured_value)
+        return structured
+    
     
     #custom
-    @staticmethod
-    def get_equal_commands_from(command: AnyCommand, iterable: Iterable[AnyCommand]) -> List[AnyCommand]:
-        """Returns a list of matching commands from the given iterable."""
+    def _materialize_app_command(self, value: Union[int, CompactAppCommand]) -> AppCommand:
+        """Creates an AppCommand object from its stored payload, given its id or its compact record."""
+        if isinstance(value, CompactAppCommand):
+            return AppCommand(data=value.payload, state=self._state)
+        return AppCommand(data=self._app_command_payloads[value], state=self._state)
+    
+    
+    #custom
+    def _materialize_structured_value(self, value: Union[int, CompactAppCommand]) -> AppCommand:
+        """Loader of the structured cache. AppCommand ids are looked up in the main cache, so that both caches share the same objects."""
+        if isinstance(value, CompactAppCommand):
+            return self._materialize_app_command(value)
+        return self.app_commands_cache[value]
+    
+    
+    #custom
+    def _get_app_command_payload(self, cmd: Union[AppCommand, CompactAppCommand]) -> dict:
+        """Returns the payload of a cached command as received from Discord, rebuilding it for CompactAppCommands.
+        The result must not be modified."""
+        payload = self._app_command_payloads.get(cmd.id, None)
+        if payload is not None:
+            return payload
+        if not isinstance(cmd, CompactAppCommand):
+            #AppCommands made from compact records don't have their payloads stored
+            cmd = dict.get(self.app_commands_cache, cmd.id, cmd)
+        if isinstance(cmd, CompactAppCommand):
+            return cmd.payload
+        #added from outside of the tree, the original payload is unknown
+        payload = cmd.to_dict()
+        payload["guild_id"] = cmd.guild_id
+        return payload
+    
+    
+    #custom
+    def _make_compact_record_from_payload(self, payload: dict) -> CompactAppCommand:
+        """Makes a compact record from a server-side payload, sharing the rest of the payload
+        with the cached records of identical commands. The record has to be released once it leaves the cache."""
+        shared_payload = {key: value for key, value in payload.items() if key not in _COMPACT_RECORD_KEYS}
+        key = json.dumps(shared_payload, sort_keys=True, separators=(",", ":"))
+        shared = self._shared_payloads.get(key, None)
+        if shared is None:
+            shared = self._shared_payloads[key] = _SharedPayload(key, shared_payload)
+        shared.references += 1
+        return CompactAppCommand(
+            int(payload["id"]),
+            int(payload["guild_id"]) if payload.get("guild_id") else None,
+            int(payload["version"]) if payload.get("version") else None,
+            shared
+        )
+    
+    
+    #custom
+    def _make_compact_record(self, cmd: AppCommand) -> CompactAppCommand:
+        """Makes a compact record of an AppCommand from its stored payload, which is then no longer stored on its own."""
+        payload = self._app_command_payloads.pop(cmd.id, None)
+        if payload is None:
+            #added from outside of the tree, the original payload is unknown
+            payload = cmd.to_dict()
+            payload["guild_id"] = cmd.guild_id
+        return self._make_compact_record_from_payload(payload)
+    
+    
+    #custom
+    def _release_compact_record(self, value) -> None:
+        """Forgets a value removed from the main cache. The shared part of a compact record's payload
+        is dropped once no other record uses it."""
+        if not isinstance(value, CompactAppCommand):
+            return
+        shared = value.shared
+        shared.references -= 1
+        if shared.references <= 0 and self._shared_payloads.get(shared.key, None) is shared:
+            del self._shared_payloads[shared.key]
+    
+    
+    #custom
+    def set_compact_cache(self, enabled: bool = True) -> None:
+        """Turns the compact cache mode on or off. In the compact mode, the AppCommand cache only holds slim
+        CompactAppCommand records, and full AppCommand objects are created from them every time one is requested.
+        Identical commands synced to many guilds then only store their payload once, at the cost of creating
+        a new AppCommand on every access (so they are no longer the same objects). Already cached commands are converted.
+        See .measure_cache_memory for how much the cache takes in the current mode."""
+        enabled = bool(enabled)
+        if enabled == self._compact_cache:
+            return
+        self._compact_cache = enabled
+        
+        converted = {}
+        for cmd_id, value in list(self.app_commands_cache.iter_raw_items()):
+            if enabled:
+                if isinstance(value, AppCommand):
+                    value = self._make_compact_record(value)
+                else:
+                    value = self._make_compact_record_from_payload(self._app_command_payloads.pop(value))
+            else:
+                #AppCommands will be created lazily once accessed
+                self._app_command_payloads[cmd_id] = value.payload
+                value = cmd_id
+            converted[cmd_id] = value
+            dict.__setitem__(self.app_commands_cache, cmd_id, value)
+        if not enabled:
+            self._shared_payloads.clear()
+        
+        for guilds_with_commands_of_type in self.app_commands_cache_structured.values():
+            for structured in guilds_with_commands_of_type.values():
+                for name, value in list(structured.iter_raw_items()):
+                    cmd_id = value if isinstance(value, int) else value.id
+                    dict.__setitem__(structured, name, converted.get(cmd_id, cmd_id))
+    
+    
+    #custom
+    def is_cache_compact(self) -> bool:
+        """Checks if the compact cache mode is on, see .set_compact_cache."""
+        return self._compact_cache
+    
+    
+    #custom
+    async def measure_cache_memory(self) -> Dict[str, int]:
+        """Measures the memory taken by the AppCommand cache as it is right now, by adding up the sizes of all objects
+        reachable from it (each counted once, leaving out the connection state shared with the rest of the bot).
+        The walk yields to the event loop every now and then, so that a huge cache doesn't block the bot.
+        Returns a dictionary with the amount of cached "commands", and bytes taken by the stored "payloads",
+        the "records" (AppCommands or compact records, with both caches holding them) and in "total"."""
+        
+        seen = {id(self._state)}
+        visited = 0
+        
+        async def measure(*roots) -> int:
+            nonlocal visited
+            size = 0
+            stack = list(roots)
+            while stack:
+                obj = stack.pop()
+                if id(obj) in seen or obj is None or isinstance(obj, (bool, type, enum.Enum)):
+                    continue
+                seen.add(id(obj))
+                size += sys.getsizeof(obj)
+                if isinstance(obj, dict):
+                    #not through the methods of the lazy dictionaries, which would create AppCommands
+                    stack.extend(dict.keys(obj))
+                    stack.extend(dict.values(obj))
+                elif isinstance(obj, (list, tuple, set, frozenset)):
+                    stack.extend(obj)
+                elif not isinstance(obj, (str, bytes, int, float)):
+                    stack.extend(getattr(obj, "__dict__", {}).values())
+                    for cls in type(obj).__mro__:
+                        for slot in getattr(cls, "__slots__", ()):
+                            if slot != "_state" and hasattr(obj, slot):
+                                stack.append(getattr(obj, slot))
+                visited += 1
+                if visited % _MEMORY_WALK_CHUNK == 0:
+                    await asyncio.sleep(0)
+            return size
+        
+        #payloads first, so that the records don't count the shared parts they point to
+        payloads = await measure(self._app_command_payloads, self._shared_payloads)
+        records = await measure(self.app_commands_cache, self.app_commands_cache_structured)
+        return {
+            "commands": len(self.app_commands_cache),
+            "payloads": payloads,
+            "records": records,
+            "total": payloads + records
+        }
+    
+    
+    #custom
+    def _make_app_commands(self, data: list) -> List[AppCommand]:
+        """Creates AppCommand objects from payloads received from Discord, remembering the payloads for cache snapshots."""
         results = []
-        for cmd in iterable:
-            if self.equal_commands(command, cmd):
-                results.append(cmd)
+        for payload in data:
+            cmd = AppCommand(data=payload, state=self._state)
+            self._app_command_payloads[cmd.id] = payload
+            self._record_command_creation(cmd.id, cmd.guild_id)
+            results.append(cmd)
         return results
-        
-
+    
+    
+    #custom
+    def _record_command_creation(self, cmd_id: int, guild_id: Optional[int]) -> None:
+        """Counts a command against the daily creation limit of its target, if its id shows it was created within the window."""
+        created_at = discord.utils.snowflake_time(cmd_id).timestamp()
+        if time.time() - created_at >= self.creation_window:
+            return
+        creations = self._command_creations.setdefault(guild_id, {})
+        if cmd_id not in creations:
+            creations[cmd_id] = created_at
+            self._creation_quota_dirty = True
+    
+    
+    #custom
+    def _prune_command_creations(self, guild_id: Optional[int]) -> Dict[int, float]:
+        """Forgets creations of a target that are older than the window and returns the remaining ones."""
+        creations = self._command_creations.get(guild_id, None)
+        if not creations:
+            self._command_creations.pop(guild_id, None)
+            return {}
+        window_start = time.time() - self.creation_window
+        for cmd_id in [cmd_id for cmd_id, created_at in creations.items() if created_at <= window_start]:
+            del creations[cmd_id]
+            self._creation_quota_dirty = True
+        if not creations:
+            del self._command_creations[guild_id]
+        return creations
+    
+    
+    #custom
+    def get_creation_budget(self, guild = None) -> int:
+        """Returns how many more commands can be created in the given guild (or global if None) today,
+        according to all creations this tree has seen within the last day."""
+        (_, guild_id) = unpack_guild_object(guild)
+        self.load_sync_state()
+        return max(0, self.daily_creation_limit - len(self._prune_command_creations(guild_id)))
+    
+    
+    #custom
+    def get_creation_budget_reset_time(self, guild = None) -> Optional[float]:
+        """Returns the unix time at which the next creation counted against the given guild (or global if None)
+        leaves the window, or None if no creations are being counted."""
+        (_, guild_id) = unpack_guild_object(guild)
+        self.load_sync_state()
+        creations = self._prune_command_creations(guild_id)
+        if not creations:
+            return None
+        return min(creations.values()) + self.creation_window
+    
+    
+    #custom
+    def get_creation_quota_report(self) -> Dict[Optional[int], Dict[str, float]]:
+        """Returns the creation budget of every target with some creations counted against it, as a dictionary of
+        {guild id or None for global: {"used": amount, "remaining": amount, "resets_at": unix time}}. Useful for metrics."""
+        self.load_sync_state()
+        report = {}
+        for guild_id in list(self._command_creations.keys()):
+            used = len(self._prune_command_creations(guild_id))
+            if used:
+                report[guild_id] = {
+                    "used": used,
+                    "remaining": max(0, self.daily_creation_limit - used),
+                    "resets_at": self.get_creation_budget_reset_time(guild_id)
+                }
+        return report
+    
+    
+    #custom
+    def _fits_creation_budget(self, guild_id: Optional[int], commands: Optional[List[ClientsideAppCommand]] = None) -> bool:
+        """Checks if syncing the commands (all commands of the target by default) wouldn't create more commands
+        than the remaining creation budget allows. Only cached targets can be checked, others always pass."""
+        if not self.is_target_cached(guild_id):
+            return True
+        if commands is None:
+            commands = self._get_all_commands(guild=unpack_guild_object(guild_id)[0])
+        plan = self._plan_target(guild_id, commands, "delta")
+        return len(plan.created) <= self.get_creation_budget(guild_id)
+    
     
     #custom
     def _add_app_commands_to_cache(self, *commands: AppCommand) -> None:
         """Adds AppCommands into the custom cache. If one already exists, it gets overwritten."""
         for cmd in commands:
-            self.app_commands_cache[cmd.id] = cmd
-            self.app_commands_cache_structured[cmd.type].setdefault(cmd.guild_id, {})[cmd.name] = cmd
+            self._note_sync_diff_change(cmd.guild_id, cmd.type, cmd.name)
+            self._release_compact_record(dict.get(self.app_commands_cache, cmd.id, None))
+            value = self._make_compact_record(cmd) if self._compact_cache else cmd
+            self.app_commands_cache[cmd.id] = value
+            #the name of a compact record is the one of its shared payload, so it isn't kept once per guild
+            self._get_structured_cache(cmd.type, cmd.guild_id)[value.name] = value
+            self.app_command_locations[cmd.id] = (cmd.guild_id, cmd.type, value.name)
+            self._unknown_command_ids.pop(cmd.id, None)
+            self._index_command_mentions(cmd.id, cmd.guild_id, self._get_app_command_payload(value))
+        if commands:
+            self._cache_snapshot_dirty = True
     
     #custom
     def _clear_cache(self, guild_id: Optional[int] = MISSING) -> None:
         """If guild_id is provided (or None for global), that particular target is cleared from the cache.
-        If not provided, the whole cache is cleared."""
+        If not provided, the whole cache is cleared.
+        Cleared targets are no longer considered to be completely cached."""
+        
+        self._cache_snapshot_dirty = True
         
         #clear whole cache
         if guild_id is MISSING:
+            for recorded_guild_id in self._sync_diff_baselines:
+                self._note_sync_diff_target(recorded_guild_id)
             self.app_commands_cache.clear()
+            self.command_mentions.clear()
+            self._command_mention_keys.clear()
+            self._app_command_payloads.clear()
+            self._shared_payloads.clear()
+            self._cached_targets.clear()
             for guilds_with_commands_of_type in self.app_commands_cache_structured.values():
                 guilds_with_commands_of_type.clear()
             return
         
         #clear individual guild or global
-        self.app_commands_cache = {
-            cmd_id: cmd for cmd_id, cmd in self.app_commands_cache.items() if cmd.guild_id != guild_id
-        }
+        self._note_sync_diff_target(guild_id)
+        self._cached_targets.discard(guild_id)
         for guilds_with_commands_of_type in self.app_commands_cache_structured.values():
-            guilds_with_commands_of_type.pop(guild_id, None)
+            structured = guilds_with_commands_of_type.pop(guild_id, None)
+            if not structured:
+                continue
+            for _, cmd in structured.iter_raw_items():
+                cmd_id = cmd if isinstance(cmd, int) else cmd.id
+                self._release_compact_record(self.app_commands_cache.pop_raw(cmd_id, None))
+                self._app_command_payloads.pop(cmd_id, None)
+                self._unindex_command_mentions(cmd_id)
         
     
     #custom
     def _overwrite_app_commands_cache(self, commands: List[AppCommand], *, guild_id: Optional[int] = MISSING) -> None:
         """Removes every existing AppCommand in cache which is from a guild (or global)
-        contained in any of the newly given commands, then adds the new commands into the cache."""
+        contained in any of the newly given commands, then adds the new commands into the cache.
+        The cache is then considered to be complete for these targets."""
         
         if guild_id is not MISSING:
             guild_ids = [guild_id]
         else:
             guild_ids = set(cmd.guild_id for cmd in commands)
-            self.app_commands_cache = {
-                cmd_id: cmd for cmd_id, cmd in self.app_commands_cache.items() if cmd.guild_id not in guild_ids
-            }
         
-        for guilds_with_commands_of_type in self.app_commands_cache_structured.values():
-            for _guild_id in guild_ids:
-                guilds_with_commands_of_type[_guild_id] = {}
+        #commands keeping their ids would lose their newly stored payloads along with the old ones
+        payloads = {cmd.id: self._app_command_payloads[cmd.id] for cmd in commands if cmd.id in self._app_command_payloads}
+        for _guild_id in guild_ids:
+            self._clear_cache(_guild_id)
+        self._app_command_payloads.update(payloads)
         
         self._add_app_commands_to_cache(*commands)
+        self._cached_targets.update(guild_ids)
 
     
     #custom
     def _remove_app_command_from_cache(self, cmd: AppCommand) -> Optional[AppCommand]:
         """Pops an AppCommand from the cache and returns it if found."""
+        self._note_sync_diff_change(cmd.guild_id, cmd.type, cmd.name)
+        self._unindex_command_mentions(cmd.id)
         self.app_commands_cache_structured[cmd.type].get(cmd.guild_id, {}).pop(cmd.name, None)
-        return self.app_commands_cache.pop(cmd.id, None)
+        #popped before its payload is forgotten, since it might need to be turned into an AppCommand from it
+        removed = self.app_commands_cache.pop_raw(cmd.id, None)
+        if removed is not None and not isinstance(removed, AppCommand):
+            self._release_compact_record(removed)
+            removed = self._materialize_app_command(removed)
+        self._app_command_payloads.pop(cmd.id, None)
+        self.app_command_locations.pop(cmd.id, None)
+        self._cache_snapshot_dirty = True
+        return removed
+    
+    
+    #custom
+    def is_target_cached(self, guild_id: Optional[int]) -> bool:
+        """Checks if the cache is known to contain every AppCommand of the given guild (or global if None),
+        which is the case after syncing or fetching its commands, or after loading them from a snapshot."""
+        self.load_sync_state()
+        return guild_id in self._cached_targets
     
     
     #custom
@@ -186,12 +1892,14 @@ class SmartCommandTree(discord.app_commands.CommandTree):
         cmd_type: discord.AppCommandType = discord.AppCommandType.chat_input
     ) -> Optional[AppCommand]:
         """Returns a cached AppCommand by name, type and guild (global if None)."""
+        self.load_sync_state()
         return self.app_commands_cache_structured[cmd_type].get(guild_id, {}).get(cmd_name, None)
     
     
     #custom
     def get_cached_app_commands(self, guild_id: Optional[int]) -> List[AppCommand]:
         """Returns all cached app commands for a given guild, or global if None."""
+        self.load_sync_state()
         results = []
         for guilds_with_commands_of_type in self.app_commands_cache_structured.values():
             results.extend(guilds_with_commands_of_type.get(guild_id, {}).values())
@@ -200,32 +1908,303 @@ class SmartCommandTree(discord.app_commands.CommandTree):
     #custom
     def get_all_cached_app_commands(self) -> List[AppCommand]:
         """Returns all cached app commands, both global and from every guild."""
+        self.load_sync_state()
         return list(self.app_commands_cache.values())
     
     
+    #custom
+    def _index_command_mentions(self, cmd_id: int, guild_id: Optional[int], payload: dict) -> None:
+        """Adds the mention strings of a cached slash command and all of its subcommands into .command_mentions.
+        Context menus can't be mentioned, so they're ignored."""
+        if payload.get("type", discord.AppCommandType.chat_input.value) != discord.AppCommandType.chat_input.value:
+            return
+        self._unindex_command_mentions(cmd_id)
+        
+        names = [payload["name"]]
+        for option in payload.get("options", None) or []:
+            if option.get("type") == discord.AppCommandOptionType.subcommand.value:
+                names.append(f"{payload['name']} {option['name']}")
+            elif option.get("type") == discord.AppCommandOptionType.subcommand_group.value:
+                for sub_option in option.get("options", None) or []:
+                    names.append(f"{payload['name']} {option['name']} {sub_option['name']}")
+        
+        keys = self._command_mention_keys[cmd_id] = []
+        for name in names:
+            key = (name, guild_id)
+            self.command_mentions[key] = f"</{name}:{cmd_id}>"
+            keys.append(key)
+    
+    
+    #custom
+    def _unindex_command_mentions(self, cmd_id: int) -> None:
+        """Removes the mention strings of a command from .command_mentions,
+        unless they've been taken over by another command with the same name since."""
+        for key in self._command_mention_keys.pop(cmd_id, ()):
+            mention = self.command_mentions.get(key, None)
+            if mention is not None and mention.endswith(f":{cmd_id}>"):
+                del self.command_mentions[key]
+    
+    
+    #custom
+    def get_command_mention(self, command: Union[str, ClientsideAppCommand], guild = None) -> Optional[str]:
+        """Returns the mention string of a slash command or subcommand (like '</group sub:id>') from the cache,
+        without making any requests. The command can be given by its qualified name or as a clientside command.
+        If a guild is given and the command isn't cached there, global commands are checked as well.
+        Returns None if the command isn't cached."""
+        self.load_sync_state()
+        (_, guild_id) = unpack_guild_object(guild)
+        name = command if isinstance(command, str) else command.qualified_name
+        mention = self.command_mentions.get((name, guild_id), None)
+        if mention is None and guild_id is not None:
+            mention = self.command_mentions.get((name, None), None)
+        return mention
+    
+    
+    #custom
+    def _get_permissions_target_id(self, command: Union[int, AnyCommand], guild_id: int) -> Optional[int]:
+        """Returns the id under which permission overwrites of a command are stored.
+        Clientside commands are resolved using the cache, guild commands first and then global ones.
+        Returns None if the command isn't cached."""
+        if isinstance(command, int):
+            return command
+        if isinstance(command, AppCommand):
+            return command.id
+        cmd_type = self.get_command_type(command)
+        appcmd = self.get_cached_app_command(command.name, guild_id, cmd_type) or self.get_cached_app_command(command.name, None, cmd_type)
+        return appcmd.id if appcmd else None
+    
+    
+    #custom
+    def _make_command_permissions(self, data: dict) -> GuildAppCommandPermissions:
+        """Creates a GuildAppCommandPermissions object from a payload received from Discord."""
+        target_id = int(data["id"])
+        command = self.app_commands_cache.get(target_id, None) or discord.Object(id=target_id)
+        return GuildAppCommandPermissions(data=data, state=self._state, command=command)
+    
+    
+    #custom
+    def _store_command_permissions(self, guild_id: int, target_id: int, data: Optional[dict]) -> None:
+        """Caches the permission overwrites of a target in a guild whose overwrites have been fetched,
+        from a payload received from Discord (None or no permissions meaning there are none), and marks them as up to date."""
+        if data is None or not data.get("permissions"):
+            self._command_permissions.get(guild_id, {}).pop(target_id, None)
+        else:
+            self._command_permissions.setdefault(guild_id, {})[target_id] = self._make_command_permissions(data)
+        stale_targets = self._stale_command_permissions.get(guild_id, None)
+        if stale_targets is not None:
+            stale_targets.discard(target_id)
+            if not stale_targets:
+                del self._stale_command_permissions[guild_id]
+    
+    
+    #custom
+    def is_command_permissions_cached(self, command: Union[int, AnyCommand], guild) -> bool:
+        """Checks if the permission overwrites of a command (or its id, or the application id for the defaults)
+        in the given guild are known without fetching, including knowing that there are none."""
+        (_, guild_id) = unpack_guild_object(guild)
+        target_id = self._get_permissions_target_id(command, guild_id)
+        return (
+            target_id is not None and guild_id in self._permissions_cached_guilds
+            and target_id not in self._stale_command_permissions.get(guild_id, ())
+        )
+    
+    
+    #custom
+    def get_cached_command_permissions(self, command: Union[int, AnyCommand], guild) -> Optional[GuildAppCommandPermissions]:
+        """Returns the cached permission overwrites of a command (or its id, or the application id for the defaults)
+        in the given guild. Returns None if there are none or if they aren't known, see .is_command_permissions_cached."""
+        (_, guild_id) = unpack_guild_object(guild)
+        target_id = self._get_permissions_target_id(command, guild_id)
+        return self._command_permissions.get(guild_id, {}).get(target_id, None)
+    
+    
+    #custom
+    async def fetch_guild_command_permissions(self, guild) -> Dict[int, GuildAppCommandPermissions]:
+        """Fetches the permission overwrites of all commands in the given guild with a single request and caches them.
+        Returns a dictionary of {command id or application id : permissions}."""
+        (_, guild_id) = unpack_guild_object(guild)
+        if self.client.application_id is None:
+            raise MissingApplicationID
+        
+        data = await self._request_with_ratelimit_retries(guild_id, lambda: self._http.get_guild_application_command_permissions(
+            self.client.application_id, guild_id
+        ))
+        results = {}
+        for payload in data:
+            permissions = self._make_command_permissions(payload)
+            results[permissions.id] = permissions
+        self._command_permissions[guild_id] = results
+        self._permissions_cached_guilds.add(guild_id)
+        self._stale_command_permissions.pop(guild_id, None)
+        return results
+    
+    
+    #custom
+    async def get_command_permissions(self, command: Union[int, AnyCommand], guild) -> Optional[GuildAppCommandPermissions]:
+        """Returns the permission overwrites of a command (or its id, or the application id for the defaults)
+        in the given guild, or None if there are none. Uses the cache if possible.
+        If the guild hasn't been fetched yet, all of its overwrites are fetched at once (see .fetch_guild_command_permissions),
+        otherwise only overwrites changed since then are fetched individually.
+        Clientside commands that can't be resolved through the cache are resolved with .resolve_command first."""
+        (_, guild_id) = unpack_guild_object(guild)
+        target_id = self._get_permissions_target_id(command, guild_id)
+        if target_id is None:
+            appcmd = await self.resolve_command(command, guild_id)
+            if appcmd is None:
+                return None
+            target_id = appcmd.id
+        
+        if guild_id not in self._permissions_cached_guilds:
+            await self.fetch_guild_command_permissions(guild_id)
+        elif target_id in self._stale_command_permissions.get(guild_id, ()):
+            try:
+                data = await self._request_with_ratelimit_retries(guild_id, lambda: self._http.get_application_command_permissions(
+                    self.client.application_id, guild_id, target_id
+                ))
+            except discord.NotFound:
+                #no overwrites
+                data = None
+            self._store_command_permissions(guild_id, target_id, data)
+        
+        return self._command_permissions.get(guild_id, {}).get(target_id, None)
+    
+    
+    #custom
+    def invalidate_command_permissions(self, guild = MISSING, target_id: Optional[int] = None) -> None:
+        """Forgets cached permission overwrites. If a target (command id or application id) is given,
+        only its overwrites in the given guild are marked as changed. If only a guild is given, all of its overwrites
+        are forgotten. If nothing is given, the whole permissions cache is cleared."""
+        if guild is MISSING:
+            self._command_permissions.clear()
+            self._permissions_cached_guilds.clear()
+            self._stale_command_permissions.clear()
+            return
+        
+        (_, guild_id) = unpack_guild_object(guild)
+        if target_id is None:
+            self._command_permissions.pop(guild_id, None)
+            self._permissions_cached_guilds.discard(guild_id)
+            self._stale_command_permissions.pop(guild_id, None)
+        elif guild_id in self._permissions_cached_guilds:
+            self._command_permissions.get(guild_id, {}).pop(target_id, None)
+            self._stale_command_permissions.setdefault(guild_id, set()).add(target_id)
+    
+    
+    #custom
+    def on_command_permissions_update(self, payload: discord.RawAppCommandPermissionsUpdateEvent) -> None:
+        """Handles the APPLICATION_COMMAND_PERMISSIONS_UPDATE gateway event (dispatched as 'raw_app_command_permissions_update'),
+        caching the new overwrites of the updated target from the event itself. Events of other applications are ignored.
+        If the event's overwrites can't be read, the cached ones are only marked as changed, to be fetched when needed."""
+        if payload.application_id != self.client.application_id:
+            return
+        guild_id = payload.guild.id
+        if guild_id not in self._permissions_cached_guilds:
+            #the overwrites of the whole guild get fetched when first needed anyway
+            return
+        
+        try:
+            data = {
+                "id": payload.target_id,
+                "application_id": payload.application_id,
+                "guild_id": guild_id,
+                "permissions": [permission.to_dict() for permission in payload.permissions]
+            }
+        except (AttributeError, TypeError, ValueError):
+            #incomplete event
+            self.invalidate_command_permissions(guild_id, payload.target_id)
+            return
+        self._store_command_permissions(guild_id, payload.target_id, data)
+    
+    
     #override
     async def fetch_command(self, command_id: int, /, *, guild = None) -> AppCommand:
         """Fetches a single AppCommand from Discord from the given guild (or global if None) and caches it in the process."""
-        (guild, _) = unpack_guild_object(guild)
-        cmd = await super().fetch_command(command_id, guild=guild)
-        self._add_app_commands_to_cache(cmd)
+        (_, guild_id) = unpack_guild_object(guild)
+        if self.client.application_id is None:
+            raise MissingApplicationID
+        
+        if guild_id is None:
+            data = await self._http.get_global_command(self.client.application_id, command_id)
+        else:
+            data = await self._http.get_guild_command(self.client.application_id, guild_id, command_id)
+        
+        (cmd,) = self._make_app_commands([data])
+        with self._deferred_sync_state_saving():
+            self._add_app_commands_to_cache(cmd)
         return cmd
     
     #override
     async def fetch_commands(self, *, guild = None) -> List[AppCommand]:
-        """Fetches AppCommands from the given guild (global if None) and caches them in the process."""
-        (guild, guild_id) = unpack_guild_object(guild)
-        results = await super().fetch_commands(guild=guild)
-        self._overwrite_app_commands_cache(results, guild_id=guild_id)
+        """Fetches AppCommands from the given guild (global if None) and caches them in the process.
+        Concurrent calls for the same target share a single request."""
+        (_, guild_id) = unpack_guild_object(guild)
+        if self.client.application_id is None:
+            raise MissingApplicationID
+        
+        inflight = self._inflight_fetches.get(guild_id, None)
+        if inflight is None:
+            inflight = asyncio.ensure_future(self._fetch_commands(guild_id))
+            self._inflight_fetches[guild_id] = inflight
+            
+            def fetch_done(future: asyncio.Future) -> None:
+                if self._inflight_fetches.get(guild_id, None) is future:
+                    del self._inflight_fetches[guild_id]
+                #if every caller got cancelled, don't let the exception go unretrieved
+                if not future.cancelled():
+                    future.exception()
+            inflight.add_done_callback(fetch_done)
+        
+        #shielded so that a cancelled caller doesn't cancel the request for everyone else
+        return list(await asyncio.shield(inflight))
+    
+    #custom
+    async def _fetch_commands(self, guild_id: Optional[int]) -> List[AppCommand]:
+        """Makes the actual request for .fetch_commands and caches the results."""
+        if guild_id is None:
+            data = await self._request_with_ratelimit_retries(None, lambda: self._http.get_global_commands(
+                self.client.application_id
+            ))
+        else:
+            data = await self._request_with_ratelimit_retries(guild_id, lambda: self._http.get_guild_commands(
+                self.client.application_id, guild_id
+            ))
+        
+        results = self._make_app_commands(data)
+        with self._deferred_sync_state_saving():
+            self.load_sync_state()
+            self._overwrite_app_commands_cache(results, guild_id=guild_id)
         return results
     
     #custom
     async def fetch_all_commands(self) -> List[AppCommand]:
-        """Fetches all app commands from Discord from every guild (including global) and caches them in the process."""
-        results = []
-        for guild in chain([None], self.client.guilds):
-            results += await self.fetch_commands(guild=guild)
-        return results
+        """Fetches all app commands from Discord from every guild (including global) and caches them in the process.
+        Guilds are fetched concurrently, with at most .max_concurrent_fetches requests at once."""
+        return await self.fetch_commands_from(chain([None], (guild.id for guild in self.client.guilds)))
+    
+    
+    #custom
+    async def fetch_commands_from(self, guilds: Iterable, *, ignore_errors: bool = False) -> List[AppCommand]:
+        """Fetches all app commands from Discord from the given guilds (None for global) and caches them in the process.
+        Every distinct target is fetched only once and the targets are fetched concurrently,
+        with at most .max_concurrent_fetches requests at once.
+        ignore_errors: if True, targets that fail to be fetched are skipped instead of raising an exception."""
+        
+        def make_job(guild_id: Optional[int]) -> tuple:
+            async def job() -> List[AppCommand]:
+                try:
+                    return await self.fetch_commands(guild=guild_id)
+                except Exception as err:
+                    if ignore_errors:
+                        return []
+                    raise err
+            return (f"Failed to fetch app commands from {self._get_target_name(guild_id)}", job)
+        
+        guild_ids = dict.fromkeys(unpack_guild_object(guild)[1] for guild in guilds) #deduplicated, but ordered
+        with self._deferred_sync_state_saving():
+            return await self._run_sync_jobs(
+                [make_job(guild_id) for guild_id in guild_ids],
+                max_concurrency=self.max_concurrent_fetches
+            )
     
     
     #custom
@@ -240,9 +2219,9 @@ class SmartCommandTree(discord.app_commands.CommandTree):
     #custom
     async def fetch_all_to_cache(self) -> None:
         """Fetches all app commands from Discord from every guild (including global) and caches them.
-        This function ensures that the local cache mimics all commands stored on Discord."""
-        for guild in chain([None], self.client.guilds):
-            await self.fetch_to_cache(guild=guild)
+        This function ensures that the local cache mimics all commands stored on Discord.
+        Guilds are fetched concurrently, with at most .max_concurrent_fetches requests at once."""
+        await self.fetch_commands_from(chain([None], (guild.id for guild in self.client.guilds)), ignore_errors=True)
     
     
     
@@ -254,6 +2233,7 @@ class SmartCommandTree(discord.app_commands.CommandTree):
         results.update(self._context_menus.values())
         for guild_commands in self._guild_commands.values():
             results.update(guild_commands.values())
+        results.update(self.get_all_guilds_commands())
         return results
     
     
@@ -267,16 +2247,22 @@ class SmartCommandTree(discord.app_commands.CommandTree):
         for guild_commands in self._guild_commands.values():
             guild_commands.clear()
         self._guild_commands.clear()
+        self._template_commands.clear()
+        self._template_context_menus.clear()
+        self.invalidate_payload_cache()
+        for guilds_with_commands_of_type in self.client_commands_structured.values():
+            guilds_with_commands_of_type.clear()
     
     
     #custom
     def get_all_command_locations(self) -> Set[Optional[int]]:
-        """Returns a set of guild ids (and None for global) that have some clientside app commands defined."""
+        """Returns a set of guild ids (and None for global) that have some clientside app commands defined.
+        If there are any template commands, this includes every guild the bot is in."""
         results = set()
-        if len(self._global_commands) > 0:
-            results.add(None)
-        results.update(guild_id for guild_id, commands in self._guild_commands.items() if len(commands) > 0)
-        results.update(guild_id for (_, guild_id, _) in self._context_menus.keys())
+        for guilds_with_commands_of_type in self.client_commands_structured.values():
+            results.update(guilds_with_commands_of_type.keys())
+        if self._template_commands or self._template_context_menus:
+            results.update(self._all_guild_ids)
         return results
     
     
@@ -286,10 +2272,34 @@ class SmartCommandTree(discord.app_commands.CommandTree):
         return self.get_command(command.name, guild=None if not command.guild_id else discord.Object(id=command.guild_id), type=command.type)
     
     
+    #custom
+    def get_app_command_location(self, cmd_id: int) -> Optional[tuple]:
+        """Returns the last known location of a server-side AppCommand id as a tuple of (guild id or None for global, type, name),
+        or None if the id has never been seen in any sync or fetch. The location is remembered even after
+        the command gets evicted from the cache, so it can still be used as a hint for where to fetch it from."""
+        self.load_sync_state()
+        return self.app_command_locations.get(cmd_id, None)
+    
+    
+    #custom
+    def _is_known_unknown_command_id(self, cmd_id: int) -> bool:
+        """Checks if a given id has recently failed to resolve to any AppCommand."""
+        expires = self._unknown_command_ids.get(cmd_id, None)
+        if expires is None:
+            return False
+        if expires <= time.monotonic():
+            del self._unknown_command_ids[cmd_id]
+            return False
+        return True
+    
+    
     #custom
     async def get_command_by_id(self, cmd_id: int, *, guild = MISSING, fetch_priority: int = 1) -> Optional[AppCommand]:
         """Resolves a server-side AppCommand id to an AppCommand. Can use cache or fetch directly.
-        guild: by default, the client will try to fetch from every possible guild.
+        At most a single request is ever made. Ids that fail to be found are remembered
+        for .unknown_command_id_ttl seconds, during which they aren't fetched again (unless fetch_priority is 2).
+        guild: by default, the command is fetched from where it was last seen in any sync or fetch,
+        or from global commands if it has never been seen.
         If a guild is specified, only that guild will be checked (global if None).
         fetch_priority: can be set to speficy when/if a fetch should be made.
         0 means never fetch, only use cache
@@ -299,25 +2309,31 @@ class SmartCommandTree(discord.app_commands.CommandTree):
         if not isinstance(fetch_priority, int) or fetch_priority < 0 or fetch_priority > 2:
             raise ValueError("Invalid fetch_priority.")
         
-        for priority in [2, 1]:
-            if fetch_priority == priority:
-                if guild is not MISSING:
-                    try:
-                        await self.fetch_command(cmd_id, guild=guild)
-                    except:
-                        pass
-                else:
-                    for guild in self.client.guilds:
-                        try:
-                            await self.fetch_command(cmd_id, guild=guild)
-                        except:
-                            pass
-            
+        self.load_sync_state()
+        
+        if fetch_priority < 2:
             appcmd = self.app_commands_cache.get(cmd_id, None)
-            if appcmd or fetch_priority != 1:
+            if appcmd or fetch_priority == 0 or self._is_known_unknown_command_id(cmd_id):
                 return appcmd
         
-        return None
+        if guild is MISSING:
+            location = self.app_command_locations.get(cmd_id, None)
+            guild = location[0] if location else None
+        
+        try:
+            return await self.fetch_command(cmd_id, guild=guild)
+        except discord.HTTPException as err:
+            if err.status != 404:
+                return self.app_commands_cache.get(cmd_id, None)
+        
+        #the command doesn't exist where it was looked for
+        self._unknown_command_ids[cmd_id] = time.monotonic() + self.unknown_command_id_ttl
+        appcmd = self.app_commands_cache.get(cmd_id, None)
+        if appcmd and appcmd.guild_id == unpack_guild_object(guild)[1]:
+            #it's not there anymore
+            self._remove_app_command_from_cache(appcmd)
+            return None
+        return appcmd
     
     
     #custom
@@ -373,13 +2389,11 @@ class SmartCommandTree(discord.app_commands.CommandTree):
         
         for priority in [2, 1]:
             if fetch_priority == priority:
-                #get all command locations
-                guild_ids = set()
-                for (_, guild_id, _) in commands_to_find:
-                    guild_ids.add(None)
-                
-                for guild_id in guild_ids:
-                    await self.fetch_to_cache(guild=guild_id)
+                #fetch every distinct location of the commands still left to find, each only once
+                await self.fetch_commands_from(
+                    (guild_id for (_, guild_id, _) in commands_to_find),
+                    ignore_errors=True
+                )
             
             #find a matching AppCommand from cache
             unfound_commands = []
@@ -400,73 +2414,424 @@ class SmartCommandTree(discord.app_commands.CommandTree):
     
     
     #custom
-    async def sync_individually(self, *commands: ClientsideAppCommand, ignore_errors: bool = False) -> List[AppCommand]:
+    @staticmethod
+    def _get_ratelimit_retry_after(err: discord.HTTPException) -> Optional[float]:
+        """Extracts the amount of seconds to wait from a ratelimited response, if the response specifies it."""
+        headers = getattr(getattr(err, "response", None), "headers", None)
+        if not headers:
+            return None
+        try:
+            return float(headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            return None
+    
+    
+    #custom
+    @staticmethod
+    def _is_global_ratelimit(err: discord.HTTPException) -> bool:
+        """Checks if a ratelimited response applies to all requests, not just to the route it was made on."""
+        headers = getattr(getattr(err, "response", None), "headers", None)
+        if not headers:
+            return False
+        return headers.get("X-RateLimit-Global", "").lower() == "true" or headers.get("X-RateLimit-Scope", "") == "global"
+    
+    
+    #custom
+    async def _wait_for_ratelimit(self, guild_id: Optional[int]) -> None:
+        """Waits until neither the global ratelimit, nor the ratelimit of the given target's command routes is active."""
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = max(
+                self._ratelimited_until.get(_GLOBAL_RATELIMIT, 0.0),
+                self._ratelimited_until.get(guild_id, 0.0)
+            ) - loop.time()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+    
+    
+    #custom
+    async def _request_with_ratelimit_retries(self, guild_id: Optional[int], make_request):
+        """Makes a request to one of the command routes of the given target (global if None) and returns its result.
+        discord.py already waits out the ratelimit buckets it knows about, but if a 429 still gets through,
+        the ratelimit is remembered for that target's routes (or for all of them if it's global)
+        and the request is retried with an exponential backoff, up to .sync_max_retries times."""
+        attempt = 0
+        while True:
+            await self._wait_for_ratelimit(guild_id)
+            try:
+                return await make_request()
+            except discord.HTTPException as err:
+                if err.status != 429 or attempt >= self.sync_max_retries:
+                    raise err
+                delay = max(self._get_ratelimit_retry_after(err) or 0.0, self.sync_retry_base_delay * 2**attempt)
+                bucket = _GLOBAL_RATELIMIT if self._is_global_ratelimit(err) else guild_id
+                until = asyncio.get_running_loop().time() + delay
+                self._ratelimited_until[bucket] = max(self._ratelimited_until.get(bucket, 0.0), until)
+                attempt += 1
+    
+    
+    #custom
+    async def _run_sync_jobs(self, jobs: list, *, ignore_errors: bool = False, progress_callback = None, max_concurrency: int = None) -> List[AppCommand]:
+        """Runs per-target sync jobs concurrently, with at most max_concurrency (.max_concurrent_syncs by default) of them running at once.
+        jobs: list of tuples (error message, async function without arguments returning a list of AppCommands)
+        ignore_errors: if True, failed jobs only get their error message printed, otherwise
+        the first failure cancels all other jobs and gets raised.
+        progress_callback: optional coroutine function, awaited after every finished job with
+        the amount of jobs done, failed and remaining.
+        Results of all jobs are returned in a single list, in the same order as the jobs were given."""
+        
+        if not jobs:
+            return []
+        
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or self.max_concurrent_syncs))
+        job_results = [None]*len(jobs)
+        progress = {"done": 0, "failed": 0}
+        
+        async def run_job(index: int, error_message: str, job) -> None:
+            async with semaphore:
+                try:
+                    job_results[index] = await job()
+                except Exception as err:
+                    progress["failed"] += 1
+                    if not ignore_errors:
+                        raise err
+                    print(f"{error_message}, exception: {err}")
+                else:
+                    progress["done"] += 1
+            if progress_callback:
+                await progress_callback(progress["done"], progress["failed"], len(jobs)-progress["done"]-progress["failed"])
+        
+        tasks = [asyncio.create_task(run_job(i, error_message, job)) for i, (error_message, job) in enumerate(jobs)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException as err:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise err
+        
+        return list(chain.from_iterable(result for result in job_results if result))
+    
+    
+    #custom
+    def _get_target_name(self, guild_id: Optional[int]) -> str:
+        """Returns a human-readable name of a sync target, used in error messages."""
+        if guild_id is None:
+            return "global"
+        guild = self.client.get_guild(guild_id)
+        if guild:
+            return f"guild '{guild.name}'"
+        return f"guild with id '{guild_id}'"
+    
+    
+    #custom
+    async def sync_individually(self, *commands: ClientsideAppCommand, ignore_errors: bool = False, progress_callback = None) -> List[AppCommand]:
         """Only the given commands will be uploaded individually, one by one, meaning no other previously existing
         commands will get deleted (as is the case with normal bulk sync).
-        Whether the command is global or belongs to some guilds will be dynamically determined."""
+        Whether the command is global or belongs to some guilds will be dynamically determined.
+        Different targets are uploaded to concurrently, see ._run_sync_jobs."""
         
         if not commands:
             return []
         
-        data = []
+        #group the commands by target, each target is uploaded to sequentially since it shares ratelimits
+        commands_per_target: Dict[Optional[int], list] = {}
         for cmd in commands:
-            guild_ids = getattr(cmd, '_guild_ids', None)
-            if not guild_ids:
-                try:
-                    data.append(await self._http.upsert_global_command(self.client.application_id, payload=cmd.to_dict()))
-                except Exception as err:
-                    if ignore_errors:
-                        print(f"Failed to sync global app command, exception: {err}")
-                    else:
-                        raise err
-            else:
-                for guild_id in guild_ids:
+            for guild_id in self.get_command_locations(cmd):
+                #only limits of the command itself can be checked, the amount of commands on Discord's side is unknown
+                violations = self.validate_target(guild_id, [cmd])
+                if violations:
+                    if not ignore_errors:
+                        raise InvalidAppCommands(guild_id, violations)
+                    print(f"Skipping individual sync of app command '{cmd.name}' to {self._get_target_name(guild_id)}, {InvalidAppCommands(guild_id, violations)}")
+                    continue
+                commands_per_target.setdefault(guild_id, []).append(cmd)
+        
+        def make_job(guild_id: Optional[int], target_commands: list):
+            async def job() -> List[AppCommand]:
+                data = []
+                for cmd in target_commands:
                     try:
-                        data.append(await self._http.upsert_guild_command(self.client.application_id, guild_id, payload=cmd.to_dict()))
+                        if guild_id is None:
+                            data.append(await self._request_with_ratelimit_retries(None, lambda: self._http.upsert_global_command(
+                                self.client.application_id, payload=self.get_command_payload(cmd)
+                            )))
+                        else:
+                            data.append(await self._request_with_ratelimit_retries(guild_id, lambda: self._http.upsert_guild_command(
+                                self.client.application_id, guild_id, payload=self.get_command_payload(cmd)
+                            )))
                     except Exception as err:
                         if ignore_errors:
-                            print(f"Failed to sync app command to guild with id '{guild_id}', exception: {err}")
+                            if guild_id is None:
+                                print(f"Failed to sync global app command, exception: {err}")
+                            else:
+                                print(f"Failed to sync app command to guild with id '{guild_id}', exception: {err}")
                         else:
                             raise err
+                
+                results = self._make_app_commands(data)
+                with self._recording_sync_diff(guild_id):
+                    self._add_app_commands_to_cache(*results)
+                #the resulting server-side state of this target is no longer known exactly
+                self._set_synced_digest(guild_id, None)
+                return results
+            return job
         
-        results = [AppCommand(data=d, state=self._state) for d in data]
-        self._add_app_commands_to_cache(*results)
-        return results
+        with self._deferred_sync_state_saving():
+            return await self._run_sync_jobs(
+                [
+                    (f"Failed to sync app commands individually to {self._get_target_name(guild_id)}", make_job(guild_id, target_commands))
+                    for guild_id, target_commands in commands_per_target.items()
+                ],
+                ignore_errors=ignore_errors,
+                progress_callback=progress_callback
+            )
+    
+    
+    #custom
+    @staticmethod
+    def payload_matches(client_payload, server_payload) -> bool:
+        """Checks if a clientside command payload (as made by .to_dict()) is already reflected by a server-side one.
+        Only fields sent by the client are compared, since Discord adds extra ones (like id or version).
+        Fields missing on Discord's side are considered equal to empty/default values sent by the client."""
+        if isinstance(client_payload, dict):
+            if not isinstance(server_payload, dict):
+                return False
+            for key, value in client_payload.items():
+                if key not in server_payload or server_payload[key] is None:
+                    if value in _PAYLOAD_DEFAULT_VALUES:
+                        continue
+                    return False
+                if not SmartCommandTree.payload_matches(value, server_payload[key]):
+                    return False
+            return True
+        
+        if isinstance(client_payload, (list, tuple)):
+            if not isinstance(server_payload, (list, tuple)) or len(client_payload) != len(server_payload):
+                return False
+            return all(SmartCommandTree.payload_matches(c, s) for c, s in zip(client_payload, server_payload))
+        
+        if client_payload == server_payload:
+            return True
+        #snowflakes and permission bitfields can be sent as integers, but are returned as strings
+        return isinstance(client_payload, int) and not isinstance(client_payload, bool) and str(client_payload) == server_payload
+    
+    
+    #custom
+    async def sync_delta(self,
+        guild = None,
+        *,
+        commands: Optional[List[ClientsideAppCommand]] = None,
+        delete_stale: bool = False,
+        ignore_errors: bool = False
+    ) -> "DeltaSyncReport":
+        """Syncs commands to the guild (or global if None) by only sending what's different from the cached server-side commands.
+        Missing commands get created, changed commands get edited and, if delete_stale is True, server-side commands
+        that are no longer defined get deleted. If the target isn't cached yet, its commands are fetched first.
+        commands: if given, only these commands are compared instead of all commands defined for the target,
+        and no deletions are made.
+        ignore_errors: if True, errors of individual requests will only get printed instead of raising an exception.
+        If the creations wouldn't fit into the remaining creation budget, nothing is sent and the target is deferred
+        (remembered in .deferred_sync_targets), just like the other syncs do.
+        Returns a report of every request that was made."""
+        
+        (guild, guild_id) = unpack_guild_object(guild)
+        if self.client.application_id is None:
+            raise MissingApplicationID
+        
+        report = DeltaSyncReport(guild_id)
+        target_name = self._get_target_name(guild_id)
+        
+        with self._deferred_sync_state_saving():
+            if not self.is_target_cached(guild_id):
+                #fetch_commands already retries ratelimited requests
+                await self.fetch_commands(guild=guild_id)
+                report.fetched = True
+            
+            #checked up front, so that the target isn't left half synced once the budget runs out
+            if not self._fits_creation_budget(guild_id, commands):
+                self.deferred_sync_targets.add(guild_id)
+                report.deferred = True
+                print(f"Deferring delta sync of {target_name}, not enough of the daily command creation budget is left")
+                return report
+            self.deferred_sync_targets.discard(guild_id)
+            
+            #fetched commands aren't part of the diff, since they were already there
+            with self._recording_sync_diff(guild_id):
+                all_commands = commands is None
+                if all_commands:
+                    commands = self._get_all_commands(guild=guild)
+                
+                def report_error(action: str, name: str, err: Exception) -> None:
+                    report.failed.append(name)
+                    if not ignore_errors:
+                        raise err
+                    print(f"Failed to {action} app command '{name}' in {target_name}, exception: {err}")
+                
+                defined_keys = set()
+                for cmd in commands:
+                    cmd_type = self.get_command_type(cmd)
+                    defined_keys.add((cmd_type, cmd.name))
+                    payload = self.get_command_payload(cmd)
+                    existing = self.get_cached_app_command(cmd.name, guild_id, cmd_type)
+                    
+                    if existing is not None:
+                        server_payload = self._get_app_command_payload(existing)
+                        if self.payload_matches(payload, server_payload):
+                            report.unchanged.append(cmd.name)
+                            continue
+                    
+                    try:
+                        if existing is None:
+                            if guild_id is None:
+                                data = await self._request_with_ratelimit_retries(None, lambda: self._http.upsert_global_command(
+                                    self.client.application_id, payload=payload
+                                ))
+                            else:
+                                data = await self._request_with_ratelimit_retries(guild_id, lambda: self._http.upsert_guild_command(
+                                    self.client.application_id, guild_id, payload=payload
+                                ))
+                        else:
+                            if guild_id is None:
+                                data = await self._request_with_ratelimit_retries(None, lambda: self._http.edit_global_command(
+                                    self.client.application_id, existing.id, payload=payload
+                                ))
+                            else:
+                                data = await self._request_with_ratelimit_retries(guild_id, lambda: self._http.edit_guild_command(
+                                    self.client.application_id, guild_id, existing.id, payload=payload
+                                ))
+                    except Exception as err:
+                        report_error("create" if existing is None else "edit", cmd.name, err)
+                    else:
+                        self._add_app_commands_to_cache(*self._make_app_commands([data]))
+                        (report.edited if existing else report.created).append(cmd.name)
+                
+                if all_commands and delete_stale:
+                    for appcmd in self.get_cached_app_commands(guild_id):
+                        if (appcmd.type, appcmd.name) in defined_keys:
+                            continue
+                        try:
+                            if guild_id is None:
+                                await self._request_with_ratelimit_retries(None, lambda: self._http.delete_global_command(
+                                    self.client.application_id, appcmd.id
+                                ))
+                            else:
+                                await self._request_with_ratelimit_retries(guild_id, lambda: self._http.delete_guild_command(
+                                    self.client.application_id, guild_id, appcmd.id
+                                ))
+                        except Exception as err:
+                            report_error("delete", appcmd.name, err)
+                        else:
+                            self._remove_app_command_from_cache(appcmd)
+                            report.deleted.append(appcmd.name)
+                
+                #only a full delta sync with deletions leaves Discord with exactly what's defined
+                if all_commands and delete_stale and not report.failed:
+                    self._set_synced_digest(guild_id, self.get_commands_payload(commands)[1])
+                elif report.requests_made > (1 if report.fetched else 0):
+                    self._set_synced_digest(guild_id, None)
+        
+        return report
+    
+    
+    #custom
+    async def sync_delta_targets(self,
+        guild_ids: Iterable[Optional[int]],
+        *,
+        commands: Optional[List[ClientsideAppCommand]] = None,
+        delete_stale: bool = False,
+        ignore_errors: bool = False,
+        progress_callback = None
+    ) -> Dict[Optional[int], "DeltaSyncReport"]:
+        """Runs .sync_delta for all given targets (guild ids or None for global) concurrently, see ._run_sync_jobs.
+        commands: if given, only these commands are compared in every target they're defined in.
+        Returns a dictionary of reports per target. The reports are also saved in .last_delta_sync_reports."""
+        
+        reports = {}
+        
+        def make_job(guild_id: Optional[int]) -> tuple:
+            async def job() -> list:
+                target_commands = None
+                if commands is not None:
+                    target_commands = [cmd for cmd in commands if guild_id in self.get_command_locations(cmd)]
+                reports[guild_id] = await self.sync_delta(
+                    guild_id, commands=target_commands, delete_stale=delete_stale, ignore_errors=ignore_errors
+                )
+                return []
+            return (f"Failed to delta sync app commands to {self._get_target_name(guild_id)}", job)
+        
+        with self._deferred_sync_state_saving():
+            await self._run_sync_jobs(
+                [make_job(guild_id) for guild_id in guild_ids],
+                ignore_errors=ignore_errors,
+                progress_callback=progress_callback
+            )
+        
+        self.last_delta_sync_reports = reports
+        return reports
+    
+    
+    #custom
+    def _can_skip_sync(self, guild_id: Optional[int], digest: str) -> bool:
+        """Checks if a payload with the given digest has already been synced to the target, so syncing it again can be skipped.
+        Skipping is only possible if the cache can provide the result instead."""
+        return self._get_synced_digests().get(guild_id, None) == digest and guild_id in self._cached_targets
     
     
     #custom
-    async def _sync(self, commands: List[ClientsideAppCommand], guild_id: Optional[int] = None) -> List[AppCommand]:
+    async def _sync(self, commands: List[ClientsideAppCommand], guild_id: Optional[int] = None, *, force: bool = False) -> Optional[List[AppCommand]]:
         """Low-level sync function that overwrites the given guild's commands (global if None) with only the given commands.
+        If the exact same payload has already been successfully synced to this target before, no request is made
+        and None is returned instead, unless force is True.
         This doesn't save to the cache! That is left up to the caller."""
         
         if self.client.application_id is None:
             raise MissingApplicationID
-        payload = [command.to_dict() for command in commands]
+        (payload, digest) = self.get_commands_payload(commands)
+        violations = self.validate_target(guild_id, commands)
+        if violations:
+            raise InvalidAppCommands(guild_id, violations)
+        if not force and self._can_skip_sync(guild_id, digest):
+            self._interrupted_sync_targets.pop(guild_id, None)
+            return None
+        
         if guild_id is None:
-            data = await self._http.bulk_upsert_global_commands(self.client.application_id, payload=payload)
+            data = await self._request_with_ratelimit_retries(None, lambda: self._http.bulk_upsert_global_commands(
+                self.client.application_id, payload=payload
+            ))
         else:
-            data = await self._http.bulk_upsert_guild_commands(self.client.application_id, guild_id, payload=payload)
-        return [AppCommand(data=d, state=self._state) for d in data]
+            data = await self._request_with_ratelimit_retries(guild_id, lambda: self._http.bulk_upsert_guild_commands(
+                self.client.application_id, guild_id, payload=payload
+            ))
+        self._set_synced_digest(guild_id, digest)
+        results = self._make_app_commands(data)
+        self._journal_synced_target(guild_id, digest)
+        return results
     
     
     #custom
-    async def unsync(self, guild = None, ignore_errors: bool = False) -> None:
-        """Completely wipes all app commands from the given guild (or global if None)."""
+    async def unsync(self, guild = None, ignore_errors: bool = False, force: bool = False) -> None:
+        """Completely wipes all app commands from the given guild (or global if None).
+        force: if True, the request is made even if the target is already known to be empty."""
         
         (_, guild_id) = unpack_guild_object(guild)
         
-        try:
-            await self._sync([], guild_id=guild_id)
-        except Exception as err:
-            if ignore_errors:
-                if guild_id:
-                    print(f"Failed to unsync app commands from guild with id '{guild_id}', exception: {err}")
+        with self._deferred_sync_state_saving(), self._recording_sync_diff(guild_id):
+            try:
+                await self._sync([], guild_id=guild_id, force=force)
+            except Exception as err:
+                #the state of the target is unknown now
+                self._clear_cache(guild_id)
+                if ignore_errors:
+                    if guild_id:
+                        print(f"Failed to unsync app commands from guild with id '{guild_id}', exception: {err}")
+                    else:
+                        print(f"Failed to unsync global app commands, exception: {err}")
                 else:
-                    print(f"Failed to unsync global app commands, exception: {err}")
+                    raise err
             else:
-                raise err
-        finally:
-            self._clear_cache(guild_id)
+                self._overwrite_app_commands_cache([], guild_id=guild_id)
     
     
     #override
@@ -475,149 +2840,150 @@ class SmartCommandTree(discord.app_commands.CommandTree):
         *,
         avoid_deletions: bool = False,
         just_delete: bool = False,
-        ignore_errors: bool = False
+        ignore_errors: bool = False,
+        force: bool = False
     ) -> List[AppCommand]:
         """Syncs commands to the guild (or global if None) and caches the results.
         avoid_deletions: if False, performs a normal sync, which overwrites everything with what's currently defined.
-        if True, uploads every new command individually and leaves other unused commands undisturbed.
+        if True, performs a delta sync (see .sync_delta), which only uploads new or changed commands
+        and leaves other unused commands undisturbed.
         just_delete: if True, no commands will be uploaded. Instead, an empty overwrite request will be made,
         which will delete all app commands from Discord from the given guild (or global if None).
-        ignore_errors: if True, sync errors will only get printed instead of raising an exception."""
+        ignore_errors: if True, sync errors will only get printed instead of raising an exception.
+        force: if False, the sync is skipped when the exact same commands have already been synced to this target,
+        in which case the currently cached AppCommands are returned. If True, the sync request is always made."""
         
         (guild, guild_id) = unpack_guild_object(guild)
         
         if avoid_deletions:
             if just_delete:
                 return []
-            return await self.sync_individually(*self._get_all_commands(guild=guild), ignore_errors=ignore_errors)
+            await self.sync_delta_targets([guild_id], ignore_errors=ignore_errors)
+            return self.get_cached_app_commands(guild_id)
         
         if just_delete:
-            await self.unsync(guild=guild, ignore_errors=ignore_errors)
+            await self.unsync(guild=guild, ignore_errors=ignore_errors, force=force)
             return []
         
         results = []
-        try:
-            results = await super().sync(guild=guild)
-        except Exception as err:
-            if ignore_errors:
-                if guild_id:
-                    print(f"Failed to sync app commands to guild with id '{guild_id}', exception: {err}")
+        with self._deferred_sync_state_saving(), self._recording_sync_diff(guild_id):
+            try:
+                results = await self._sync(self._get_all_commands(guild=guild), guild_id, force=force)
+            except Exception as err:
+                if ignore_errors:
+                    if guild_id:
+                        print(f"Failed to sync app commands to guild with id '{guild_id}', exception: {err}")
+                    else:
+                        print(f"Failed to sync global app commands, exception: {err}")
                 else:
-                    print(f"Failed to sync global app commands, exception: {err}")
+                    raise err
             else:
-                raise err
-        else:
-            self._overwrite_app_commands_cache(results, guild_id=guild_id)
+                if results is None:
+                    #nothing changed since the last sync
+                    results = self.get_cached_app_commands(guild_id)
+                else:
+                    self._overwrite_app_commands_cache(results, guild_id=guild_id)
         
         return results
     
     
     #custom
-    async def sync_all_defined(self, *, avoid_deletions: bool = False, just_delete: bool = False, ignore_errors: bool = False) -> List[AppCommand]:
+    def _make_sync_job(self, guild_id: Optional[int], *, just_delete: bool = False, force: bool = False) -> tuple:
+        """Makes a job for ._run_sync_jobs that syncs the given target (global if None)."""
+        if guild_id is None:
+            error_message = f"Failed to {'clear' if just_delete else 'sync'} global app commands"
+        else:
+            error_message = f"Failed to {'clear app commands from' if just_delete else 'sync app commands to'} {self._get_target_name(guild_id)}"
+        
+        async def job() -> List[AppCommand]:
+            return await self.sync(guild=guild_id, just_delete=just_delete, force=force)
+        return (error_message, job)
+    
+    
+    #custom
+    async def sync_all_defined(self, *,
+        avoid_deletions: bool = False,
+        just_delete: bool = False,
+        ignore_errors: bool = False,
+        force: bool = False,
+        progress_callback = None
+    ) -> List[AppCommand]:
         """Syncs the bot's app commands with Discord both for global commands and for every single guild the bot is in,
         but only if there are commands defined for that given guild/global.
         avoid_deletions: if False, performs a normal sync, which overwrites everything with what's currently defined.
-        if True, uploads every new command individually and leaves other unused commands undisturbed.
+        if True, performs a delta sync (see .sync_delta), which only uploads new or changed commands
+        and leaves other unused commands undisturbed.
         just_delete: if True, no commands will be uploaded. Instead, an empty overwrite request will be made,
         which will delete all app commands from Discord from where commands have been defined.
-        ignore_errors: if True, sync errors will only get printed instead of raising an exception."""
+        ignore_errors: if True, sync errors will only get printed instead of raising an exception.
+        force: if True, targets are synced even if nothing changed since their last sync.
+        progress_callback: optional coroutine function receiving the amount of targets done, failed and remaining.
+        Targets are synced concurrently, see ._run_sync_jobs."""
         
         if avoid_deletions:
             if just_delete:
                 return []
-            return await self.sync_individually(*self.get_all_client_commands(), ignore_errors=ignore_errors)
+            command_targets = self.get_all_command_locations()
+            guild_ids = [guild_id for guild_id in chain([None], (guild.id for guild in self.client.guilds)) if guild_id in command_targets]
+            await self.sync_delta_targets(guild_ids, ignore_errors=ignore_errors, progress_callback=progress_callback)
+            return list(chain.from_iterable(self.get_cached_app_commands(guild_id) for guild_id in guild_ids))
         
-        results = []
         command_targets = self.get_all_command_locations()
+        guild_ids = [guild_id for guild_id in chain([None], (guild.id for guild in self.client.guilds)) if guild_id in command_targets]
+        guild_ids = self._get_valid_targets(guild_ids, just_delete=just_delete)
+        jobs = [self._make_sync_job(guild_id, just_delete=just_delete, force=force) for guild_id in guild_ids]
         
-        #sync global
-        if None in command_targets:
-            try:
-                results += await self.sync(just_delete=just_delete)
-            except Exception as err:
-                if ignore_errors:
-                    print(f"Failed to sync global app commands, exception: {err}")
-                else:
-                    raise err
-        
-        #sync guilds
-        for guild in self.client.guilds:
-            if guild.id not in command_targets:
-                continue
-            try:
-                results += await self.sync(guild=guild, just_delete=just_delete)
-            except Exception as err:
-                if ignore_errors:
-                    print(f"Failed to sync app commands to guild '{guild.name}', exception: {err}")
-                else:
-                    raise err
-        
-        return results
+        with self._deferred_sync_state_saving(), self._journaled_sync_run(dict.fromkeys(guild_ids, just_delete)):
+            return await self._run_sync_jobs(jobs, ignore_errors=ignore_errors, progress_callback=progress_callback)
     
     
     #custom
-    async def sync_all_undefined(self, *, ignore_errors: bool = False) -> None:
+    async def sync_all_undefined(self, *, ignore_errors: bool = False, force: bool = False, progress_callback = None) -> None:
         """Clears app commands from guilds (+global) for which there are no commands defined in the bot.
-        ignore_errors: if True, sync errors will only get printed instead of raising an exception."""
+        ignore_errors: if True, sync errors will only get printed instead of raising an exception.
+        force: if True, targets are cleared even if they are already known to be empty.
+        progress_callback: optional coroutine function receiving the amount of targets done, failed and remaining.
+        Targets are cleared concurrently, see ._run_sync_jobs."""
         
         command_targets = self.get_all_command_locations()
         
-        #sync global
-        if None not in command_targets:
-            try:
-                await self.sync(just_delete=just_delete)
-            except Exception as err:
-                if ignore_errors:
-                    print(f"Failed to clear global app commands, exception: {err}")
-                else:
-                    raise err
+        guild_ids = [guild_id for guild_id in chain([None], (guild.id for guild in self.client.guilds)) if guild_id not in command_targets]
+        jobs = [self._make_sync_job(guild_id, just_delete=True, force=force) for guild_id in guild_ids]
         
-        #sync guilds
-        for guild in self.client.guilds:
-            if guild.id in command_targets:
-                continue
-            try:
-                await self.sync(guild=guild, just_delete=just_delete)
-            except Exception as err:
-                if ignore_errors:
-                    print(f"Failed to clear app commands from guild '{guild.name}', exception: {err}")
-                else:
-                    raise err
+        with self._deferred_sync_state_saving(), self._journaled_sync_run(dict.fromkeys(guild_ids, True)):
+            await self._run_sync_jobs(jobs, ignore_errors=ignore_errors, progress_callback=progress_callback)
     
     
     #custom
-    async def sync_all(self, *, avoid_deletions: bool = False, just_delete: bool = False, ignore_errors: bool = False) -> List[AppCommand]:
+    async def sync_all(self, *,
+        avoid_deletions: bool = False,
+        just_delete: bool = False,
+        ignore_errors: bool = False,
+        force: bool = False,
+        progress_callback = None
+    ) -> List[AppCommand]:
         """Syncs the bot's app commands with Discord both for global commands and for every single guild the bot is in.
         avoid_deletions: if False, performs a normal sync, which overwrites everything with what's currently defined.
-        if True, uploads every new command individually and leaves other unused commands undisturbed.
+        if True, performs a delta sync (see .sync_delta), which only uploads new or changed commands
+        and leaves other unused commands undisturbed.
         just_delete: if True, no commands will be uploaded. Instead, an empty overwrite request will be made,
         which will delete all app commands from Discord.
-        ignore_errors: if True, sync errors will only get printed instead of raising an exception."""
+        ignore_errors: if True, sync errors will only get printed instead of raising an exception.
+        force: if True, targets are synced even if nothing changed since their last sync.
+        progress_callback: optional coroutine function receiving the amount of targets done, failed and remaining.
+        Targets are synced concurrently, see ._run_sync_jobs."""
         
         if avoid_deletions:
             if just_delete:
                 return []
-            return await self.sync_all_defined(avoid_deletions=avoid_deletions, ignore_errors=ignore_errors)
+            return await self.sync_all_defined(avoid_deletions=avoid_deletions, ignore_errors=ignore_errors, progress_callback=progress_callback)
         
-        results = []
-        try:
-            results += await self.sync(just_delete=just_delete)
-        except Exception as err:
-            if ignore_errors:
-                print(f"Failed to sync global app commands, exception: {err}")
-            else:
-                raise err
-            
-        for guild in self.client.guilds:
-            try:
-                results += await self.sync(guild=guild, just_delete=just_delete)
-            except Exception as err:
-                if ignore_errors:
-                    print(f"Failed to sync app commands to guild '{guild.name}', exception: {err}")
-                else:
-                    raise err
-        #cache is handled automatically by .sync()
-        return results
+        guild_ids = self._get_valid_targets([None] + [guild.id for guild in self.client.guilds], just_delete=just_delete)
+        jobs = [self._make_sync_job(guild_id, just_delete=just_delete, force=force) for guild_id in guild_ids]
+        
+        with self._deferred_sync_state_saving(), self._journaled_sync_run(dict.fromkeys(guild_ids, just_delete)):
+            #cache is handled automatically by .sync()
+            return await self._run_sync_jobs(jobs, ignore_errors=ignore_errors, progress_callback=progress_callback)
     
     
     #custom
@@ -625,61 +2991,316 @@ class SmartCommandTree(discord.app_commands.CommandTree):
         *commands: ClientsideAppCommand,
         avoid_deletions: bool = False,
         just_delete: bool = False,
-        ignore_errors: bool = False
+        ignore_errors: bool = False,
+        force: bool = False
     ) -> List[AppCommand]:
         """Syncs the tree to all guilds (or global) defined in the given commands.
         avoid_deletions: if False, performs a normal sync, which overwrites everything with what's currently defined.
-        if True, uploads every new command individually and leaves other unused commands undisturbed.
+        if True, performs a delta sync (see .sync_delta) of just the given commands, which only uploads
+        the new or changed ones and leaves other unused commands undisturbed.
         just_delete: if True, no commands will be uploaded. Instead, an empty overwrite request will be made,
         which will delete all app commands from Discord from the given targets.
-        ignore_errors: if True, sync errors will only get printed instead of raising an exception."""
+        ignore_errors: if True, sync errors will only get printed instead of raising an exception.
+        force: if True, targets are synced even if nothing changed since their last sync."""
         
-        if avoid_deletions:
-            if just_delete:
-                return []
-            return await self.sync_individually(*commands, ignore_errors=ignore_errors)
+        if avoid_deletions and just_delete:
+            return []
         
         #get all command locations
         guild_ids = set()
         for cmd in commands:
             guild_ids.update(self.get_command_locations(cmd))
         
-        results = []
-        for guild_id in guild_ids:
-            results += await self.sync(guild=guild_id, just_delete=just_delete, ignore_errors=ignore_errors)
+        if avoid_deletions:
+            await self.sync_delta_targets(guild_ids, commands=list(commands), ignore_errors=ignore_errors)
+            return [
+                appcmd for appcmd in (
+                    self.get_cached_app_command(cmd.name, guild_id, self.get_command_type(cmd))
+                    for cmd in commands for guild_id in self.get_command_locations(cmd)
+                ) if appcmd
+            ]
         
-        return results
+        guild_ids = self._get_valid_targets(guild_ids, just_delete=just_delete)
+        with self._deferred_sync_state_saving(), self._journaled_sync_run(dict.fromkeys(guild_ids, just_delete)):
+            return await self._run_sync_jobs(
+                [self._make_sync_job(guild_id, just_delete=just_delete, force=force) for guild_id in guild_ids],
+                ignore_errors=ignore_errors
+            )
     
     
     #custom
-    async def unsync_given(self, *commands: AnyCommand, ignore_errors: bool = False) -> List[AppCommand]:
+    async def unsync_given(self, *commands: AnyCommand, ignore_errors: bool = False, force: bool = False) -> List[AppCommand]:
         """Syncs the tree to all guilds (or global) defined in the given commands, but omitting these commands.
-        ignore_errors: if True, sync errors will only get printed instead of raising an exception."""
+        ignore_errors: if True, sync errors will only get printed instead of raising an exception.
+        force: if True, targets are synced even if nothing changed since their last sync."""
         
         #get all command locations
         guild_ids = set()
         for cmd in commands:
             guild_ids.update(self.get_command_locations(cmd))
         
-        results = []
+        omitted_keys = set(chain.from_iterable(self.get_command_keys(cmd) for cmd in commands))
         
-        for guild_id in guild_ids:
-            try:
+        def make_job(guild_id: Optional[int]):
+            async def job() -> List[AppCommand]:
                 remaining_commands = [
                     cmd for cmd in self._get_all_commands(guild=unpack_guild_object(guild_id)[0])
-                    if not self.get_equal_command_from(cmd, commands)
+                    if (self.get_command_type(cmd), cmd.name, guild_id) not in omitted_keys
                 ]
-                result = await self._sync(remaining_commands, guild_id)
-            except Exception as err:
-                if ignore_errors:
-                    if guild_id:
-                        print(f"Failed to sync app command to guild with id '{guild_id}', exception: {err}")
-                    else:
-                        print(f"Failed to sync global app commands, exception: {err}")
+                with self._recording_sync_diff(guild_id):
+                    result = await self._sync(remaining_commands, guild_id, force=force)
+                    if result is None:
+                        #nothing changed since the last sync
+                        return self.get_cached_app_commands(guild_id)
+                    self._overwrite_app_commands_cache(result, guild_id=guild_id)
+                return result
+            
+            if guild_id is None:
+                return ("Failed to sync global app commands", job)
+            return (f"Failed to sync app command to guild with id '{guild_id}'", job)
+        
+        with self._deferred_sync_state_saving():
+            return await self._run_sync_jobs([make_job(guild_id) for guild_id in guild_ids], ignore_errors=ignore_errors)
+    
+    
+    #custom
+    def _plan_target(self,
+        guild_id: Optional[int],
+        commands: List[ClientsideAppCommand],
+        mode: str,
+        *,
+        force: bool = False,
+        validate: bool = False
+    ) -> TargetSyncPlan:
+        """Estimates a sync of the given commands to a single target, without making any requests.
+        mode: "bulk" for an overwrite (like .sync), "delta" for .sync_delta without deletions
+        or "individual" for .sync_individually.
+        validate: if True, the target is checked like the syncs do (see ._get_valid_targets), so a target exceeding
+        Discord's limits or the remaining creation budget gets planned without any requests."""
+        
+        cached = self.is_target_cached(guild_id)
+        plan = TargetSyncPlan(guild_id, cached)
+        if validate:
+            plan.violations = self.validate_target(guild_id, commands)
+            if plan.violations:
+                return plan
+            if not self._fits_creation_budget(guild_id, commands):
+                plan.deferred = True
+                return plan
+        (payloads, digest) = self.get_commands_payload(commands)
+        
+        if mode == "bulk" and not force and self._can_skip_sync(guild_id, digest):
+            plan.skipped = True
+            plan.unchanged.extend(cmd.name for cmd in commands)
+            return plan
+        
+        defined_keys = set()
+        for cmd, payload in zip(commands, payloads):
+            cmd_type = self.get_command_type(cmd)
+            defined_keys.add((cmd_type, cmd.name))
+            existing = self.get_cached_app_command(cmd.name, guild_id, cmd_type) if cached else None
+            if existing is None:
+                plan.created.append(cmd.name)
+            elif self.payload_matches(payload, self._get_app_command_payload(existing)):
+                plan.unchanged.append(cmd.name)
+            else:
+                plan.edited.append(cmd.name)
+        
+        if mode == "bulk":
+            if cached:
+                plan.deleted.extend(appcmd.name for appcmd in self.get_cached_app_commands(guild_id) if (appcmd.type, appcmd.name) not in defined_keys)
+            plan.requests = 1
+        elif mode == "delta":
+            plan.requests = (0 if cached else 1) + len(plan.created) + len(plan.edited)
+        else:
+            #every command is uploaded, even if unchanged
+            plan.requests = len(commands)
+        return plan
+    
+    
+    #custom
+    def plan_sync(self, *strategies: str, force: bool = False) -> Dict[str, SyncPlan]:
+        """Estimates what the given sync strategies would send to Discord, computed only from the clientside commands
+        and the cache, without making any requests. Useful for picking the cheapest way to sync a big deployment.
+        strategies: any of "sync_all", "sync_all_defined", "sync_delta" (sync_all_defined with avoid_deletions),
+        "sync_individually" (of all clientside commands) and "prune" (sync_all with just_delete). All if none are given.
+        force: if True, bulk syncs are planned as if they were forced, so no target gets skipped.
+        Targets are validated and checked against the creation budget just like the syncs do.
+        Strategies cover different targets, see .get_cheapest_plans for comparing them.
+        Returns a dictionary of plans per strategy."""
+        
+        self.load_sync_state()
+        strategies = strategies or ("sync_all", "sync_all_defined", "sync_delta", "sync_individually", "prune")
+        
+        command_targets = self.get_all_command_locations()
+        all_targets = [None] + [guild.id for guild in self.client.guilds]
+        defined_targets = [guild_id for guild_id in all_targets if guild_id in command_targets]
+        
+        def get_commands(guild_id: Optional[int]) -> list:
+            return self._get_all_commands(guild=unpack_guild_object(guild_id)[0])
+        
+        plans = {}
+        for strategy in strategies:
+            plan = SyncPlan(strategy)
+            if strategy == "sync_all":
+                for guild_id in all_targets:
+                    plan.targets[guild_id] = self._plan_target(guild_id, get_commands(guild_id), "bulk", force=force, validate=True)
+            elif strategy == "sync_all_defined":
+                for guild_id in defined_targets:
+                    plan.targets[guild_id] = self._plan_target(guild_id, get_commands(guild_id), "bulk", force=force, validate=True)
+            elif strategy == "sync_delta":
+                for guild_id in defined_targets:
+                    plan.targets[guild_id] = self._plan_target(guild_id, get_commands(guild_id), "delta", validate=True)
+            elif strategy == "sync_individually":
+                for guild_id in command_targets:
+                    plan.targets[guild_id] = self._plan_target(guild_id, get_commands(guild_id), "individual")
+            elif strategy == "prune":
+                for guild_id in all_targets:
+                    plan.targets[guild_id] = self._plan_target(guild_id, [], "bulk", force=force)
+            else:
+                raise ValueError(f"Unknown sync strategy '{strategy}'.")
+            plans[strategy] = plan
+        
+        return plans
+    
+    
+    #custom
+    @staticmethod
+    def get_cheapest_plans(plans: Dict[str, SyncPlan]) -> List[Tuple[SyncPlan, List[SyncPlan]]]:
+        """Compares the plans of the full sync strategies ("sync_all", "sync_all_defined" and "sync_delta"), but only
+        between those covering the exact same targets, since a strategy syncing fewer targets isn't cheaper, just different.
+        Returns a list of (cheapest plan, all compared plans), one per group of at least two plans with the same targets."""
+        groups = {}
+        for strategy in ("sync_all", "sync_all_defined", "sync_delta"):
+            plan = plans.get(strategy, None)
+            if plan is not None:
+                groups.setdefault(frozenset(plan.targets), []).append(plan)
+        return [
+            (min(group, key=lambda plan: (plan.requests, plan.creations)), group)
+            for group in groups.values() if len(group) > 1
+        ]
+    
+    
+    #custom
+    def schedule_sync_given(self, *commands: AnyCommand, avoid_deletions: bool = False) -> asyncio.Future:
+        """Schedules a sync of all guilds (or global) defined in the given commands, to be ran once no other sync
+        got scheduled for .sync_debounce_delay seconds. Bursts of extension loads, unloads and reloads therefore
+        result in a single sync per target. Every target is synced to what's defined in the tree at that time,
+        so commands removed from the tree in the meantime (like those of an unloaded cog) get removed from Discord as well.
+        avoid_deletions: if True, the given commands are delta synced instead (see .sync_delta), unless their target
+        is also scheduled for a full sync.
+        Returns a future, which is resolved once the scheduled syncs finish. Sync errors are only printed.
+        The future can be awaited, but doesn't have to be."""
+        
+        for cmd in commands:
+            for guild_id in self.get_command_locations(cmd):
+                if avoid_deletions:
+                    scheduled_commands = self._scheduled_delta_commands.setdefault(guild_id, [])
+                    if scheduled_commands is not None:
+                        scheduled_commands.append(cmd)
                 else:
-                    raise err
+                    self._scheduled_sync_targets.add(guild_id)
+        
+        return self._restart_sync_debounce()
+    
+    
+    #custom
+    def schedule_sync(self, *guild_ids: Optional[int], avoid_deletions: bool = False) -> asyncio.Future:
+        """Schedules a sync of the given targets (guild ids or None for global), the same way as .schedule_sync_given.
+        avoid_deletions: if True, all commands of the targets are delta synced instead (see .sync_delta)."""
+        for guild_id in guild_ids:
+            if avoid_deletions:
+                self._scheduled_delta_commands[guild_id] = None
             else:
-                self._overwrite_app_commands_cache(result, guild_id=guild_id)
-                results += result
+                self._scheduled_sync_targets.add(guild_id)
         
-        return results
+        return self._restart_sync_debounce()
+    
+    
+    #custom
+    def _restart_sync_debounce(self) -> asyncio.Future:
+        """Restarts the quiet window of scheduled syncs and returns the future of the scheduled batch."""
+        loop = asyncio.get_running_loop()
+        if self._scheduled_sync_future is None:
+            self._scheduled_sync_future = loop.create_future()
+        future = self._scheduled_sync_future
+        
+        if self._scheduled_sync_handle is not None:
+            self._scheduled_sync_handle.cancel()
+        self._scheduled_sync_handle = loop.call_later(max(0.0, self.sync_debounce_delay), self._start_scheduled_syncs)
+        return future
+    
+    
+    #custom
+    def _start_scheduled_syncs(self) -> Optional[asyncio.Future]:
+        """Takes all scheduled syncs and starts running them in a task. Syncs scheduled from now on form a new batch.
+        Returns the future of the started batch, or None if nothing was scheduled."""
+        if self._scheduled_sync_handle is not None:
+            self._scheduled_sync_handle.cancel()
+            self._scheduled_sync_handle = None
+        
+        future = self._scheduled_sync_future
+        if future is None:
+            return None
+        
+        full_targets = self._scheduled_sync_targets
+        delta_commands = {
+            guild_id: cmds for guild_id, cmds in self._scheduled_delta_commands.items() if guild_id not in full_targets
+        }
+        self._scheduled_sync_targets = set()
+        self._scheduled_delta_commands = {}
+        self._scheduled_sync_future = None
+        
+        self._running_scheduled_sync_future = future
+        self._scheduled_sync_task = asyncio.get_running_loop().create_task(
+            self._run_scheduled_syncs(full_targets, delta_commands, future)
+        )
+        return future
+    
+    
+    #custom
+    async def _run_scheduled_syncs(self,
+        full_targets: Set[Optional[int]],
+        delta_commands: Dict[Optional[int], List[ClientsideAppCommand]],
+        future: asyncio.Future
+    ) -> None:
+        """Runs a batch of scheduled syncs and resolves its future."""
+        
+        def make_delta_job(guild_id: Optional[int]) -> tuple:
+            async def job() -> list:
+                self.last_delta_sync_reports[guild_id] = await self.sync_delta(
+                    guild_id, commands=delta_commands[guild_id], ignore_errors=True
+                )
+                return []
+            return (f"Failed to delta sync app commands to {self._get_target_name(guild_id)}", job)
+        
+        jobs = [self._make_sync_job(guild_id) for guild_id in full_targets]
+        jobs.extend(make_delta_job(guild_id) for guild_id in delta_commands)
+        
+        try:
+            with self._deferred_sync_state_saving():
+                result = await self._run_sync_jobs(jobs, ignore_errors=True)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as err:
+            if not future.done():
+                future.set_exception(err)
+                #don't complain about exceptions of futures nobody awaited
+                future.exception()
+        else:
+            if not future.done():
+                future.set_result(result)
+        finally:
+            if self._running_scheduled_sync_future is future:
+                self._running_scheduled_sync_future = None
+    
+    
+    #custom
+    async def flush_scheduled_syncs(self) -> List[AppCommand]:
+        """Runs all scheduled syncs right away, without waiting for the rest of the quiet window, and waits for them to finish.
+        If nothing is scheduled, waits for the batch that is currently running instead (if any)."""
+        future = self._start_scheduled_syncs() or self._running_scheduled_sync_future
+        if future is None:
+            return []
+        return await asyncio.shield(future)
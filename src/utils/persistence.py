@@ -0,0 +1,57 @@
+import json
+import os
+
+
+
+def load_json_file(path: str, default = None):
+    """Loads and returns the contents of a json file.
+    If the file doesn't exist or can't be parsed, default is returned instead."""
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return default
+
+
+def save_json_file(path: str, data) -> None:
+    """Saves data into a json file. The file is first written under a temporary name
+    and then swapped in, so that an interrupted write never leaves a corrupted file behind."""
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file, separators=(",", ":"))
+    os.replace(temp_path, path)
+
+
+def delete_file(path: str) -> bool:
+    """Deletes a file if it exists. Returns True if something was deleted."""
+    try:
+        os.remove(path)
+    except OSError:
+        return False
+    return True
+
+
+def append_json_lines(path: str, values: list) -> None:
+    """Appends every value as a single line of json to a file, creating it if needed.
+    The lines are flushed to the disk right away (together), so that they survive the process getting killed."""
+    with open(path, "a", encoding="utf-8") as file:
+        file.write("".join(json.dumps(data, separators=(",", ":")) + "\n" for data in values))
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def load_json_lines(path: str) -> list:
+    """Loads a file with a json value on every line (as made by append_json_lines) and returns a list of the values.
+    Lines that can't be parsed (like the last one, if the process got killed while writing it) are skipped.
+    If the file doesn't exist, an empty list is returned."""
+    results = []
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    results.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        return []
+    return results
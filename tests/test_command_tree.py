@@ -0,0 +1,446 @@
+import os
+import sys
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+import discord
+from discord import app_commands
+
+from smart_command_tree import SmartCommandTree
+from custom_errors import InvalidAppCommands
+from fake_discord_http import FakeDiscordHTTP
+
+
+_FIRST_GUILD_ID = 100000000000000000
+
+
+
+async def _slash_callback(interaction: discord.Interaction) -> None:
+    pass
+
+async def _user_callback(interaction: discord.Interaction, user: discord.User) -> None:
+    pass
+
+
+def make_tree(guild_count: int = 3, **http_options) -> SmartCommandTree:
+    """Makes an offline client with the given amount of guilds and an empty SmartCommandTree,
+    whose requests go to a FakeDiscordHTTP without latency."""
+    http = FakeDiscordHTTP(**{"latency": 0.0, **http_options})
+    client = discord.Client(intents=discord.Intents.none())
+    client.http = http
+    state = client._connection
+    state.application_id = http.application_id
+    for i in range(guild_count):
+        state._add_guild(discord.Guild(data={"id": str(_FIRST_GUILD_ID + i), "name": f"guild {i}"}, state=state))
+    tree = SmartCommandTree(client)
+    tree.sync_retry_base_delay = 0.001
+    return tree
+
+
+def make_command(name: str, description: str = "Command") -> app_commands.Command:
+    return app_commands.Command(name=name, description=description, callback=_slash_callback)
+
+
+def make_group(name: str, *subcommand_names: str) -> app_commands.Group:
+    group = app_commands.Group(name=name, description="Group")
+    for subcommand_name in subcommand_names:
+        group.add_command(make_command(subcommand_name))
+    return group
+
+
+
+def test_plan_compares_only_strategies_with_the_same_targets():
+    async def run():
+        tree = make_tree()
+        tree.add_command(make_command("ping"))
+        tree.add_command(make_command("admin"), guild=discord.Object(id=_FIRST_GUILD_ID))
+        await tree.sync_all()
+
+        tree.add_command(make_command("pong"))
+        plans = tree.plan_sync("sync_all", "sync_all_defined", "sync_delta")
+        assert len(plans["sync_all"].targets) == 4
+        assert len(plans["sync_all_defined"].targets) == 2
+
+        cheapest_plans = tree.get_cheapest_plans(plans)
+        assert len(cheapest_plans) == 1
+        (cheapest, compared) = cheapest_plans[0]
+        assert {plan.strategy for plan in compared} == {"sync_all_defined", "sync_delta"}
+        assert cheapest.requests == 1
+
+    asyncio.run(run())
+
+
+def test_plan_skips_invalid_and_deferred_targets():
+    async def run():
+        tree = make_tree()
+        tree.add_command(make_command("ping"))
+        await tree.sync_all()
+
+        too_long = make_command("admin")
+        too_long.description = "x" * 101
+        tree.add_command(too_long, guild=discord.Object(id=_FIRST_GUILD_ID))
+        tree.add_command(make_command("pong"))
+        tree.daily_creation_limit = 0
+        plan = tree.plan_sync("sync_all")["sync_all"]
+
+        assert plan.targets[_FIRST_GUILD_ID].violations
+        assert plan.targets[None].deferred
+        assert plan.invalid == 1 and plan.deferred == 1
+        assert plan.requests == plan.targets[_FIRST_GUILD_ID + 1].requests + plan.targets[_FIRST_GUILD_ID + 2].requests
+
+    asyncio.run(run())
+
+
+def test_compact_cache_shares_payloads_between_guilds():
+    async def run():
+        tree = make_tree()
+        tree.set_compact_cache(True)
+        template = make_command("server")
+        tree.register_all_guilds_command(template)
+        tree.add_command(template)
+        await tree.sync_all()
+
+        #every guild has its own record, but a single shared payload, and nothing is stored per command besides it
+        assert not tree._app_command_payloads
+        assert len(tree._shared_payloads) == 1
+        appcmd = tree.get_cached_app_command("server", _FIRST_GUILD_ID)
+        assert appcmd.guild_id == _FIRST_GUILD_ID and appcmd.description == "Command"
+        sizes = await tree.measure_cache_memory()
+        assert sizes["commands"] == 3 and sizes["total"] == sizes["records"] + sizes["payloads"]
+
+        #refetching keeps the ids, the payloads have to survive the overwrite
+        tree.set_compact_cache(False)
+        await tree.fetch_commands(guild=_FIRST_GUILD_ID)
+        assert tree._app_command_payloads[appcmd.id]["name"] == "server"
+        assert not tree._shared_payloads
+
+        tree.set_compact_cache(True)
+        for guild_id in range(_FIRST_GUILD_ID, _FIRST_GUILD_ID + 3):
+            tree._clear_cache(guild_id)
+        assert not tree._shared_payloads
+
+    asyncio.run(run())
+
+
+def test_detached_guild_is_forgotten():
+    async def run():
+        tree = make_tree()
+        template = make_command("server")
+        tree.register_all_guilds_command(template)
+        tree.add_command(template)
+        tree.add_command(make_command("admin"), guild=discord.Object(id=_FIRST_GUILD_ID))
+        await tree.sync_all()
+
+        tree.detach_guild(_FIRST_GUILD_ID)
+        assert _FIRST_GUILD_ID not in tree._guild_commands
+        assert tree.get_client_command("admin", _FIRST_GUILD_ID) is None
+        assert not tree.is_target_cached(_FIRST_GUILD_ID)
+        assert tree.get_cached_app_commands(_FIRST_GUILD_ID) == []
+        #the template still applies to the other guilds
+        assert tree.get_client_command("server", _FIRST_GUILD_ID + 1) is template
+
+    asyncio.run(run())
+
+
+def test_delta_sync_over_the_creation_budget_is_deferred():
+    async def run():
+        tree = make_tree()
+        tree.add_command(make_command("ping"))
+        await tree.sync_all()
+
+        tree.add_command(make_command("pong"))
+        tree.add_command(make_command("pang"))
+        #room for just one of the two new commands
+        tree.daily_creation_limit -= tree.get_creation_budget(None) - 1
+        tree._http.reset_stats()
+        report = await tree.sync_delta(None)
+
+        assert report.deferred and not report.created and not report.failed
+        assert tree._http.total_requests == 0
+        assert None in tree.deferred_sync_targets
+
+        tree.daily_creation_limit = 200
+        report = await tree.sync_delta(None)
+        assert sorted(report.created) == ["pang", "pong"]
+        assert None not in tree.deferred_sync_targets
+
+    asyncio.run(run())
+
+
+def test_guild_command_shadows_template_with_the_same_name():
+    async def run():
+        tree = make_tree()
+        template = make_command("server", "Template")
+        tree.register_all_guilds_command(template)
+        tree.add_command(template)
+        own = make_command("server", "Own")
+        tree.add_command(own, guild=discord.Object(id=_FIRST_GUILD_ID))
+
+        first_guild = discord.Object(id=_FIRST_GUILD_ID)
+        other_guild = discord.Object(id=_FIRST_GUILD_ID + 1)
+        assert tree.get_command("server", guild=first_guild) is own
+        assert tree.get_command("server", guild=other_guild) is template
+        assert tree.get_commands(guild=first_guild) == [own]
+        assert tree._get_all_commands(guild=other_guild) == [template]
+        assert tree._get_app_command_options({"name": "server", "guild_id": str(_FIRST_GUILD_ID + 1)}) == (template, [])
+
+        await tree.sync_all()
+        assert [cmd["description"] for cmd in tree._http.commands[_FIRST_GUILD_ID].values()] == ["Own"]
+        assert [cmd["description"] for cmd in tree._http.commands[_FIRST_GUILD_ID + 1].values()] == ["Template"]
+
+    asyncio.run(run())
+
+
+def test_permissions_update_event_is_written_into_the_cache():
+    async def run():
+        tree = make_tree()
+        tree.add_command(make_command("ping"))
+        await tree.sync_all()
+        http = tree._http
+        appcmd = tree.get_cached_app_command("ping", None)
+        await tree.fetch_guild_command_permissions(_FIRST_GUILD_ID)
+        http.reset_stats()
+
+        role_id = _FIRST_GUILD_ID + 10
+        data = {
+            "id": str(appcmd.id), "application_id": str(http.application_id), "guild_id": str(_FIRST_GUILD_ID),
+            "permissions": [{"id": str(role_id), "type": 1, "permission": False}]
+        }
+        tree.on_command_permissions_update(discord.RawAppCommandPermissionsUpdateEvent(data=data, state=tree._state))
+        assert tree.is_command_permissions_cached(appcmd.id, _FIRST_GUILD_ID)
+        permissions = await tree.get_command_permissions(appcmd.id, _FIRST_GUILD_ID)
+        assert [(p.id, p.permission) for p in permissions.permissions] == [(role_id, False)]
+        assert http.total_requests == 0
+
+        #overwrites reset to the defaults
+        data["permissions"] = []
+        tree.on_command_permissions_update(discord.RawAppCommandPermissionsUpdateEvent(data=data, state=tree._state))
+        assert tree.is_command_permissions_cached(appcmd.id, _FIRST_GUILD_ID)
+        assert tree.get_cached_command_permissions(appcmd.id, _FIRST_GUILD_ID) is None
+
+        #an incomplete event only marks the overwrites as changed
+        event = discord.RawAppCommandPermissionsUpdateEvent(data=data, state=tree._state)
+        event.permissions = None
+        tree.on_command_permissions_update(event)
+        assert not tree.is_command_permissions_cached(appcmd.id, _FIRST_GUILD_ID)
+        assert await tree.get_command_permissions(appcmd.id, _FIRST_GUILD_ID) is None
+        assert http.total_requests == 1
+
+    asyncio.run(run())
+
+
+def test_unchanged_targets_are_not_synced_again():
+    async def run():
+        tree = make_tree()
+        tree.add_command(make_command("ping"))
+        await tree.sync_all()
+        assert tree._http.requests["bulk_upsert_commands"] == 4
+
+        tree._http.reset_stats()
+        results = await tree.sync_all()
+        assert tree._http.total_requests == 0
+        assert [appcmd.name for appcmd in results] == ["ping"]
+
+        await tree.sync_all(force=True)
+        assert tree._http.requests["bulk_upsert_commands"] == 4
+
+    asyncio.run(run())
+
+
+def test_ratelimited_requests_are_retried():
+    async def run():
+        tree = make_tree(0, raise_ratelimits=True, bucket_limit=1, bucket_period=0.01)
+        ping = make_command("ping")
+        tree.add_command(ping)
+        await tree.sync()
+
+        ping.description = "Changed"
+        tree.invalidate_payload_cache(ping)
+        await tree.sync()
+        assert tree._http.ratelimited == 1
+        assert tree._http.requests["bulk_upsert_commands"] == 3
+        assert tree.get_cached_app_command("ping", None).description == "Changed"
+
+    asyncio.run(run())
+
+
+def test_delta_sync_sends_only_the_differences():
+    async def run():
+        tree = make_tree(0)
+        ping = make_command("ping")
+        tree.add_command(ping)
+        tree.add_command(make_command("old"))
+        await tree.sync()
+
+        ping.description = "Changed"
+        tree.invalidate_payload_cache(ping)
+        tree.remove_command("old")
+        tree.add_command(make_command("pong"))
+        tree._http.reset_stats()
+        report = await tree.sync_delta(None, delete_stale=True)
+
+        assert (report.created, report.edited, report.deleted) == (["pong"], ["ping"], ["old"])
+        assert not report.fetched and report.requests_made == 3
+        assert tree._http.requests == {"upsert_command": 1, "edit_command": 1, "delete_command": 1}
+        assert sorted(appcmd.name for appcmd in tree.get_cached_app_commands(None)) == ["ping", "pong"]
+
+        #the target is known to match now
+        tree._http.reset_stats()
+        await tree.sync()
+        assert tree._http.total_requests == 0
+
+    asyncio.run(run())
+
+
+def test_concurrent_fetches_share_a_request():
+    async def run():
+        tree = make_tree(0, latency=0.01)
+        tree.add_command(make_command("ping"))
+        await tree.sync()
+        tree._http.reset_stats()
+
+        results = await asyncio.gather(*(tree.fetch_commands() for _ in range(5)))
+        assert tree._http.requests["get_commands"] == 1
+        assert all([appcmd.name for appcmd in result] == ["ping"] for result in results)
+        #every caller gets its own list
+        assert len({id(result) for result in results}) == 5
+
+    asyncio.run(run())
+
+
+def test_unknown_command_ids_are_remembered():
+    async def run():
+        tree = make_tree(0)
+        tree.add_command(make_command("ping"))
+        await tree.sync()
+        tree._http.reset_stats()
+
+        assert await tree.get_command_by_id(12345) is None
+        assert await tree.get_command_by_id(12345) is None
+        assert tree._http.requests["get_command"] == 1
+
+        #once forgotten, the id gets fetched again
+        tree.unknown_command_id_ttl = 0.0
+        assert await tree.get_command_by_id(12345, fetch_priority=2) is None
+        assert await tree.get_command_by_id(12345) is None
+        assert tree._http.requests["get_command"] == 3
+
+    asyncio.run(run())
+
+
+def test_scheduled_syncs_are_debounced():
+    async def run():
+        tree = make_tree()
+        tree.sync_debounce_delay = 0.01
+        tree.add_command(make_command("ping"))
+        tree.add_command(make_command("admin"), guild=discord.Object(id=_FIRST_GUILD_ID))
+
+        futures = [tree.schedule_sync(None), tree.schedule_sync(_FIRST_GUILD_ID), tree.schedule_sync(None)]
+        assert len(set(futures)) == 1
+        await asyncio.sleep(0)
+        assert tree._http.total_requests == 0
+
+        results = await futures[0]
+        assert tree._http.requests["bulk_upsert_commands"] == 2
+        assert sorted(appcmd.name for appcmd in results) == ["admin", "ping"]
+        assert await tree.flush_scheduled_syncs() == []
+
+    asyncio.run(run())
+
+
+def test_targets_over_the_limits_are_not_synced():
+    async def run():
+        tree = make_tree()
+        tree.add_command(make_command("ping"))
+        too_long = make_command("admin")
+        too_long.description = "x" * 101
+        tree.add_command(too_long, guild=discord.Object(id=_FIRST_GUILD_ID))
+
+        violations = tree.validate_target(_FIRST_GUILD_ID)
+        assert [violation.command for violation in violations] == ["admin"]
+        assert list(tree.validate_all_targets()) == [_FIRST_GUILD_ID]
+        try:
+            await tree.sync(_FIRST_GUILD_ID)
+        except InvalidAppCommands:
+            pass
+        else:
+            assert False, "invalid commands were synced"
+        assert tree._http.total_requests == 0
+
+        await tree.sync_all()
+        assert tree._http.requests["bulk_upsert_commands"] == 3
+        assert _FIRST_GUILD_ID not in tree._http.commands
+
+    asyncio.run(run())
+
+
+def test_creations_are_counted_against_the_daily_budget():
+    async def run():
+        tree = make_tree(0)
+        tree.add_command(make_command("ping"))
+        await tree.sync()
+        assert tree.get_creation_budget(None) == tree.daily_creation_limit - 1
+        assert tree.get_creation_quota_report()[None]["used"] == 1
+
+        #editing an existing command doesn't count
+        tree.daily_creation_limit = 1
+        tree.add_command(make_command("pong"))
+        tree._http.reset_stats()
+        await tree.sync_all()
+        assert tree._http.total_requests == 0
+        assert None in tree.deferred_sync_targets
+
+        tree.daily_creation_limit = 2
+        await tree.sync_all()
+        assert tree._http.requests["bulk_upsert_commands"] == 1
+        assert None not in tree.deferred_sync_targets
+        assert tree.get_creation_budget(None) == 0
+
+    asyncio.run(run())
+
+
+def test_templates_apply_to_every_guild():
+    async def run():
+        tree = make_tree()
+        template = make_command("server")
+        tree.register_all_guilds_command(template)
+        tree.add_command(template)
+        await tree.sync_all()
+
+        assert not tree._http.commands[None]
+        for i in range(3):
+            assert [cmd["name"] for cmd in tree._http.commands[_FIRST_GUILD_ID + i].values()] == ["server"]
+            assert tree.get_command("server", guild=discord.Object(id=_FIRST_GUILD_ID + i)) is template
+        assert tree.get_command("server") is None
+        assert tree.get_command("server", guild=discord.Object(id=1)) is None
+
+        #removing the template removes it from every guild
+        tree.remove_command("server", guild=discord.Object(id=_FIRST_GUILD_ID))
+        await tree.sync_all()
+        assert not any(tree._http.commands[_FIRST_GUILD_ID + i] for i in range(3))
+
+    asyncio.run(run())
+
+
+def test_mentions_are_indexed_for_subcommands():
+    async def run():
+        tree = make_tree()
+        tree.add_command(make_group("config", "show", "reset"))
+        tree.add_command(make_command("admin"), guild=discord.Object(id=_FIRST_GUILD_ID))
+        await tree.sync_all()
+
+        group_id = tree.get_cached_app_command("config", None).id
+        assert tree.get_command_mention("config show") == f"</config show:{group_id}>"
+        #guilds fall back to global commands
+        assert tree.get_command_mention("config reset", _FIRST_GUILD_ID) == f"</config reset:{group_id}>"
+        admin_id = tree.get_cached_app_command("admin", _FIRST_GUILD_ID).id
+        assert tree.get_command_mention(tree.get_command("admin", guild=discord.Object(id=_FIRST_GUILD_ID)), _FIRST_GUILD_ID) == f"</admin:{admin_id}>"
+        assert tree.get_command_mention("admin") is None
+
+        tree.remove_command("config")
+        await tree.sync()
+        assert tree.get_command_mention("config show") is None
+
+    asyncio.run(run())
@@ -0,0 +1,158 @@
+import os
+import sys
+import types
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import aiosqlite
+
+from extensions.core.database import DatabaseCog, TransactionDeadlock
+
+
+_CASES_TABLE = """
+    CREATE TABLE IF NOT EXISTS "cases" (
+        "case_id"	INTEGER NOT NULL UNIQUE,
+        "type_id"	INTEGER NOT NULL,
+        "user_id"	INTEGER NOT NULL,
+        "mod_id"	INTEGER NOT NULL,
+        "flags"	INTEGER NOT NULL,
+        "timestamp"	REAL NOT NULL,
+        PRIMARY KEY("case_id" AUTOINCREMENT)
+    )
+"""
+
+
+
+def make_cog(data_dir: str, **config) -> DatabaseCog:
+    """Makes a DatabaseCog with a stand-in for the bot, which only has what the cog uses."""
+    bot = types.SimpleNamespace(
+        is_loaded=False,
+        is_quitting=False,
+        remove_appcommands_on_unload=False,
+        avoid_appcommand_deletions=False,
+        extconfig={DatabaseCog.__module__: {"database_file": "test.db", **config}},
+        utils=types.SimpleNamespace(pathhelper=types.SimpleNamespace(in_data_dir=lambda path: os.path.join(data_dir, path))),
+        tree=types.SimpleNamespace(unregister_all_guilds_command=lambda command: None)
+    )
+    return DatabaseCog(bot)
+
+
+async def count_committed_cases(db: DatabaseCog, user_id: int) -> int:
+    """Counts rows through a separate connection, which only sees committed ones."""
+    async with aiosqlite.connect(db.db_path) as connection:
+        async with connection.execute("SELECT COUNT(*) FROM \"cases\" WHERE \"user_id\"=?", (user_id,)) as cursor:
+            return (await cursor.fetchone())[0]
+
+
+
+def test_row_queued_within_transaction_is_committed(tmp_path):
+    async def run():
+        db = make_cog(str(tmp_path), insert_batch_ms=1)
+        await db.cog_load()
+        await db.execute(_CASES_TABLE)
+
+        async with db.transaction():
+            await db.insert("cases", type_id=1, user_id=1, mod_id=2, flags=0, timestamp=0.0)
+            future = db.queue_insert("cases", type_id=1, user_id=2, mod_id=2, flags=0, timestamp=0.0)
+        rowid = await future
+
+        assert rowid == 2
+        assert not db._db.in_transaction
+        assert await count_committed_cases(db, 2) == 1
+
+        #a later failing transaction doesn't take the queued row with it
+        try:
+            async with db.transaction():
+                await db.insert("cases", type_id=1, user_id=3, mod_id=2, flags=0, timestamp=0.0)
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        assert await count_committed_cases(db, 2) == 1
+        assert await count_committed_cases(db, 3) == 0
+        await db.cog_unload()
+
+    asyncio.run(run())
+
+
+def test_task_started_within_transaction_runs_its_own(tmp_path):
+    async def run():
+        db = make_cog(str(tmp_path))
+        await db.cog_load()
+        await db.execute(_CASES_TABLE)
+
+        try:
+            async with db.transaction():
+                await db.insert("cases", type_id=1, user_id=1, mod_id=2, flags=0, timestamp=0.0)
+                task = asyncio.create_task(db.insert("cases", type_id=1, user_id=2, mod_id=2, flags=0, timestamp=0.0))
+                await asyncio.sleep(0.01)
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        await task
+
+        assert await count_committed_cases(db, 1) == 0
+        assert await count_committed_cases(db, 2) == 1
+        await db.cog_unload()
+
+    asyncio.run(run())
+
+
+def test_waiting_for_writers_within_transaction_raises(tmp_path):
+    async def run():
+        db = make_cog(str(tmp_path), insert_batch_ms=1)
+        await db.cog_load()
+        await db.execute(_CASES_TABLE)
+
+        try:
+            async with db.transaction():
+                await db.insert("cases", type_id=1, user_id=1, mod_id=2, flags=0, timestamp=0.0)
+                await db.queue_insert("cases", type_id=1, user_id=2, mod_id=2, flags=0, timestamp=0.0)
+        except TransactionDeadlock:
+            pass
+        else:
+            assert False, "awaiting a queued row within a transaction finished"
+
+        try:
+            async with db.transaction():
+                await asyncio.create_task(db.insert("cases", type_id=1, user_id=3, mod_id=2, flags=0, timestamp=0.0))
+        except TransactionDeadlock:
+            pass
+        else:
+            assert False, "awaiting a writing task within a transaction finished"
+
+        #neither transaction was committed, but the queued row still gets inserted on its own
+        await db.flush_inserts()
+        assert await count_committed_cases(db, 1) == 0
+        assert await count_committed_cases(db, 2) == 1
+        assert await count_committed_cases(db, 3) == 0
+        await db.cog_unload()
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+
+
+def test_queued_rows_get_their_own_ids(tmp_path):
+    async def run():
+        db = make_cog(str(tmp_path))
+        await db.cog_load()
+        await db.execute(_CASES_TABLE)
+        #escalated cases insert a follow-up case, which takes the next ID in the middle of the batch
+        await db.execute("""
+            CREATE TRIGGER "follow_up" AFTER INSERT ON "cases" WHEN NEW."type_id" = 2 BEGIN
+                INSERT INTO "cases" ("type_id", "user_id", "mod_id", "flags", "timestamp") VALUES (3, NEW."user_id", NEW."mod_id", 0, 0.0);
+            END
+        """)
+        await db.execute("CREATE TABLE \"settings\" (\"name\" TEXT PRIMARY KEY, \"value\" TEXT) WITHOUT ROWID")
+
+        futures = [db.queue_insert("cases", type_id=type_id, user_id=1, mod_id=2, flags=0, timestamp=0.0) for type_id in (1, 2, 1)]
+        settings = [db.queue_insert("settings", name=f"setting {i}", value="on") for i in range(3)]
+        await db.flush_inserts()
+
+        assert [await future for future in futures] == [1, 2, 4]
+        assert (await db.fetch_row_by_id("cases", 3))["type_id"] == 3
+        assert [await future for future in settings] == [None, None, None]
+        assert await db.fetch_row_count("settings") == 3
+        assert db.failed_insert_flushes == 0
+        await db.cog_unload()
+
+    asyncio.run(run())
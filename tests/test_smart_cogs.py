@@ -0,0 +1,101 @@
+import os
+import sys
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from smart_command_tree import SmartCommandTree
+from smart_cogs import SmartCog, for_all_guilds, indexed_autocomplete
+from fake_discord_http import FakeDiscordHTTP
+
+
+_FIRST_GUILD_ID = 100000000000000000
+
+
+
+class TemplateCog(SmartCog):
+    @for_all_guilds
+    @app_commands.command(name="server", description="Server command")
+    async def server(self, interaction: discord.Interaction):
+        pass
+
+    @app_commands.command(name="ping", description="Global command")
+    async def ping(self, interaction: discord.Interaction):
+        pass
+
+
+
+class AutocompleteCog(SmartCog):
+    @indexed_autocomplete()
+    def fruit_autocomplete(self):
+        """All fruits."""
+        return ["Apple", "Banana", "Green apple"]
+
+    @app_commands.command(name="fruit", description="Picks a fruit")
+    @app_commands.autocomplete(fruit=fruit_autocomplete)
+    async def fruit(self, interaction: discord.Interaction, fruit: str):
+        pass
+
+
+
+def make_bot(guild_count: int = 3) -> commands.Bot:
+    """Makes an offline bot with the given amount of guilds, whose SmartCommandTree sends requests to a FakeDiscordHTTP.
+    Has only the attributes of SmartBot which SmartCog uses, with app commands removed on unload."""
+    bot = commands.Bot(command_prefix="!", intents=discord.Intents.none(), tree_cls=SmartCommandTree)
+    bot.is_loaded = False
+    bot.is_quitting = False
+    bot.autosync_appcommands = False
+    bot.remove_appcommands_on_unload = True
+    bot.avoid_appcommand_deletions = False
+    bot.main_server_id = _FIRST_GUILD_ID
+    bot.tree._http = FakeDiscordHTTP(latency=0.0)
+    bot.tree.sync_debounce_delay = 0.0
+    state = bot._connection
+    state.application_id = bot.tree._http.application_id
+    for i in range(guild_count):
+        state._add_guild(discord.Guild(data={"id": str(_FIRST_GUILD_ID + i), "name": f"guild {i}"}, state=state))
+    return bot
+
+
+
+def test_unloading_cog_removes_its_templates_from_every_guild():
+    async def run():
+        bot = make_bot()
+        http = bot.tree._http
+        await bot.add_cog(TemplateCog(bot))
+        await bot.tree.sync_all()
+        assert all(("server" in (cmd[1] for cmd in http.commands[_FIRST_GUILD_ID + i])) for i in range(3))
+
+        bot.is_loaded = True
+        http.reset_stats()
+        await bot.remove_cog("TemplateCog")
+        await bot.tree.flush_scheduled_syncs()
+
+        assert http.requests["bulk_upsert_commands"] == 4
+        for i in range(3):
+            assert not http.commands[_FIRST_GUILD_ID + i]
+        assert not http.commands[None]
+
+    asyncio.run(run())
+
+
+def test_indexed_autocomplete_registers_on_app_commands():
+    async def run():
+        bot = make_bot()
+        cog = AutocompleteCog(bot)
+        await bot.add_cog(cog)
+        callback = AutocompleteCog.fruit_autocomplete
+        assert callback.__name__ == "fruit_autocomplete" and callback.__doc__ == "All fruits."
+        assert not hasattr(callback, "__wrapped__")
+
+        autocomplete = cog.fruit._params["fruit"].autocomplete
+        choices = await autocomplete(cog, None, "app")
+        assert [choice.name for choice in choices] == ["Apple", "Green apple"]
+        assert list(cog.get_autocomplete_sources()) == ["fruit_autocomplete"]
+
+    asyncio.run(run())